@@ -0,0 +1,116 @@
+from collections import deque
+
+
+class Action:
+    # Base class for something a player does over a number of game ticks, e.g. repeatedly chopping a tree
+    # Actions are queued per player in the ActionScheduler below, which steps the action at the front of each queue
+    # once every game tick
+    # Every action has a `step()` method, doing one tick's worth of the action and returning an outcome dictionary,
+    # which like other interactions in the game has a 'success' and 'message', and also a 'finished' flag to say if
+    # the action is over and the next queued action should start
+    pass
+
+
+class GatherAction(Action):
+    # Repeatedly interact with a tree/rock, one attempt per tick, until the inventory is full, the tree/rock is
+    # depleted, or we're unable to interact for some other reason (e.g. no tool we can use)
+    # The scheduler's owner cancels it if the player moves
+    # If given session metrics, each attempt is recorded in them as a resource gathered or a miss
+
+    def __init__(self, interactable, inventory, skills, metrics=None):
+
+        self.interactable = interactable
+        self.inventory = inventory
+        self.skills = skills
+        self.metrics = metrics
+
+    def step(self):
+
+        outcome = self.interactable.interact(self.inventory, self.skills)
+
+        # Attempts that were made have the skill used in the outcome (no attempt is made if we couldn't interact)
+        if self.metrics is not None and 'skill' in outcome:
+            if outcome['success']:
+                self.metrics.record_gathered(outcome['skill'])
+            else:
+                self.metrics.record_missed(outcome['skill'])
+
+        return outcome
+
+
+class CraftAction(Action):
+    # Use a tool on up to `amount` resources of one type in the inventory, one resource per tick
+    # (e.g. lighting a whole inventory of logs with a tinderbox), until we run out or the tool can't be used
+
+    def __init__(self, inventory, tool, resource_type, amount):
+
+        self.inventory = inventory
+        self.tool = tool
+        self.resource_type = resource_type
+        self.remaining = amount
+
+    def step(self):
+
+        result = self.inventory.use_tool_on_resources(self.tool, self.resource_type, 1)
+
+        if not result['success']:
+            return {'success': False, 'finished': True, 'message': result['message']}
+
+        self.remaining -= 1
+
+        return {'success': True, 'finished': self.remaining == 0, 'message': ""}
+
+
+class ActionScheduler:
+    # Holds a queue of actions for each player, and processes every player's current action in one pass per game tick
+    # Players are identified by any hashable key
+    # This doesn't depend on Qt, so the same scheduler can run the actions of all players in a headless game
+
+    def __init__(self):
+
+        # Mapping from player key to a queue of actions, with the current action at the front
+        # Players with no actions left are removed
+        self.queues = {}
+
+    def start(self, player, action):
+        # Replace whatever the player was doing with a new action (e.g. clicking a different tree)
+
+        self.queues[player] = deque([action])
+
+    def queue(self, player, action):
+        # Add an action to do after the player's current ones
+
+        if player not in self.queues:
+            self.queues[player] = deque()
+        self.queues[player].append(action)
+
+    def cancel(self, player):
+        # Stop everything the player was doing (e.g. they moved)
+
+        self.queues.pop(player, None)
+
+    def current_action(self, player):
+
+        if player in self.queues:
+            return self.queues[player][0]
+
+    def tick(self):
+        # Slot for the game timer: step every player's current action once, and move on to the next action in
+        # their queue if it's finished
+
+        for player in list(self.queues):
+
+            # The player's queue may have been cancelled or replaced by an earlier player's action this tick
+            if player not in self.queues:
+                continue
+
+            queue = self.queues[player]
+            action = queue[0]
+
+            outcome = action.step()
+
+            # Only pop the action if stepping it didn't already cancel or replace the player's queue
+            if outcome['finished'] and self.queues.get(player) is queue and queue and queue[0] is action:
+                queue.popleft()
+                if not queue:
+                    del self.queues[player]
@@ -1,15 +1,19 @@
+import bisect
 from PyQt5.QtGui import QPixmap
 from items import concrete_types
 from utilities import generate_label
 from PyQt5.QtCore import Qt, QSize, pyqtSignal
 from PyQt5.QtWidgets import QWidget, QLabel, QGridLayout, QVBoxLayout, QHBoxLayout, QPushButton, QMenu, QAction
+from PyQt5.QtWidgets import QComboBox, QCheckBox
 
 
 class BankSlot(QWidget):
     # Represents a slot in the bank's 10 x 10 item grid (one slot out of the 100 slots) - very similar code to ShopSlot
-    # BankSlot is a wrapper around a collection of instantiated items, all the same type, stored in the bank
-    # If there are no items in the collection, it's effectively an empty slot placeholder and has no visual display
-    # BankSlot's alternative between empty placeholder and item collections as we add/remove items to/from the bank
+    # BankSlot is a view onto one slot of the bank's storage model (`BankStorage`): it displays the item type and how
+    # many of it are stored at its index, but the items themselves live in the model
+    # If nothing is stored at the slot's index, it's effectively an empty slot placeholder and has no visual display
+    # Once added to the bank's grid a slot widget never moves - sorting moves the stored items around in the model,
+    # and we only re-draw the slots whose contents changed
 
     slot_clicked = pyqtSignal(int, type)  # number to withdraw x type of item withdrawing
 
@@ -25,11 +29,11 @@ class BankSlot(QWidget):
 
         self.setFixedSize(QSize(self.slot_width, self.slot_height))
 
-        # `self.items` and `self.item_type` either:
-        # - an empty list and None if no items being stored here: empty placeholder
-        # - a list of the item instances and the concrete type of item objects in the list (guaranteed to all be same)
-        self.items = []
+        # `self.item_type` and `self.quantity` either:
+        # - None and 0 if no items being stored here: empty placeholder
+        # - the concrete type of the items stored at this slot's index in the model, and how many are stored
         self.item_type = None
+        self.quantity = 0
 
         # A bank slot is visually represented by the item's image, with the title and how many are stored below
         slot_layout = QVBoxLayout()
@@ -58,25 +62,19 @@ class BankSlot(QWidget):
 
     def update_text_label(self):
         # Update QLabel visually representing the item's title and the number of items stored in bank
-        # Need to update whenever:
-        # - all items of the type removed, so now it's an empty placeholder
-        # - some items added so it's no longer empty: set to the title and how many now in bank
-        # - some more items were added and it was non-empty to begin with: update how many in bank
 
-        if len(self.items) == 0:
+        if self.quantity == 0:
             # Empty, remove text
             self.text_label.setText("")
 
         else:
             # Not empty, so include text: item title x amount in bank
-            self.text_label.setText("%s x %s" % (self.item_type.title, len(self.items)))
+            self.text_label.setText("%s x %s" % (self.item_type.title, self.quantity))
 
     def update_item_image(self):
-        # Only call this method when we want to change the image, i.e.
-        # empty -> non-empty (so add image): when adding items
-        # non-empty -> empty (so remove image): when removing items
+        # Only call this method when we want to change the image, i.e. the item type displayed changed
 
-        if len(self.items) == 0:
+        if self.quantity == 0:
             # Now empty, remove image
             self.item_image.clear()
 
@@ -90,62 +88,25 @@ class BankSlot(QWidget):
     def is_empty_slot(self):
         # Is the slot not storing any items i.e. is it an empty placeholder slot in bank
 
-        return len(self.items) == 0
+        return self.quantity == 0
 
-    def add_items(self, new_items):
-        # Add items to the bank slot, whether it was empty before or not empty
-        # If it was not empty, we assume (and check) all the items being added are the same type as those already stored
+    def set_contents(self, item_type, quantity):
+        # Re-draw the slot to display what is now stored at its index in the bank storage model
+        # Only create a new QPixmap if the item type displayed changed, not just the amount stored
 
-        assert len(new_items) > 0
+        type_changed = item_type != self.item_type
 
-        if len(self.items) == 0:
-            # Was empty, now need to make it not empty
+        self.item_type = item_type
+        self.quantity = quantity
 
-            self.items.extend(new_items)
-            self.item_type = type(self.items[0])
-
-            # Only add an image if there wasn't something here before to save creating new QPixmaps constantly
+        if type_changed:
             self.update_item_image()
 
-        else:
-            # Already items here, add to collection
-
-            self.items.extend(new_items)
-
-        # Update text in both cases, empty -> non-empty and non-empty -> non-empty
         self.update_text_label()
 
-        # Check all the item types in this slot's item collection are the same after adding new items
-        assert all(type(self.items[i]) == self.item_type for i in range(len(self.items)))
-
-    def remove_items(self, amount):
-        # This function is called from Bank.withdraw_from(), and it will only request an amount that is never more
-        # than what is in the bank slot.
-        # This is because withdrawn_from() is emitted to when we right-click withdraw from a non-empty bank slot
-        # and the options for withdrawing (e.g. withdraw 1, 5, etc.) are dynamically presented on a right-click,
-        # based on how many is in the slot
-        # (actual amount passed in is what was requested, but capped at inventory space if not space for full amount)
-
-        assert 0 < amount <= len(self.items)
-        assert len(self.items) > 0
-
-        removed_items = self.items[:amount]
-        self.items = self.items[amount:]
-
-        if len(self.items) == 0:
-            # If no more items, make sure to set item type of bank slot to None
-            # Only update image if we removed it, otherwise it would be the same and creating new QPixmaps constantly
-            self.item_type = None
-            self.update_item_image()
-
-        # Update text label in both cases: non-empty -> empty and non-empty -> non-empty
-        self.update_text_label()
-
-        return removed_items
-
     def contextMenuEvent(self, e):
 
-        if len(self.items) > 0:
+        if self.quantity > 0:
             # Only want to present right-click menu on bank slots that actually have items
             # Only add the actions we have the number of items for, e.g. don't add 'withdraw 10' if we only have 5 items
 
@@ -154,13 +115,13 @@ class BankSlot(QWidget):
             context = QMenu(self)
             context.addAction(self.withdraw_one_action)
 
-            if len(self.items) >= 5:
+            if self.quantity >= 5:
                 context.addAction(self.withdraw_five_action)
 
-            if len(self.items) >= 10:
+            if self.quantity >= 10:
                 context.addAction(self.withdraw_ten_action)
 
-            if len(self.items) >= 2:
+            if self.quantity >= 2:
                 context.addAction(self.withdraw_all_action)
 
             context.exec_(e.globalPos())
@@ -170,7 +131,7 @@ class BankSlot(QWidget):
 
         self.status_bar_signal.emit("")
 
-        if e.button() == Qt.LeftButton and len(self.items) > 0:
+        if e.button() == Qt.LeftButton and self.quantity > 0:
             self.withdraw_one_clicked()
 
         e.ignore()
@@ -189,24 +150,239 @@ class BankSlot(QWidget):
 
     def withdraw_all_clicked(self):
 
-        self.slot_clicked.emit(len(self.items), self.item_type)
+        self.slot_clicked.emit(self.quantity, self.item_type)
+
+
+# Keys the bank can be sorted by, mapping from the name displayed in the bank's sort drop-down to a function
+# taking an item type and how many of it are stored, and returning the value to sort that slot on (ascending)
+# Every key falls back on the item type's precomputed sort rank (its order in `items.concrete_types`),
+# so no two stored item types ever compare equal and the order is always well-defined
+sort_keys = {
+    'type': lambda item_type, quantity: (item_type.sort_rank,),
+    'value': lambda item_type, quantity: (-item_type.sell_price, item_type.sort_rank),
+    'quantity': lambda item_type, quantity: (-quantity, item_type.sort_rank)
+}
+
+
+class BankStorage:
+    # The storage model behind the bank display: which item type is stored in each of the bank's slots, and the items
+    # There is one instance shared across the game, which outlives any widget displaying it
+    # Slot contents are two parallel lists indexed by slot: `self.item_types` (None for an empty slot) and
+    # `self.items` (the stored item instances, all of the same type), with a reverse mapping from item type to slot
+    # index so finding an item type's slot is a dictionary lookup rather than a scan of the whole bank
+    # Every method that changes the contents of slots returns the list of slot indexes that changed,
+    # so the bank display only needs to re-draw those slots
+    # If `keep_sorted` is set, the stored item types are kept packed at the front of the bank in sorted order
+    # as items are deposited and withdrawn, by moving single entries into place rather than re-sorting everything
+    # While it is, `self.sorted_keys` holds the sort key of each stored slot in slot order, updated alongside the
+    # slots, so finding where an entry goes is a binary search without re-computing every other entry's key
+
+    def __init__(self, limit):
+
+        self.limit = limit
+
+        self.item_types = [None for i in range(self.limit)]
+        self.items = [[] for i in range(self.limit)]
+        self.type_to_index = {}
+
+        self.sort_key = 'type'
+        self.keep_sorted = False
+        self.sorted_keys = []
+
+    def quantity(self, index):
+
+        return len(self.items[index])
+
+    def entry_key(self, index):
+        # Value to sort the (non-empty) slot at `index` on, using the current sort key
+
+        return sort_keys[self.sort_key](self.item_types[index], len(self.items[index]))
+
+    def find_item_type_index(self, item_type):
+        # Slot index holding items of this concrete type, or None if none stored
+        # There will only ever be one slot for a given item type
+
+        return self.type_to_index.get(item_type)
+
+    def find_first_empty_index(self):
+        # Searches the slots row by row until we find the first empty one, returning None if the bank is full of types
+
+        if len(self.type_to_index) == self.limit:
+            return None
+
+        if self.keep_sorted:
+            # Stored item types are packed at the front, so the first empty slot is straight after them
+            return len(self.type_to_index)
+
+        return self.item_types.index(None)
+
+    def space_for(self, item_type):
+        # There is space for an item type if either:
+        # 1) there is already a slot holding this item type, in which case we can extend the items there
+        # 2) if not, then there is at least one empty slot, where we can start storing the items
+
+        if self.find_item_type_index(item_type) is not None:
+            return True
+
+        return self.find_first_empty_index() is not None
+
+    def restore(self, entries):
+        # Replace the contents with saved ones (e.g. loading a saved game), each given as (index, item type, quantity),
+        # putting each type straight into its saved slot rather than depositing into the first empty slot
+
+        self.item_types = [None for i in range(self.limit)]
+        self.items = [[] for i in range(self.limit)]
+        self.type_to_index = {}
+
+        for index, item_type, quantity in entries:
+
+            assert self.item_types[index] is None and item_type not in self.type_to_index
+            assert item_type in concrete_types and quantity > 0
+
+            self.item_types[index] = item_type
+            self.items[index] = [item_type() for i in range(quantity)]
+            self.type_to_index[item_type] = index
+
+        # Saved slots may not be in order (e.g. saved with the bank unsorted), so put them in order if keeping it sorted
+        if self.keep_sorted:
+            self.sort()
+
+    def deposit(self, items_to_deposit):
+        # Takes a non-empty list of items, all of the same concrete type, that we know there is space for
+        # - If already items of the same type in bank, add to that slot
+        # - Otherwise, add to the first empty slot (then move into sorted position if keeping the bank sorted)
+
+        assert len(items_to_deposit) > 0
+        assert all(type(x) in concrete_types for x in items_to_deposit)
+
+        item_type_to_deposit = type(items_to_deposit[0])
+
+        assert all(type(items_to_deposit[i]) == item_type_to_deposit for i in range(len(items_to_deposit)))
+        assert self.space_for(item_type_to_deposit)
+
+        index = self.find_item_type_index(item_type_to_deposit)
+
+        if index is None:
+            index = self.find_first_empty_index()
+            self.item_types[index] = item_type_to_deposit
+            self.type_to_index[item_type_to_deposit] = index
+
+        self.items[index].extend(items_to_deposit)
+
+        if self.keep_sorted:
+            return self.reposition(index)
+
+        return [index]
+
+    def withdraw(self, amount, item_type_to_withdraw):
+        # Removes and returns `amount` items of the type, which is guaranteed to be stored and at least that many
+        # Returns the removed items, and the slot indexes that changed
+
+        index = self.find_item_type_index(item_type_to_withdraw)
+        assert index is not None
+        assert 0 < amount <= len(self.items[index])
+
+        withdrawn_items = self.items[index][:amount]
+        self.items[index] = self.items[index][amount:]
+
+        if self.keep_sorted:
+            return withdrawn_items, self.reposition(index)
+
+        if len(self.items[index]) == 0:
+            # Leave an empty placeholder slot behind
+            self.item_types[index] = None
+            del self.type_to_index[item_type_to_withdraw]
+
+        return withdrawn_items, [index]
+
+    def reposition(self, index):
+        # Used when keeping the bank sorted: move the entry at `index` to where it belongs in the sorted order of the
+        # stored types (which are packed at the front of the bank), shifting the entries in between along by one slot
+        # If the entry is now empty it is dropped, and the entries after it shift down one slot to close the gap
+        # The other entries are already in order, so we only binary search for the new position - no full re-sort
+        # Returns the range of slot indexes whose contents changed
+
+        item_type = self.item_types.pop(index)
+        items = self.items.pop(index)
+        del self.type_to_index[item_type]
+
+        # A newly stored type (just put in the first empty slot) doesn't have a key yet
+        if index < len(self.sorted_keys):
+            self.sorted_keys.pop(index)
+
+        number_stored = len(self.type_to_index)
+
+        if len(items) > 0:
+            key = sort_keys[self.sort_key](item_type, len(items))
+            new_index = bisect.bisect_right(self.sorted_keys, key)
+            self.sorted_keys.insert(new_index, key)
+            self.item_types.insert(new_index, item_type)
+            self.items.insert(new_index, items)
+
+        else:
+            # The slot where the last stored entry was is now the first empty slot
+            new_index = number_stored
+            self.item_types.append(None)
+            self.items.append([])
+
+        changed = list(range(min(index, new_index), max(index, new_index) + 1))
+
+        for i in changed:
+            if self.item_types[i] is not None:
+                self.type_to_index[self.item_types[i]] = i
+
+        return changed
+
+    def sort(self, sort_key=None):
+        # Re-order the stored items by the sort key (or the current one if not specified), e.g. by `items.concrete_types`
+        # order for 'type', which will sort items into tools, then logs, then ores, etc.
+        # All empty slots go at the end. Returns only the slot indexes whose contents moved
+
+        if sort_key is not None:
+            assert sort_key in sort_keys
+            self.sort_key = sort_key
+
+        stored_indexes = sorted(self.type_to_index.values(), key=self.entry_key)
+
+        item_types = [self.item_types[i] for i in stored_indexes] + [None] * (self.limit - len(stored_indexes))
+        items = [self.items[i] for i in stored_indexes] + [[] for i in range(self.limit - len(stored_indexes))]
+
+        changed = [i for i in range(self.limit) if item_types[i] != self.item_types[i]]
+
+        self.item_types = item_types
+        self.items = items
+        self.type_to_index = {self.item_types[i]: i for i in range(len(stored_indexes))}
+        self.sorted_keys = [self.entry_key(i) for i in range(len(stored_indexes))]
+
+        return changed
+
+    def set_keep_sorted(self, keep_sorted):
+        # Turning on keeping the bank sorted sorts it once, then every deposit/withdrawal keeps it in order
+
+        self.keep_sorted = keep_sorted
+
+        if self.keep_sorted:
+            return self.sort()
+
+        return []
 
 
 class Bank(QWidget):
     # A widget representing the bank interface, that will replace the main game map display when opened
     # It is opened by clicking on a bank chest tile in the game (if player is within 1 tile of it)
-    # There is one bank instance for the game, so different bank tiles interface to the same bank storage object `Bank`
-    # The bank is represented as a 10x10 grid, with each slot a BankSlot object, that is either an empty placeholder,
-    # or wraps a collection of non-zero items of the same type being stored
+    # There is one bank storage model for the game, so different bank tiles interface to the same `BankStorage`
+    # The bank is represented as a 10x10 grid of BankSlot objects, slot i displaying index i of the storage model,
+    # either as an empty placeholder, or the type and amount of items stored there
     # There is guaranteed to be only one bank slot for each item type
 
-    def __init__(self, inventory, status_bar_signal):
+    def __init__(self, storage, inventory, status_bar_signal):
 
         super().__init__()
 
         self.total_width = 1300
         self.total_height = 850
 
+        self.storage = storage
         self.inventory = inventory
         self.status_bar_signal = status_bar_signal
 
@@ -220,6 +396,8 @@ class Bank(QWidget):
         self.cols = 10
         self.bank_limit = self.rows * self.cols
 
+        assert self.storage.limit == self.bank_limit
+
         self.slot_width = int(self.total_width/self.cols)
         self.slot_height = int(self.grid_height/self.rows)
 
@@ -227,15 +405,19 @@ class Bank(QWidget):
         self.bank.setContentsMargins(10, 10, 10, 10)
         self.bank.setSpacing(2)
 
-        # Fill all the grid slots with empty BankSlot's
+        # Fill all the grid slots with BankSlot's, keeping a list of them indexed the same as the storage model
+        self.slots = []
+
         for i in range(self.bank_limit):
 
             col, row = i % 10, int(i/10)
-            empty_bank_slot = BankSlot(self.slot_width, self.slot_height, self.status_bar_signal)
-            empty_bank_slot.slot_clicked.connect(self.withdraw_from)
-            self.bank.addWidget(empty_bank_slot, row, col)
+            bank_slot = BankSlot(self.slot_width, self.slot_height, self.status_bar_signal)
+            bank_slot.slot_clicked.connect(self.withdraw_from)
+            self.bank.addWidget(bank_slot, row, col)
+            self.slots.append(bank_slot)
 
-        # Put bold 'BANK', a sort button, a deposit all button, and a close button above grid layout
+        # Put bold 'BANK', sorting controls, a deposit all button, and a close button above grid layout
+        # Sorting controls are a sort button, a drop-down of what to sort by, and whether to keep the bank sorted
 
         overall_layout = QVBoxLayout()
         overall_layout.setContentsMargins(5, 5, 5, 5)
@@ -250,13 +432,26 @@ class Bank(QWidget):
         self.sort_button.setFixedSize(QSize(100, self.text_height))
         self.sort_button.pressed.connect(self.sort)
 
+        self.sort_key_box = QComboBox()
+        self.sort_key_box.setFixedSize(QSize(100, self.text_height))
+        self.sort_key_box.addItems(list(sort_keys))
+        self.sort_key_box.setCurrentText(self.storage.sort_key)
+        self.sort_key_box.currentTextChanged.connect(self.sort_key_changed)
+
+        self.keep_sorted_box = QCheckBox("keep sorted")
+        self.keep_sorted_box.setFixedSize(QSize(100, self.text_height))
+        self.keep_sorted_box.setChecked(self.storage.keep_sorted)
+        self.keep_sorted_box.toggled.connect(self.keep_sorted_toggled)
+
         self.deposit_all_button = QPushButton("deposit all")
         self.deposit_all_button.setFixedSize(QSize(100, self.text_height))
         self.deposit_all_button.pressed.connect(self.inventory.deposit_all)
 
         top_layout.addWidget(self.sort_button)
+        top_layout.addWidget(self.sort_key_box)
+        top_layout.addWidget(self.keep_sorted_box)
         top_layout.addWidget(self.deposit_all_button)
-        top_layout.addWidget(generate_label("BANK", 30, w=800, h=self.text_height))
+        top_layout.addWidget(generate_label("BANK", 30, w=600, h=self.text_height))
         top_layout.addWidget(self.close_button)
 
         overall_layout.addLayout(top_layout)
@@ -264,119 +459,48 @@ class Bank(QWidget):
 
         self.setLayout(overall_layout)
 
-    def sort(self):
-        # Sort the bank, so we re-order all the widgets based on the ordering defined in `items.concrete_types`
-        # This will sort items into tools, then logs, then ores, etc. etc.
-        # All empty bank slots go at the end
-        # This function is the slot for the signal emitted when 'sort' button is pressed
-
-        # Go through all bank slots, remove from grid, and split into two lists: slots with items and empty slots
-        empty_widgets = []
-        non_empty_widgets = []
-
-        for i in range(self.bank_limit):
-
-            col, row = i % 10, int(i/10)
-
-            grid_item = self.bank.itemAtPosition(row, col)
-            grid_slot = grid_item.widget()
-
-            if len(grid_slot.items) == 0:
-                empty_widgets.append(grid_slot)
-            else:
-                non_empty_widgets.append(grid_slot)
-
-            self.bank.removeItem(grid_item)
+        # The storage model may already have items in it, so draw every slot once
+        self.redraw_slots(range(self.bank_limit))
 
-        # Sort the slots containing items into their predefined order defined by `concrete_types`, e.g. tools first
-        non_empty_widgets = sorted(non_empty_widgets, key=lambda x: concrete_types.index(x.item_type))
+    def redraw_slots(self, indexes):
+        # Re-draw only the bank slots at the given indexes to match the storage model
 
-        # Add empty widgets back to the end of the list, so total list is length of all bank slots (10 x 10)
-        sorted_widgets = non_empty_widgets + empty_widgets
+        for i in indexes:
+            self.slots[i].set_contents(self.storage.item_types[i], self.storage.quantity(i))
 
-        assert len(sorted_widgets) == self.bank_limit
-
-        # Add back to grid: sorted items first, then fill with remainder of empty slots after
-        for i in range(self.bank_limit):
-
-            col, row = i % 10, int(i/10)
-            self.bank.addWidget(sorted_widgets[i], row, col)
-
-    def find_item_type_slot(self, item_type):
-        # Searches all the slots to see if we have items of the type we are looking for stored in a slot
-        # Will only ever pass in concrete types, not abstract types, so check types equal, not isinstance()
-        # E.g. we will never find an generic 'Axe' type, only ever concrete 'Copper Axe' types
-        # There will only ever be one slot for a given item type, so we return the first slot we find
-        # Returns None if there is not a slot holding items of this type
-
-        for i in range(self.bank_limit):
-
-            col, row = i % 10, int(i/10)
-            slot = self.bank.itemAtPosition(row, col).widget()
-
-            if slot.item_type == item_type:
-                return slot
+    def sort(self):
+        # Sort the bank by the key selected in the drop-down, e.g. for 'type' the ordering defined in
+        # `items.concrete_types`, which will sort items into tools, then logs, then ores, etc. etc.
+        # All empty bank slots go at the end
+        # This function is the slot for the signal emitted when 'sort' button is pressed
+        # The slot widgets stay where they are in the grid, we only re-draw the ones whose contents moved
 
-        return None
+        self.redraw_slots(self.storage.sort(self.sort_key_box.currentText()))
 
-    def find_first_empty_slot(self):
-        # Searches the slots row by row until we find the first empty one (i.e. one with no items)
-        # If there is no empty slot in the grid, return None
+    def sort_key_changed(self, sort_key):
+        # If we are keeping the bank sorted, changing what we sort by needs to re-sort straight away
 
-        for i in range(self.bank_limit):
+        self.storage.sort_key = sort_key
 
-            col, row = i % 10, int(i/10)
-            slot = self.bank.itemAtPosition(row, col).widget()
+        if self.storage.keep_sorted:
+            self.redraw_slots(self.storage.sort())
 
-            if len(slot.items) == 0:
-                return slot
+    def keep_sorted_toggled(self, keep_sorted):
 
-        return None
+        self.redraw_slots(self.storage.set_keep_sorted(keep_sorted))
 
     def space_for(self, item_type):
-        # There is space for an item type if either:
-        # 1) there is already a slot in the grid holding this item type, in which case we can extend the items there
-        # 2) if not, then there is at least one empty slot, where we can convert to a non-empty slot holding the items
+        # There is space for an item type if there is already a slot holding this item type, or an empty slot
         # Just because each slot in the bank has items in it, does not mean it's full
-        # It's only full if there are no items of this type already where we can add to, *and* there are no empty slots
         # That's why `space_for` is parameterized by an item type
 
-        if self.find_item_type_slot(item_type) is not None:
-            return True
-
-        if self.find_first_empty_slot() is not None:
-            return True
-
-        return False
+        return self.storage.space_for(item_type)
 
     def deposit_to(self, items_to_deposit):
-        # Takes a non-empty list of items, and adds to the bank's grid
-        # - If already items of the same type in bank, add to that slot
-        # - Otherwise, add to the first empty slot
-        # We assume in this function we can deposit the items, i.e. there is space_for() the item types
-
-        # Check there is at least one item to deposit, all the items are concrete item types
-        assert len(items_to_deposit) > 0
-        assert all(type(x) in concrete_types for x in items_to_deposit)
-
-        # Get item type of items we're trying to deposit; check they're all the same type and there is a space for them
-        item_type_to_deposit = type(items_to_deposit[0])
-
-        assert all(type(items_to_deposit[i]) == item_type_to_deposit for i in range(len(items_to_deposit)))
-        assert self.space_for(item_type_to_deposit)
+        # Takes a non-empty list of items, all the same type, and adds to the bank's storage
+        # We assume in this function we can deposit the items, i.e. there is space_for() the item type
 
-        # Search all the slots to see if we already have a slot for items of this type
-        slot = self.find_item_type_slot(item_type_to_deposit)
-
-        if slot is None:
-            # Need to make a new item type slot in grid - find the first empty slot, and add there
-            # Guaranteed to be one as we checked for the space for above
-            empty_slot = self.find_first_empty_slot()
-            empty_slot.add_items(items_to_deposit)
-
-        else:
-            # We already have a bank slot for it, just add items to the slot
-            slot.add_items(items_to_deposit)
+        self.redraw_slots(self.storage.deposit(items_to_deposit))
 
     def withdraw_from(self, amount, item_type_to_withdraw):
         # Item type guaranteed to already be in bank because we will have right-clicked on it and emitted to this slot
@@ -387,9 +511,6 @@ class Bank(QWidget):
             self.status_bar_signal.emit("Inventory full - cannot withdraw any items")
             return
 
-        slot = self.find_item_type_slot(item_type_to_withdraw)
-        assert slot is not None
-
         # We only want to withdraw exactly the amount we can manage, which depends on two factors
         # - the amount we actually requested - this amount is guaranteed to be in bank because only way withdraw_from()
         #   is called is by emitting from a bank slot right click, and the right click options dynamically show up
@@ -401,7 +522,8 @@ class Bank(QWidget):
         ])
 
         # Do the transaction - remove from bank, add to inventory
-        withdrawn_items = slot.remove_items(amount_to_withdraw)
+        withdrawn_items, changed_indexes = self.storage.withdraw(amount_to_withdraw, item_type_to_withdraw)
+        self.redraw_slots(changed_indexes)
         self.inventory.add_to(withdrawn_items)
 
         self.status_bar_signal.emit("")
@@ -0,0 +1,228 @@
+import queue
+import threading
+
+# Bank storage as a service, for banks used by many players at once (see `sharded_server.py`)
+# Each account's bank contents are an immutable record with a version. A transaction (deposit or withdraw) runs
+# optimistically, on whichever thread calls it, without holding any lock: it reads the account's latest record, checks
+# the change can be made to it (there's a slot for a deposit, enough stored for a withdrawal), and asks for the change
+# to be committed against that version. The commit is a compare and swap: if the account is still at that version,
+# the next version goes in. If another transaction got there first, deposits and withdrawals commute, so the change is
+# made to the newer record instead as long as it still can be - only if it can't (the slot or the items are gone) is
+# it a conflict, and the transaction starts again from the newer record. So items can't be lost or duplicated by
+# transactions racing each other, many players banking in one account don't make each other retry, and transactions
+# on different accounts never wait for each other
+# Commits are batched: one committer thread takes every commit waiting, checks and swaps them in one go, and wakes
+# their transactions - with many transactions at once, each commits in a batch with the rest, rather than each
+# taking its turn with a lock
+
+# Accounts are named by strings. The game's bank is shared across the game, so the servers keep it as one account
+shared_account = 'shared'
+
+
+class AccountRecord:
+    # An account's bank contents at one version: `slots` is a tuple of (item title, quantity) or None for an empty slot,
+    # laid out like `BankStorage` - a type stays in its slot until none are left, and new types go in the first empty
+    # slot. Records are never changed once made
+
+    def __init__(self, account, version, slots):
+
+        self.account = account
+        self.version = version
+        self.slots = slots
+
+    def find(self, title):
+        # Slot index holding items of this title, or None
+
+        for index, slot in enumerate(self.slots):
+            if slot is not None and slot[0] == title:
+                return index
+
+    def quantity(self, title):
+
+        index = self.find(title)
+        return 0 if index is None else self.slots[index][1]
+
+    def state(self):
+        # The contents as `World.bank_state`: [index, title, quantity] for each slot in use
+
+        return [[index, slot[0], slot[1]] for index, slot in enumerate(self.slots) if slot is not None]
+
+    def changed(self, title, amount):
+        # The next version of the record with `amount` more (or fewer, if negative) of the title, or None if that
+        # can't be done: there's no slot for a new title, or not that many stored
+
+        slots = list(self.slots)
+        index = self.find(title)
+
+        if index is not None:
+            quantity = slots[index][1] + amount
+            if quantity < 0:
+                return None
+            slots[index] = None if quantity == 0 else (title, quantity)
+        elif amount > 0 and None in slots:
+            slots[slots.index(None)] = (title, amount)
+        else:
+            return None
+
+        return AccountRecord(self.account, self.version + 1, tuple(slots))
+
+
+class BankStore:
+    # The latest record of every account, in memory
+    # Only the committer thread writes, so reading never takes a lock: a record is swapped in whole, and records
+    # are never changed once made
+
+    def __init__(self, limit=100):
+
+        self.limit = limit
+        self.records = {}
+
+    def read(self, account):
+
+        record = self.records.get(account)
+
+        if record is None:
+            return AccountRecord(account, 0, (None,) * self.limit)
+
+        return record
+
+    def compare_and_swap(self, changes):
+        # Commit a batch of changes (see `PendingChange`), in order, each to the account's latest record - its record
+        # at the version the change was checked against, or a newer one the change can still be made to
+        # Returns the record each change committed, or None for a conflict, and how many changes were made to a newer
+        # record than they were checked against
+
+        records = []
+        rebased = 0
+
+        for change in changes:
+
+            current = self.read(change.account)
+            record = current.changed(change.title, change.amount)
+
+            if record is not None:
+                self.records[change.account] = record
+                rebased += current.version != change.version
+
+            records.append(record)
+
+        return records, rebased
+
+
+class PendingChange:
+    # A change to an account waiting to be committed - `amount` more (or fewer) of the title, checked against the
+    # account's record at `version` - and the transaction waiting on it
+
+    def __init__(self, account, version, title, amount):
+
+        self.account = account
+        self.version = version
+        self.title = title
+        self.amount = amount
+
+        self.done = threading.Event()
+        self.committed = False
+
+
+class BankService:
+    # Deposits and withdrawals of any account from any thread (see the top)
+    # `on_commit` is called on the committer thread with each batch of records committed, e.g. to tell players of the
+    # new contents
+
+    def __init__(self, store=None, maximum_batch=256, on_commit=None):
+
+        self.store = BankStore() if store is None else store
+        self.maximum_batch = maximum_batch
+        self.on_commit = on_commit
+
+        self.pending = queue.SimpleQueue()
+
+        # Counts of commits, the batches they were in, commits made to a newer record than they were checked against,
+        # and commits that couldn't be and were retried
+        self.commits = 0
+        self.batches = 0
+        self.rebased = 0
+        self.conflicts = 0
+
+        self.committer = threading.Thread(target=self.run_commits, daemon=True)
+        self.committer.start()
+
+    def stop(self):
+
+        self.pending.put(None)
+        self.committer.join()
+
+    def run_commits(self):
+
+        while True:
+
+            batch = [self.pending.get()]
+
+            while len(batch) < self.maximum_batch:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = None in batch
+            batch = [pending for pending in batch if pending is not None]
+
+            records, rebased = self.store.compare_and_swap(batch)
+            committed = [record for record in records if record is not None]
+
+            self.batches += 1
+            self.commits += len(committed)
+            self.rebased += rebased
+            self.conflicts += len(records) - len(committed)
+
+            if self.on_commit is not None and committed:
+                self.on_commit(committed)
+
+            for pending, record in zip(batch, records):
+                pending.committed = record is not None
+                pending.done.set()
+
+            if stopping:
+                break
+
+    def commit(self, record, title, amount):
+        # Wait for the change, checked against the record, to go in with the next batch, returning if it did
+
+        pending = PendingChange(record.account, record.version, title, amount)
+        self.pending.put(pending)
+        pending.done.wait()
+
+        return pending.committed
+
+    def deposit(self, account, title, amount):
+        # Deposit `amount` of the item. Returns how many were deposited (all or none), and a message if none were
+
+        while True:
+
+            record = self.store.read(account)
+
+            if record.changed(title, amount) is None:
+                return 0, "No space in the bank for %ss" % title
+
+            if self.commit(record, title, amount):
+                return amount, None
+
+    def withdraw(self, account, title, amount):
+        # Withdraw up to `amount` of the item. Returns how many were withdrawn, and a message if none were
+
+        while True:
+
+            record = self.store.read(account)
+            amount_stored = record.quantity(title)
+
+            if amount_stored == 0:
+                return 0, "No %ss in the bank" % title
+
+            withdrawn = min(amount, amount_stored)
+
+            if self.commit(record, title, -withdrawn):
+                return withdrawn, None
+
+    def state(self, account):
+
+        return self.store.read(account).state()
@@ -0,0 +1,140 @@
+import json
+import time
+import random
+import argparse
+from world import World, directions
+from server import GameServer, ClientConnection
+from protocol import split_frames, decode_snapshot, FRAME_SNAPSHOT
+
+# Benchmark of the multiplayer protocol (see `protocol.py`), without sockets
+# Runs the server's world with a number of bots walking about at random, flushing snapshots to them like the server
+# does, and reports the bytes sent per client per game tick and how long flushing (building and encoding every
+# client's snapshot) takes per game tick
+# Each bot decodes its frames like the client, and acknowledges them some flushes later, as a round trip would
+# E.g. `python benchmark_protocol.py --players 100 --ticks 60`
+
+
+class BenchmarkWriter:
+    # Stands in for a connection's stream writer, keeping what's written for the bot to read
+
+    class Transport:
+
+        def get_write_buffer_size(self):
+            return 0
+
+    def __init__(self):
+
+        self.transport = BenchmarkWriter.Transport()
+        self.received = bytearray()
+
+    def write(self, data):
+
+        self.received.extend(data)
+
+    def close(self):
+        pass
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark bytes and encode time per tick of the multiplayer protocol")
+    parser.add_argument('--players', type=int, default=100)
+    parser.add_argument('--ticks', type=int, default=60, help="game ticks to run")
+    parser.add_argument('--flushes-per-tick', type=int, default=20)
+    parser.add_argument('--move-chance', type=float, default=0.3, help="chance a bot moves each flush")
+    parser.add_argument('--ack-delay', type=int, default=2, help="flushes before a bot's acknowledgement arrives")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+
+    server = GameServer(World())
+    world = server.world
+
+    surface = world.maps['surface']
+    for i in range(args.players):
+        player = world.add_player('bot%s' % i, 'surface', random.randrange(surface.map_cols), random.randrange(surface.map_rows))
+        server.clients[player.id] = ClientConnection(player, BenchmarkWriter())
+
+    # Each bot's snapshots by seq (like the client), and acknowledgements waiting to arrive: (flush due, client, seq)
+    bot_snapshots = {player_id: {} for player_id in server.clients}
+    acks = []
+
+    flush_seconds = 0
+    snapshot_frames = 0
+    snapshot_bytes = 0
+    keyframes = 0
+    keyframe_bytes = 0
+    json_bytes = 0
+    total_bytes = 0
+
+    flush = 0
+    for tick in range(args.ticks):
+
+        world.tick()
+        server.action_scheduler.tick()
+
+        for i in range(args.flushes_per_tick):
+
+            flush += 1
+
+            for client in server.clients.values():
+                if random.random() < args.move_chance:
+                    world.move(client.player, random.choice(list(directions)))
+
+            while acks and acks[0][0] <= flush:
+                due, client, seq = acks.pop(0)
+                client.acknowledge(seq)
+
+            start = time.perf_counter()
+            server.flush()
+            flush_seconds += time.perf_counter() - start
+
+            for client in server.clients.values():
+
+                total_bytes += len(client.writer.received)
+                frames_length = len(client.writer.received)
+
+                for kind, payload in split_frames(client.writer.received):
+
+                    if kind != FRAME_SNAPSHOT:
+                        continue
+
+                    seq, baseline_seq, frame_tick, snapshot = decode_snapshot(payload, bot_snapshots[client.player.id])
+                    bot_snapshots[client.player.id][seq] = snapshot
+                    acks.append((flush + args.ack_delay, client, seq))
+
+                    assert snapshot.same_as(client.snapshots[seq])
+
+                    snapshot_frames += 1
+                    snapshot_bytes += len(payload) + 2
+                    if baseline_seq == 0:
+                        keyframes += 1
+                        keyframe_bytes += len(payload) + 2
+
+                    # For comparison, the same snapshot whole as JSON
+                    json_bytes += len(json.dumps([
+                        list(snapshot.entities.items()), sorted(snapshot.depleted), snapshot.inventory, snapshot.gold,
+                        snapshot.experience, list(snapshot.shop.items())
+                    ], separators=(',', ':')))
+
+                assert frames_length > 0 or not client.writer.received
+
+    players = len(server.clients)
+
+    print("%s players, %s game ticks, %s flushes a tick" % (players, args.ticks, args.flushes_per_tick))
+    print("Bytes per client per tick:      %.1f" % (total_bytes / players / args.ticks))
+    print("Snapshots sent:                 %s (%s keyframes)" % (snapshot_frames, keyframes))
+    print("Bytes per snapshot:             %.1f (keyframe %.1f, delta %.1f)" % (
+        snapshot_bytes / max(1, snapshot_frames),
+        keyframe_bytes / max(1, keyframes),
+        (snapshot_bytes - keyframe_bytes) / max(1, snapshot_frames - keyframes)
+    ))
+    print("Bytes per snapshot whole, JSON: %.1f" % (json_bytes / max(1, snapshot_frames)))
+    print("Flush time per tick:            %.0f us (%.1f us per client)" % (
+        1e6 * flush_seconds / args.ticks, 1e6 * flush_seconds / args.ticks / players
+    ))
+
+
+if __name__ == '__main__':
+    main()
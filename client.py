@@ -0,0 +1,483 @@
+import os
+import sys
+import json
+import argparse
+from functools import partial
+from status_bar import StatusBar
+from tables import level_for_experience
+from utilities import generate_label, window_range
+from tiles import code_to_feature, NPC, Interactable
+from protocol import encode, split_frames, decode_snapshot, FRAME_MESSAGE, FRAME_SNAPSHOT
+from protocol import entity_types, item_types, skill_titles
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtNetwork import QTcpSocket
+from PyQt5.QtCore import Qt, QSize, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QLabel, QGridLayout, QHBoxLayout, QVBoxLayout
+from PyQt5.QtWidgets import QListWidget
+
+# Thin client for a multiplayer game server (see `server.py`)
+# Unlike the single player game, it holds no game logic of its own: it draws the window around the player from the
+# state the server sends, and sends intents to the server for every key press and click
+# The one exception is moving: waiting a round trip to the server to see a move would make moving feel laggy, so the
+# client moves the player straight away if the tile looks empty, and corrects itself when the server's snapshots
+# show where the player actually is (see `ThinClient.predict`)
+# E.g. `python client.py --host localhost --port 8765 --name alice`
+# - arrow keys move, and clicking a tile next to the player interacts with it (gathers, opens a shop/bank, transports)
+# - with a shop open, double-click its stock to buy one, or an inventory item to sell one
+# - with the bank open, double-click its contents to withdraw one, or an inventory item to deposit one
+# - otherwise click a tool in the inventory, then double-click a log to use the tool on it
+
+# Arrow keys, and the direction and (dx, dy) of the move they make
+key_to_move = {
+    Qt.Key_Up: ('up', 0, -1),
+    Qt.Key_Down: ('down', 0, 1),
+    Qt.Key_Left: ('left', -1, 0),
+    Qt.Key_Right: ('right', 1, 0)
+}
+
+class RemoteTile(QLabel):
+    # One cell of the client's window onto the map. It shows whatever is at the absolute map coordinates (x, y),
+    # which change as the window moves
+
+    clicked = pyqtSignal(int, int)
+
+    def __init__(self, tile_width, tile_height, background_color):
+
+        super().__init__()
+
+        self.x, self.y = None, None
+        self.setFixedSize(QSize(tile_width, tile_height))
+        self.setAlignment(Qt.AlignCenter)
+        self.setStyleSheet("background-color: %s;" % background_color)
+
+    def mouseReleaseEvent(self, e):
+
+        if e.button() == Qt.LeftButton and self.x is not None:
+            self.clicked.emit(self.x, self.y)
+
+        e.ignore()
+
+
+class RemoteMap(QWidget):
+    # The client's copy of the map the player is on: the static tiles from the map's json (the same file the server
+    # loads), and the entities and depleted trees/rocks around the player from the server's latest snapshot
+    # Displays a window around the player, like the game's `Map`, but with a fixed grid of labels whose pixmaps change
+
+    tile_clicked = pyqtSignal(int, int)
+
+    def __init__(self):
+
+        super().__init__()
+
+        self.width = 1300
+        self.height = 850
+        self.setFixedSize(QSize(self.width, self.height))
+
+        self.player_window = QGridLayout()
+        self.player_window.setContentsMargins(20, 20, 20, 20)
+        self.player_window.setSpacing(2)
+        self.setLayout(self.player_window)
+
+        self.map_name = None
+        self.window_labels = []
+
+        # Scaled pixmaps by icon path, shared by every cell
+        self.pixmaps = {}
+
+        # Id of our own player's entity
+        self.player_id = None
+
+        self.entities = {}    # id -> (entity type code, x, y)
+        self.occupant = {}    # (x, y) -> entity type code, for every entity but our player
+        self.depleted = frozenset()
+
+        # Where our player is shown: where the server last said they were, plus the moves since predicted
+        self.predicted_position = None
+
+    def load_map(self, map_name):
+        # The player is now on the map - load its static tiles (its entities come in the next snapshot)
+
+        self.entities = {}
+        self.occupant = {}
+        self.depleted = frozenset()
+        self.predicted_position = None
+
+        with open(os.path.join('maps', map_name + '.json')) as f:
+            loaded_map = json.load(f)
+
+        if map_name != self.map_name:
+
+            self.map_name = map_name
+            self.map_rows = loaded_map['total']['height']
+            self.map_cols = loaded_map['total']['width']
+            self.window_rows = loaded_map['window']['height']
+            self.window_cols = loaded_map['window']['width']
+            self.tile_width = int(self.width/self.window_cols)
+            self.tile_height = int(self.height/self.window_rows)
+            self.pixmaps = {}
+
+            # NPCs are sent as entities, so only keep the tiles that never move
+            self.tiles = [
+                [self.static_tile_type(code) for code in row] for row in loaded_map['map']
+            ]
+
+            for label in self.window_labels:
+                self.player_window.removeWidget(label)
+                label.deleteLater()
+
+            self.window_labels = []
+            for row in range(self.window_rows):
+                for col in range(self.window_cols):
+                    label = RemoteTile(self.tile_width, self.tile_height, loaded_map['background_color'])
+                    label.clicked.connect(self.tile_clicked)
+                    self.player_window.addWidget(label, row, col)
+                    self.window_labels.append(label)
+
+    def static_tile_type(self, code):
+
+        if not code:
+            return None
+
+        tile_type = code_to_feature[code.split(':')[0]]
+
+        return None if issubclass(tile_type, NPC) else tile_type
+
+    def set_view(self, entities, depleted, pending_moves):
+        # Show the entities and depleted trees/rocks from a snapshot, with our player where the moves the server
+        # hadn't applied yet will take them from where the snapshot has them (if the tiles they move onto are empty)
+
+        self.entities = entities
+        self.occupant = {(x, y): code for entity_id, (code, x, y) in entities.items() if entity_id != self.player_id}
+        self.depleted = depleted
+
+        if self.player_id in entities:
+
+            code, x, y = entities[self.player_id]
+            self.predicted_position = x, y
+
+            for seq, dx, dy in pending_moves:
+                self.predict_move(dx, dy)
+
+        self.redraw()
+
+    def is_walkable(self, x, y):
+        # Does the tile look empty, going by the static tiles and the entities in the last snapshot
+
+        return 0 <= x < self.map_cols and 0 <= y < self.map_rows and self.tiles[y][x] is None \
+            and (x, y) not in self.occupant
+
+    def predict_move(self, dx, dy):
+        # Move our player (as shown) one tile, if it looks empty, as the server will if it is. Returns if they moved
+
+        x, y = self.predicted_position[0] + dx, self.predicted_position[1] + dy
+
+        if not self.is_walkable(x, y):
+            return False
+
+        self.predicted_position = x, y
+        return True
+
+    def player_position(self):
+
+        return self.predicted_position
+
+    def icon_path(self, x, y):
+        # Path to the icon to display at (x, y), or None if it's empty
+
+        if (x, y) == self.predicted_position:
+            return entity_types[self.entities[self.player_id][0]].path_to_icon
+
+        if (x, y) in self.occupant:
+            return entity_types[self.occupant[(x, y)]].path_to_icon
+
+        tile_type = self.tiles[y][x]
+
+        if tile_type is None:
+            return None
+
+        if issubclass(tile_type, Interactable) and (x, y) in self.depleted:
+            return tile_type.path_to_depleted_icon
+
+        return tile_type.path_to_icon
+
+    def pixmap(self, path):
+
+        if path not in self.pixmaps:
+            self.pixmaps[path] = QPixmap(path).scaled(QSize(self.tile_width, self.tile_height), Qt.KeepAspectRatio)
+
+        return self.pixmaps[path]
+
+    def redraw(self):
+
+        if self.map_name is None or self.predicted_position is None:
+            return
+
+        player_x, player_y = self.player_position()
+        col_range, row_range = window_range(
+            player_x, player_y, self.window_cols, self.window_rows, self.map_cols, self.map_rows
+        )
+
+        for row_index, y in enumerate(row_range):
+            for col_index, x in enumerate(col_range):
+
+                label = self.window_labels[row_index * self.window_cols + col_index]
+                label.x, label.y = x, y
+
+                path = self.icon_path(x, y)
+                if path is None:
+                    label.clear()
+                else:
+                    label.setPixmap(self.pixmap(path))
+
+
+class ThinClient(QMainWindow):
+
+    def __init__(self, host, port, name):
+
+        super().__init__()
+
+        self.setWindowTitle("StarScape - %s" % name)
+        self.setFixedSize(QSize(1600, 900))
+
+        self.name = name
+
+        self.status_bar = StatusBar()
+        self.remote_map = RemoteMap()
+        self.remote_map.tile_clicked.connect(self.tile_clicked)
+
+        # Our own state, as last sent by the server
+        self.inventory = []
+        self.gold = 0
+        self.experience = {}
+
+        # Tool clicked on in the inventory, to use on the next resource double-clicked
+        self.selected_tool = None
+
+        # What the trade list is showing: None, ('shop', x, y) or ('bank',), and the item titles on each row
+        self.trade_mode = None
+        self.trade_titles = []
+
+        # Moves sent to the server that it hadn't applied as of the last snapshot, as (seq, dx, dy)
+        self.move_seq = 0
+        self.pending_moves = []
+
+        # Bytes received that don't make a whole frame yet, and the snapshots we might be sent deltas against, by seq
+        self.received = bytearray()
+        self.snapshots = {}
+        self.snapshot = None
+
+        self.gold_label = generate_label("", 15, w=280, h=30)
+        self.inventory_list = QListWidget()
+        self.inventory_list.setFixedSize(QSize(280, 380))
+        # The lists never take keyboard focus, so the arrow keys always reach `keyPressEvent` to move the player
+        self.inventory_list.setFocusPolicy(Qt.NoFocus)
+        self.inventory_list.itemClicked.connect(self.inventory_clicked)
+        self.inventory_list.itemDoubleClicked.connect(self.inventory_double_clicked)
+        self.skills_label = generate_label("", 12, alignment=Qt.AlignLeft | Qt.AlignTop, w=280, h=110)
+        self.trade_label = generate_label("", 15, w=280, h=30)
+        self.trade_list = QListWidget()
+        self.trade_list.setFixedSize(QSize(280, 250))
+        self.trade_list.setFocusPolicy(Qt.NoFocus)
+        self.trade_list.itemDoubleClicked.connect(self.trade_double_clicked)
+
+        left_panel_layout = QVBoxLayout()
+        for widget in [self.gold_label, self.inventory_list, self.skills_label, self.trade_label, self.trade_list]:
+            left_panel_layout.addWidget(widget)
+
+        right_panel_layout = QVBoxLayout()
+        right_panel_layout.addWidget(self.remote_map)
+        right_panel_layout.addWidget(self.status_bar)
+
+        overall_layout = QHBoxLayout()
+        overall_layout.addLayout(left_panel_layout)
+        overall_layout.addLayout(right_panel_layout)
+
+        widget = QWidget()
+        widget.setLayout(overall_layout)
+        self.setCentralWidget(widget)
+
+        self.socket = QTcpSocket(self)
+        self.socket.connected.connect(self.connected)
+        self.socket.readyRead.connect(self.read_messages)
+        self.socket.disconnected.connect(partial(self.status_bar.update_status_bar, "Disconnected from server"))
+        self.socket.connectToHost(host, port)
+
+    def send(self, message):
+
+        self.socket.write(encode(message))
+
+    def connected(self):
+
+        self.send({'type': 'hello', 'name': self.name})
+
+    def read_messages(self):
+
+        self.received.extend(bytes(self.socket.readAll()))
+
+        for kind, payload in split_frames(self.received):
+            if kind == FRAME_MESSAGE:
+                self.handle_message(json.loads(payload))
+            elif kind == FRAME_SNAPSHOT:
+                self.handle_snapshot(payload)
+
+    def handle_message(self, message):
+
+        kind = message['type']
+
+        if kind == 'welcome':
+            self.remote_map.player_id = message['player']
+
+        elif kind == 'map':
+            # Snapshots from the last map are no use on this one, the server starts again with a keyframe
+            # Moves made before the player changed map were applied on the last map, so there's nothing to predict
+            self.snapshots = {}
+            self.pending_moves = []
+            self.trade_mode = None
+            self.redraw_trade([])
+            self.remote_map.load_map(message['map'])
+
+        elif kind == 'shop':
+            self.trade_mode = ('shop', message['x'], message['y'])
+            self.trade_label.setText("SHOP")
+            self.redraw_shop()
+
+        elif kind == 'bank':
+            self.trade_mode = ('bank',)
+            self.trade_label.setText("BANK")
+            self.redraw_trade([(title, "%s x %s" % (title, quantity)) for index, title, quantity in message['contents']])
+
+        elif kind == 'message':
+            self.status_bar.update_status_bar(message['text'])
+
+    def handle_snapshot(self, payload):
+        # Apply a snapshot to the one it's the difference from, acknowledge it, and show it
+
+        seq, baseline_seq, tick, snapshot = decode_snapshot(payload, self.snapshots)
+
+        # The server only sends deltas against the last snapshot we acknowledged, or later ones
+        for old_seq in [old_seq for old_seq in self.snapshots if old_seq < baseline_seq]:
+            del self.snapshots[old_seq]
+
+        self.snapshots[seq] = snapshot
+        self.send({'type': 'ack', 'seq': seq})
+
+        previous, self.snapshot = self.snapshot, snapshot
+
+        # Reconcile our prediction with where the server says the player is: moves it's applied are in the
+        # snapshot, and those it hasn't are played again from there
+        self.pending_moves = [move for move in self.pending_moves if move[0] > snapshot.move_seq]
+        self.remote_map.set_view(snapshot.entities, snapshot.depleted, self.pending_moves)
+
+        if previous is None or (previous.inventory, previous.gold, previous.experience) != \
+                (snapshot.inventory, snapshot.gold, snapshot.experience):
+            self.redraw_you()
+
+        if self.trade_mode is not None and self.trade_mode[0] == 'shop' and (previous is None or previous.shop != snapshot.shop):
+            self.redraw_shop()
+
+    def redraw_you(self):
+
+        self.inventory = [None if code == 0 else item_types[code].title for code in self.snapshot.inventory]
+        self.gold = self.snapshot.gold
+        self.experience = dict(zip(skill_titles, self.snapshot.experience))
+
+        self.gold_label.setText("%sg" % self.gold)
+
+        self.inventory_list.clear()
+        for title in self.inventory:
+            self.inventory_list.addItem("" if title is None else title)
+
+        self.skills_label.setText('\n'.join(
+            "%s: %s (%s xp)" % (title, level_for_experience(xp), xp) for title, xp in self.experience.items()
+        ))
+
+    def redraw_shop(self):
+
+        stock = {} if self.snapshot is None else self.snapshot.shop
+
+        self.redraw_trade([
+            (item_types[code].title, "%s x %s (%sg)" % (item_types[code].title, quantity, price))
+            for index, (code, quantity, price) in sorted(stock.items())
+        ])
+
+    def redraw_trade(self, rows):
+
+        if self.trade_mode is None:
+            self.trade_label.setText("")
+
+        self.trade_titles = [title for title, text in rows]
+        self.trade_list.clear()
+        for title, text in rows:
+            self.trade_list.addItem(text)
+
+    def tile_clicked(self, x, y):
+
+        self.send({'type': 'interact', 'x': x, 'y': y})
+
+    def inventory_clicked(self, list_item):
+
+        title = self.inventory[self.inventory_list.row(list_item)]
+        self.selected_tool = title if title in ('Tinderbox', 'Knife') else None
+
+    def inventory_double_clicked(self, list_item):
+
+        title = self.inventory[self.inventory_list.row(list_item)]
+        if title is None:
+            return
+
+        if self.trade_mode is not None and self.trade_mode[0] == 'shop':
+            self.send({'type': 'sell', 'x': self.trade_mode[1], 'y': self.trade_mode[2], 'item': title, 'amount': 1})
+
+        elif self.trade_mode is not None and self.trade_mode[0] == 'bank':
+            self.send({'type': 'deposit', 'item': title, 'amount': 1})
+
+        elif self.selected_tool is not None and title != self.selected_tool:
+            self.send({'type': 'use', 'tool': self.selected_tool, 'item': title})
+
+    def trade_double_clicked(self, list_item):
+
+        title = self.trade_titles[self.trade_list.row(list_item)]
+
+        if self.trade_mode[0] == 'shop':
+            self.send({'type': 'buy', 'x': self.trade_mode[1], 'y': self.trade_mode[2], 'item': title, 'amount': 1})
+        else:
+            self.send({'type': 'withdraw', 'item': title, 'amount': 1})
+
+    def predict(self, direction, dx, dy):
+        # Send the move, and show it straight away if it looks like the player can move, rather than waiting for the
+        # server. Moves are numbered, and kept until a snapshot shows the server has applied them
+        # Intents are applied by the server in the order they're sent, so clicking a tile next to where the player is
+        # shown interacts with it even if the server hasn't yet sent back the moves that got them there
+
+        self.move_seq += 1
+        self.pending_moves.append((self.move_seq, dx, dy))
+        self.send({'type': 'move', 'direction': direction, 'seq': self.move_seq})
+
+        if self.remote_map.predicted_position is not None and self.remote_map.predict_move(dx, dy):
+            self.remote_map.redraw()
+
+    def keyPressEvent(self, e):
+
+        if e.key() in key_to_move:
+            # Moving closes any shop/bank (the server does the same)
+            self.trade_mode = None
+            self.redraw_trade([])
+            self.predict(*key_to_move[e.key()])
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="StarScape multiplayer client")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--name', default='player')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    window = ThinClient(args.host, args.port, args.name)
+    window.show()
+    app.exec_()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,88 +1,153 @@
 import os
 from map import Map
-from shop import Shop
-from bank import Bank
+from functools import partial
+from shop import Shop, ShopEconomy
+from bank import Bank, BankStorage
 from skills import SkillSet
 from inventory import Inventory
 from status_bar import StatusBar
+from actions import ActionScheduler, GatherAction
+from lifecycle import WidgetLifecycle
+from metrics import SessionMetrics, SessionMetricsDisplay
+from idle import save_idle_record, load_idle_record, resume
+from persistence import WorldStore, load_state, apply_state, capture_state
+from quicksave import SaveWriter, load_save, path_to_quick_save, path_to_autosave
+from skill_information import SkillInformation
 from PyQt5.QtCore import QSize, pyqtSignal, Qt, QTimer
 from PyQt5.QtWidgets import QApplication, QMainWindow, QHBoxLayout, QWidget, QVBoxLayout, QStackedLayout
 
 
 class GameDisplayIndex:
     # The main game display is a stacked layout, holding the multiple map widgets, the shop widgets, bank widget, etc.
-    # Only one is visible at any given time, and they all have indexes making it easy to swap between displays
-    # This class is used to store which index of the stacked game display is currently visible,
-    # and store a mapping from the widget to what it's index is in the stacked layout for easy swapping
-    # The stacked layout's currentIndex() will always equal this class `.visible_index`
-    # Every time we want to change the visible widget in the stacked layout, we index into this object,
-    # which returns the index in the stacked layout, but also sets that to the internal visible index variable
-
-    def __init__(self):
+    # Only one is visible at any given time, and this class keeps track of which one, and maps to its stacked index
+    # Every display is identified by a key object:
+    # - maps are keyed by the Map widget itself, and are always in the stacked layout
+    # - other displays (shops, the bank, skill information) are keyed by the model they display (a ShopStock, the
+    #   BankStorage, a Skill), and their widgets are only created the first time we open them, by a factory function
+    #   registered with `add_lazy_display`. If not opened again for `ticks_before_drop` game ticks, the widget
+    #   is dropped from the stacked layout and retired through the widget lifecycle - the model it displays stays,
+    #   so it's re-created on next open
+    # This way the number of live display widgets scales with what the player actually opens, not the size of the world
+    # Every time we want to change the visible widget in the stacked layout, we index into this object with a key,
+    # which creates the widget if needed, sets it as the visible display, and returns its index in the stacked layout
+
+    def __init__(self, stacked_layout, lifecycle, ticks_before_drop=None):
+
+        self.stacked_layout = stacked_layout
+        self.lifecycle = lifecycle
+
+        # How many game ticks an unused lazily created display is kept for (None means never drop them)
+        self.ticks_before_drop = ticks_before_drop
+        self.ticks = 0
 
         # The last viewed map helps us know what map to go back to, e.g. if we opened a shop in a cave,
         # we need to go back to display that exact cave map when we close the shop, not a different one
         # These variables get set when we index into this object for the first time to set stacked layout to start map
-        self.visible_index = None
-        self.last_viewed_map_index = None
+        self.visible_key = None
+        self.last_viewed_map = None
+
+        # Mapping from key to the display widget currently in the stacked layout for it,
+        # and for lazily created displays, the factory to create the widget and the game tick it was last opened
+        self.key_to_widget = {}
+        self.key_to_factory = {}
+        self.key_to_last_used_tick = {}
+
+    def add_display(self, widget):
+        # Add a display widget that always exists (i.e. a map) to the stacked layout, keyed by the widget itself
+
+        self.stacked_layout.addWidget(widget)
+        self.key_to_widget[widget] = widget
+
+    def add_lazy_display(self, key, factory):
+        # Register a display to only be created when first opened. `factory` takes no arguments and returns the widget
+
+        self.key_to_factory[key] = factory
+
+    def __getitem__(self, key):
+        # We assume by accessing the index of the key we are making its display visible in the stacked layout
+
+        if key not in self.key_to_widget:
+            widget = self.key_to_factory[key]()
+            self.stacked_layout.addWidget(widget)
+            self.key_to_widget[key] = widget
+
+        if key in self.key_to_factory:
+            self.key_to_last_used_tick[key] = self.ticks
+
+        widget = self.key_to_widget[key]
 
-        # We create a mapping from object reference to the index it is in the stacked layout,
-        # by repeatedly calling `add_display` with that object after initialising a GameDisplayIndex object
-        # `next_free_index` is the index to assign to a new object - stacked layout's start indexing at 0
-        self.next_free_index = 0
-        self.obj_to_index = {}
+        if isinstance(widget, Map):
+            self.last_viewed_map = widget
 
-    def add_display(self, obj):
-        # To be called in conjunction with adding widget `obj` to the stacked layout to keep indexes aligned
+        self.visible_key = key
+        return self.stacked_layout.indexOf(widget)
 
-        self.obj_to_index[obj] = self.next_free_index
-        self.next_free_index += 1
+    def tick(self):
+        # Slot for the game timer: drop any lazily created display widget that's not visible and hasn't been opened
+        # for `ticks_before_drop` ticks
 
-    def __getitem__(self, item):
-        # We assume by accessing the index of the object we are making it visible in the stacked layout
+        self.ticks += 1
 
-        index = self.obj_to_index[item]
+        if self.ticks_before_drop is None:
+            return
 
-        if isinstance(item, Map):
-            self.last_viewed_map_index = index
+        for key in list(self.key_to_last_used_tick):
 
-        self.visible_index = index
-        return index
+            if key == self.visible_key:
+                self.key_to_last_used_tick[key] = self.ticks
 
-    def calculate_inverse_mapping(self):
-        # Helps us get the object that is currently visible, by indexing inverse mapping on visible index
+            elif self.ticks - self.key_to_last_used_tick[key] >= self.ticks_before_drop:
+                self.drop(key)
 
-        self.index_to_obj = {self.obj_to_index[key]: key for key in self.obj_to_index}
+    def drop(self, key):
+        # Remove a lazily created display's widget from the stacked layout and retire it. The model it displays stays
+
+        widget = self.key_to_widget.pop(key)
+        del self.key_to_last_used_tick[key]
+        self.stacked_layout.removeWidget(widget)
+        self.lifecycle.retire(widget)
+
+    def drop_lazy_displays(self):
+        # Drop every lazily created display widget now, e.g. when the models they display are replaced by a loaded game
+        # A map must be visible, as it's never dropped
+
+        assert self.is_map_visible()
+
+        for key in list(self.key_to_last_used_tick):
+            self.drop(key)
+
+    def visible_widget(self):
+
+        return self.key_to_widget[self.visible_key]
 
     def is_map_visible(self):
 
-        return isinstance(self.index_to_obj[self.visible_index], Map)
+        return isinstance(self.visible_widget(), Map)
 
     def get_last_viewed_map(self):
         # If map currently visible, we can assume the last viewed map *is* the visible one
         # If map not currently visible, last viewed map is one we had visible before we opened a new display (e.g. shop)
 
-        last_visible_map = self.index_to_obj[self.last_viewed_map_index]
-        assert isinstance(last_visible_map, Map)
-        return last_visible_map
+        assert isinstance(self.last_viewed_map, Map)
+        return self.last_viewed_map
 
     def is_shop_visible(self):
 
-        return isinstance(self.index_to_obj[self.visible_index], Shop)
+        return isinstance(self.visible_widget(), Shop)
 
     def get_visible_shop(self):
 
         assert self.is_shop_visible()
-        return self.index_to_obj[self.visible_index]
+        return self.visible_widget()
 
     def is_bank_visible(self):
 
-        return isinstance(self.index_to_obj[self.visible_index], Bank)
+        return isinstance(self.visible_widget(), Bank)
 
     def get_visible_bank(self):
 
         assert self.is_bank_visible()
-        return self.index_to_obj[self.visible_index]
+        return self.visible_widget()
 
 
 class Game(QMainWindow):
@@ -107,6 +172,10 @@ class Game(QMainWindow):
         # Connect this to every slot needing a game tick, e.g. trees regenerating after x ticks; NPCs moving every tick
         self.timer = QTimer()
 
+        # Widgets that can leave the game (tiles replaced on a map, dropped displays, etc.) connect to the timer through
+        # the widget lifecycle, so they're disconnected and deleted when they go. Press F12 for a report of live widgets
+        self.lifecycle = WidgetLifecycle(self.timer)
+
         self.setWindowTitle("StarScape")
         self.setFixedSize(QSize(1600, 900))
 
@@ -114,13 +183,34 @@ class Game(QMainWindow):
         self.status_bar_signal.connect(self.status_bar.update_status_bar)
 
         # Create stacked layout for the main game display, which alternates between map displays, shop displays, etc.
-        # Corresponding index object keeps a mapping from the widget object to the relevant index in the stacked layout,
+        # Corresponding index object keeps a mapping from each display's key to its widget in the stacked layout,
+        # creating shop, bank and skill information widgets on first open and dropping them after 5 minutes unused,
         # as well as keeping track of which one is currently visible, and the last visible map object
         self.stacked_game_display_layout = QStackedLayout()
-        self.stacked_game_display_index = GameDisplayIndex()
+        self.stacked_game_display_index = GameDisplayIndex(
+            self.stacked_game_display_layout, self.lifecycle, ticks_before_drop=300
+        )
+        self.timer.timeout.connect(self.stacked_game_display_index.tick)
+
+        # Actions the player does over several game ticks (e.g. gathering from a tree) are queued in the scheduler,
+        # which steps every player's current action each game tick. There's only one player, identified by `player_id`
+        self.player_id = 0
+        self.action_scheduler = ActionScheduler()
+        self.timer.timeout.connect(self.action_scheduler.tick)
 
         self.skills = SkillSet(self.status_bar_signal)
+
+        # Session metrics record xp gained and gathering attempts, for rolling xp/hr etc. rates
+        # Their display is opened from the skills panel, and created on first open like the other displays
+        self.session_metrics = SessionMetrics()
+        self.timer.timeout.connect(self.session_metrics.tick)
+        self.skills.experience_gained.connect(self.session_metrics.record_experience)
+        self.skills.rates_button.clicked.connect(self.change_stacked_game_display_to_session_metrics)
+        self.stacked_game_display_index.add_lazy_display(self.session_metrics, self.create_session_metrics_display)
         self.inventory = Inventory(self.skills, self.stacked_game_display_index, self.status_bar_signal)
+        self.inventory.action_started.connect(self.start_action)
+        self.lifecycle.register_pool("inventory item slots", self.inventory.item_slot_pool)
+        self.lifecycle.register_pool("inventory empty slots", self.inventory.empty_slot_pool)
 
         # For every json file in 'maps/', create a new Map object, connect the relevant signals & slots,
         # add to the stacked layout and custom index mapper, etc.
@@ -146,6 +236,7 @@ class Game(QMainWindow):
                 inventory=self.inventory,
                 skills=self.skills,
                 timer=self.timer,
+                lifecycle=self.lifecycle,
                 status_bar_signal=self.status_bar_signal
             )
 
@@ -155,42 +246,52 @@ class Game(QMainWindow):
             map_obj.shop_clicked.connect(self.change_stacked_game_display)
             map_obj.bank_clicked.connect(self.change_stacked_game_display_to_bank)
             map_obj.transport_clicked.connect(self.change_stacked_game_display_between_maps)
+            map_obj.gather_clicked.connect(self.start_gathering)
+            map_obj.player_moved.connect(self.cancel_actions)
 
-            self.stacked_game_display_layout.addWidget(map_obj)
             self.stacked_game_display_index.add_display(map_obj)
 
-        # Create the bank instance shared across the game (different chests, on different maps, access the same bank)
-        self.bank = Bank(self.inventory, self.status_bar_signal)
-        self.bank.close_button.clicked.connect(self.change_stacked_game_display_to_map)
-        self.stacked_game_display_layout.addWidget(self.bank)
-        self.stacked_game_display_index.add_display(self.bank)
+        # Create the bank storage shared across the game (different chests, on different maps, access the same bank)
+        # The bank widget that displays it is only created when we first open the bank
+        self.bank_storage = BankStorage(limit=100)
+        self.stacked_game_display_index.add_lazy_display(self.bank_storage, self.create_bank_display)
 
-        # For each skill instance, add the information widget to the stacked layout display, and connect signals
+        # For each skill instance, connect signals, and register its information widget to be created on first open
         for skill_type in self.skills.skills:
             skill = self.skills.skills[skill_type]
             skill.skill_clicked_on.connect(self.change_stacked_game_display)
-            skill.information_widget.close_button.clicked.connect(self.change_stacked_game_display_to_map)
-            self.stacked_game_display_layout.addWidget(skill.information_widget)
-            self.stacked_game_display_index.add_display(skill.information_widget)
+            self.stacked_game_display_index.add_lazy_display(skill, partial(self.create_skill_information_display, skill))
 
-        # For all the shop instances across the different maps:
-        # - add to the stacked layout and work out relevant display index
-        # - connect the close button to slot for changing back to (last visible) map display
-        for map_name in self.map_name_to_obj:
-            for shop in self.map_name_to_obj[map_name].shops:
-                shop.set_inventory_reference(self.inventory)
-                shop.close_button.clicked.connect(self.change_stacked_game_display_to_map)
-                self.stacked_game_display_layout.addWidget(shop)
-                self.stacked_game_display_index.add_display(shop)
+        # The shop economy restocks/depletes every shop's stock back towards its base amounts, once per game tick
+        self.shop_economy = ShopEconomy()
+        self.timer.timeout.connect(self.shop_economy_tick)
 
-        # We define the starting map as 'surface.json': set initially visible widget to this, and add player to that map
-        # Indexing the widget in the GameDisplayIndex will set it to the visible index and last viewed (visible) map
-        initial_map = self.map_name_to_obj['surface']
-        self.stacked_game_display_layout.setCurrentIndex(self.stacked_game_display_index[initial_map])
-        initial_map.insert_player(2, 2)
-
-        # Once we've added all layouts to stacked layout, work out a reverse mapping in the index tracker
-        self.stacked_game_display_index.calculate_inverse_mapping()
+        # For all the shop tiles across the different maps:
+        # - add the shop's stock to the shop economy
+        # - register the shop widget to be created when the shop is first opened, keyed by the shop's stock
+        for map_name in self.map_name_to_obj:
+            for shop_tile in self.map_name_to_obj[map_name].shop_tiles:
+                self.shop_economy.add_stock(shop_tile.stock)
+                self.stacked_game_display_index.add_lazy_display(
+                    shop_tile.stock, partial(self.create_shop_display, shop_tile)
+                )
+
+        # Load the saved game (see `persistence.py`): skills, inventory, gold, bank, shop stock and the state of the maps,
+        # and put the player where they were (or at the start)
+        # The store then saves what changes every game tick, on its own thread
+        saved_state = load_state()
+        self.restore_state(saved_state)
+        self.world_store = WorldStore(state=saved_state)
+
+        # If the store's writes start failing, it keeps retrying, and we say so (once) until they succeed again
+        self.save_failing = False
+
+        # Quick saves (see `quicksave.py`) are written on their own thread too: on pressing F5, and every
+        # `autosave_ticks` game ticks to the autosave. F9 loads the quick save
+        self.save_writer = SaveWriter()
+        self.autosave_ticks = 300
+        self.ticks_since_autosave = 0
+        self.quick_save_failing = False
 
         # The overall game widget consists of not just the stacked layout (containing maps, shops, etc.),
         # but also a skills panel, inventory panel, among others
@@ -213,9 +314,187 @@ class Game(QMainWindow):
         widget.setLayout(overall_layout)
         self.setCentralWidget(widget)
 
+        # If we closed the game while gathering last time, fast-forward the gathering done while we were away
+        self.resume_idle_progress()
+
+        # Save after everything else has ticked, so each tick's changes are saved together
+        self.timer.timeout.connect(self.save_tick)
+
         # Set game timer to tick every 1s (1000ms)
         self.timer.start(1000)
 
+    def create_bank_display(self):
+        # Factory for the bank widget, called by the game display index the first time the bank is opened
+        # (or opened again after it was dropped for being unused)
+
+        bank = Bank(self.bank_storage, self.inventory, self.status_bar_signal)
+        bank.close_button.clicked.connect(self.change_stacked_game_display_to_map)
+        return bank
+
+    def create_skill_information_display(self, skill):
+        # Factory for a skill's information widget
+
+        information_widget = SkillInformation(type(skill))
+        information_widget.close_button.clicked.connect(self.change_stacked_game_display_to_map)
+        return information_widget
+
+    def create_session_metrics_display(self):
+        # Factory for the session metrics widget, which refreshes its rates every game tick while it exists
+
+        display = SessionMetricsDisplay(self.session_metrics, self.status_bar_signal)
+        display.close_button.clicked.connect(self.change_stacked_game_display_to_map)
+        self.lifecycle.connect_timer(display, display.refresh)
+        return display
+
+    def create_shop_display(self, shop_tile):
+        # Factory for the widget displaying a shop tile's stock
+
+        shop = Shop(shop_tile.title, shop_tile.stock, self.status_bar_signal)
+        shop.set_inventory_reference(self.inventory)
+        shop.close_button.clicked.connect(self.change_stacked_game_display_to_map)
+        return shop
+
+    def start_gathering(self, interactable):
+        # Replace whatever the player was doing with gathering from the tree/rock clicked on
+
+        self.start_action(GatherAction(interactable, self.inventory, self.skills, self.session_metrics))
+
+    def start_action(self, action):
+        # Replace whatever the player was doing with a new action
+
+        self.action_scheduler.start(self.player_id, action)
+
+    def cancel_actions(self):
+
+        self.action_scheduler.cancel(self.player_id)
+
+    def resume_idle_progress(self):
+        # Give the player the resources and xp they would have gathered while the game was closed (see `idle.py`)
+        # Only resources that still fit in the inventory are given, and xp is only gained for those
+
+        record = load_idle_record()
+        if record is None:
+            return
+
+        outcome = resume(record)
+
+        gathered = min(outcome['gathered'], self.inventory.space_for())
+        if gathered == 0:
+            return
+
+        # Xp gained while away isn't part of this session's rates, so it's marked idle for the session metrics to skip
+        items = [outcome['resource_type']() for i in range(gathered)]
+        self.skills.add_experience(items, generated=True, idle=True)
+        self.inventory.add_to(items)
+
+        self.status_bar_signal.emit("While you were away (%s mins) you gathered %s %ss from the %s. %s" % (
+            int(outcome['seconds_away'] / 60), gathered, outcome['resource_type'].title.lower(),
+            outcome['interactable_type'].title.lower(), self.status_bar.text()
+        ))
+
+    def restore_state(self, state):
+        # Put a saved state (from the database or a quick save) into the game, with the player taken off every map
+        # We start on 'surface.json', unless there's a saved state where the player can still be put:
+        # set the visible widget to that map, and add player to it
+        # Indexing the widget in the GameDisplayIndex will set it to the visible index and last viewed (visible) map
+
+        saved_position = apply_state(self, state)
+
+        initial_map, initial_x, initial_y = self.map_name_to_obj['surface'], 2, 2
+
+        if saved_position is not None and saved_position[0] in self.map_name_to_obj:
+            map_name, x, y = saved_position
+            saved_map = self.map_name_to_obj[map_name]
+            if 0 <= x < saved_map.map_cols and 0 <= y < saved_map.map_rows and saved_map.can_insert_player(x, y):
+                initial_map, initial_x, initial_y = saved_map, x, y
+
+        self.stacked_game_display_layout.setCurrentIndex(self.stacked_game_display_index[initial_map])
+        initial_map.insert_player(initial_x, initial_y)
+
+    def save_tick(self):
+        # Slot for the game timer: hand what changed this tick to the world store to write, without waiting for it,
+        # and every `autosave_ticks` ticks hand the same capture to the save writer for the autosave
+
+        state = capture_state(self)
+        self.world_store.save(state)
+
+        if (self.world_store.last_error is not None) != self.save_failing:
+            self.save_failing = not self.save_failing
+            self.status_bar_signal.emit(
+                "Couldn't save the game, retrying (%s)" % self.world_store.last_error if self.save_failing
+                else "Game saving again"
+            )
+
+        self.ticks_since_autosave += 1
+        if self.ticks_since_autosave >= self.autosave_ticks:
+            self.ticks_since_autosave = 0
+            self.save_writer.save(path_to_autosave, state)
+
+        # Quick saves and autosaves are written after we've moved on, so say (once) when one fails
+        if (self.save_writer.last_error is not None) != self.quick_save_failing:
+            self.quick_save_failing = not self.quick_save_failing
+            if self.quick_save_failing:
+                self.status_bar_signal.emit(self.save_writer.last_error)
+
+    def quick_save(self):
+
+        self.save_writer.save(path_to_quick_save, capture_state(self))
+
+        if self.save_writer.last_error is None:
+            self.status_bar_signal.emit("Game saved (F9 to load)")
+        else:
+            self.status_bar_signal.emit("Trying to save again, the last save failed: %s" % self.save_writer.last_error)
+
+    def quick_load(self):
+        # Put the game back to the quick save: the player is taken off their map, any open display is dropped
+        # (they're re-created from the restored models when next opened), and the saved state put in
+
+        state, message = load_save(path_to_quick_save)
+
+        if state is None:
+            self.status_bar_signal.emit(message)
+            return
+
+        self.cancel_actions()
+        self.change_stacked_game_display_to_map()
+        self.stacked_game_display_index.get_last_viewed_map().remove_player()
+        self.stacked_game_display_index.drop_lazy_displays()
+        self.restore_state(state)
+
+        self.status_bar_signal.emit("Game loaded")
+
+    def closeEvent(self, e):
+        # Save the game one last time, and wait for it and any quick saves to be written
+        # If we're gathering as we close the game, save an idle record so we carry on gathering while away
+
+        self.timer.stop()
+        self.save_tick()
+        self.world_store.close()
+        self.save_writer.close()
+
+        if self.world_store.last_error is not None:
+            print("Couldn't save the game: %s" % self.world_store.last_error)
+
+        if self.save_writer.last_error is not None:
+            print(self.save_writer.last_error)
+
+        action = self.action_scheduler.current_action(self.player_id)
+
+        if type(action) == GatherAction:
+
+            interactable = action.interactable
+            tool = self.inventory.get_tool(tool_type=interactable.tool_type_required, skill_set=self.skills)
+
+            if tool is not None and tool.strength >= interactable.minimum_tool_required.strength:
+                save_idle_record(
+                    interactable=interactable,
+                    tool=tool,
+                    skill=self.skills.relevant_skill(tool),
+                    capacity=self.inventory.space_for()
+                )
+
+        super().closeEvent(e)
+
     def mouseReleaseEvent(self, e):
         # We will .ignore() in any mouseReleaseEvent() to pass control up to here,
         # so we can clear the currently selected item in inventory
@@ -248,9 +527,31 @@ class Game(QMainWindow):
             # on pressing escape we want to go back to viewing that exact cave, not some other map
             self.change_stacked_game_display_to_map()
 
+        elif key_int == Qt.Key_F5:
+            self.quick_save()
+
+        elif key_int == Qt.Key_F9:
+            self.quick_load()
+
+        elif key_int == Qt.Key_F12:
+            # Debug report of live widgets, to check they aren't leaking over a long session
+            print(self.lifecycle.report())
+            self.status_bar_signal.emit("%s live widgets - full report printed to console" % sum(
+                self.lifecycle.live_widget_counts().values()
+            ))
+
+    def shop_economy_tick(self):
+        # Slot for the game timer: tick every shop's stock, and re-draw what changed if we're looking at a shop
+        # Shops that aren't visible catch up on re-drawing when they are next shown
+
+        self.shop_economy.tick()
+
+        if self.stacked_game_display_index.is_shop_visible():
+            self.stacked_game_display_index.get_visible_shop().redraw_dirty_slots()
+
     def change_stacked_game_display(self, obj):
-        # Indexing the widget object into GameDisplayIndex will return the relevant index in stacked layout,
-        # as well as set the internal visible index variable
+        # Indexing the display's key object into GameDisplayIndex will return the relevant index in stacked layout,
+        # (creating the display widget first if it's not been opened before) as well as set it as the visible display
         # We never directly pass an index number to setCurrentIndex() - it is always called with the index number
         # returned from indexing into GameDisplayIndex
 
@@ -266,7 +567,11 @@ class Game(QMainWindow):
 
     def change_stacked_game_display_to_bank(self):
 
-        self.change_stacked_game_display(self.bank)
+        self.change_stacked_game_display(self.bank_storage)
+
+    def change_stacked_game_display_to_session_metrics(self):
+
+        self.change_stacked_game_display(self.session_metrics)
 
     def change_stacked_game_display_between_maps(self, destination_str, destination_x, destination_y):
         # Called whenever we are changing between map displays, when a transport tile is clicked on
@@ -277,6 +582,7 @@ class Game(QMainWindow):
         new_map = self.map_name_to_obj[destination_str]
 
         if new_map.can_insert_player(destination_x, destination_y):
+            self.cancel_actions()
             old_map.remove_player()
             self.change_stacked_game_display(new_map)
             new_map.insert_player(destination_x, destination_y)
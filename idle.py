@@ -0,0 +1,155 @@
+import os
+import json
+import math
+import time
+from items import Axe, Pickaxe
+from skills import Woodcutting, Mining
+from tiles import code_to_feature, Interactable
+from tables import success_rate_table, experience_table, level_for_experience, max_level
+
+# Idle progression: when the game is closed while gathering, the player keeps gathering while they're away
+# On closing, we save an idle record of what they were doing, and on the next start we fast-forward the time away
+# in one calculation, rather than stepping a game tick at a time
+# The fast-forward uses expected values in closed form, from the same tables the game uses:
+# - each attempt yields one resource with the success rate for the level, tool and resource (the success rate table)
+# - after yielding its health in resources, the tree/rock takes its ticks to regenerate before gathering continues,
+#   so on average every resource also costs (ticks to regenerate / mean health) ticks of waiting
+# - xp per resource from the skill, levelling up via the experience table, which changes the success rate
+# - gathering stops when the inventory is full, like it does in the game (nothing is banked while away)
+# Levels only change a few dozen times at most, so this is one short loop over levels however long we were away
+# Unlike the game, where gathering stops when the tree/rock is depleted, we assume the player waits and carries on
+
+# Where the idle record is saved between runs, and the most time away that's counted
+path_to_idle_record = 'idle.json'
+maximum_idle_hours = 12
+
+ticks_per_second = 1
+
+# Maps from titles saved in the idle record back to types
+interactable_types = {
+    tile_type.title: tile_type for tile_type in code_to_feature.values() if issubclass(tile_type, Interactable)
+}
+tool_types = {tool_type.title: tool_type for tool_type in success_rate_table.tool_types}
+gathering_skill_types = {
+    Axe: Woodcutting,
+    Pickaxe: Mining
+}
+
+
+def ticks_per_resource(interactable_type, tool_type, level):
+    # Expected game ticks to gather one resource at this level (including its share of regeneration time),
+    # or None if we can't gather anything at this level with this tool
+
+    rate = success_rate_table.lookup(interactable_type.resource_type_yielded, tool_type, level)
+
+    if rate == 0:
+        return None
+
+    mean_health = (interactable_type.minimum_health + interactable_type.maximum_health) / 2
+
+    return 1 / rate + interactable_type.ticks_to_regenerate / mean_health
+
+
+def fast_forward(interactable_type, tool_type, experience, capacity, ticks):
+    # Expected outcome of gathering from this type of tree/rock with this type of tool for `ticks` game ticks,
+    # starting with `experience` xp in the gathering skill, with space for `capacity` resources
+    # Returns a dictionary of the number of resources gathered, the xp gained, the ticks actually spent gathering,
+    # and the level reached
+    # Works through the levels passed: at each level, gather until either we reach the next level, run out of time,
+    # or run out of space, then carry on at the new level's success rate
+
+    skill_type = gathering_skill_types[interactable_type.tool_type_required]
+    xp_per_resource = skill_type.xp_gain_per_generation[interactable_type.resource_type_yielded]
+
+    gathered = 0
+    ticks_spent = 0.0
+
+    level = level_for_experience(experience)
+
+    while ticks_spent < ticks and gathered < capacity:
+
+        ticks_each = ticks_per_resource(interactable_type, tool_type, level)
+        if ticks_each is None:
+            break
+
+        # Resources we can gather at this level before we run out of time or space
+        resources = min(capacity - gathered, (ticks - ticks_spent) / ticks_each)
+
+        # If we'd level up first, only gather up to the next level, then carry on at the new level
+        if level < max_level:
+            resources_to_level = math.ceil(
+                (experience_table[level + 1] - (experience + gathered * xp_per_resource)) / xp_per_resource
+            )
+            if resources_to_level < resources:
+                resources = resources_to_level
+
+        resources = math.floor(resources)
+        if resources == 0:
+            break
+
+        gathered += resources
+        ticks_spent += resources * ticks_each
+
+        level = level_for_experience(experience + gathered * xp_per_resource)
+
+    return {
+        'gathered': gathered,
+        'experience': gathered * xp_per_resource,
+        'ticks': ticks_spent,
+        'level': level
+    }
+
+
+def save_idle_record(interactable, tool, skill, capacity, path=path_to_idle_record):
+    # Save what the player is gathering as they close the game
+
+    record = {
+        'time': time.time(),
+        'interactable': interactable.title,
+        'tool': tool.title,
+        'experience': skill.experience,
+        'capacity': capacity
+    }
+
+    with open(path, 'w') as f:
+        json.dump(record, f)
+
+
+def load_idle_record(path=path_to_idle_record):
+    # Load and remove the idle record, so time away is only counted once. None if there isn't one
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        record = json.load(f)
+
+    os.remove(path)
+
+    return record
+
+
+def resume(record, now=None):
+    # Fast-forward the time since the idle record was saved (up to the maximum time away counted)
+    # Returns the fast-forward outcome, along with the types of tree/rock and resource, and the time counted
+
+    if now is None:
+        now = time.time()
+
+    seconds_away = min(max(now - record['time'], 0), maximum_idle_hours * 3600)
+
+    interactable_type = interactable_types[record['interactable']]
+
+    outcome = fast_forward(
+        interactable_type=interactable_type,
+        tool_type=tool_types[record['tool']],
+        experience=record['experience'],
+        capacity=record['capacity'],
+        ticks=int(seconds_away * ticks_per_second)
+    )
+
+    outcome['interactable_type'] = interactable_type
+    outcome['resource_type'] = interactable_type.resource_type_yielded
+    outcome['seconds_away'] = seconds_away
+
+    return outcome
@@ -1,4 +1,7 @@
 from PyQt5.QtGui import QPixmap
+from pools import WidgetPool
+from actions import CraftAction
+from recipes import recipe_book
 from utilities import generate_label
 from PyQt5.QtCore import Qt, QSize, pyqtSignal
 from items import concrete_types, Item, Tool, CopperAxe, CopperPickaxe, Tinderbox, Knife, Resource
@@ -21,15 +24,20 @@ class InventorySlot(QLabel):
     sell_slot_clicked = pyqtSignal(int, type)     # amount to sell x type of item to sell
     deposit_slot_clicked = pyqtSignal(int, type)  # amount to deposit x type of item to deposit
 
+    # If we right-click an item when a map is visible, we can use the currently selected item on many items of the
+    # clicked item's type (e.g. select a knife, then right-click a log to fletch all logs)
+    # Emits the amount to make, and the (col, row) of the item clicked on
+    make_slot_clicked = pyqtSignal(int, int, int)
+
+    # Scaled item icons, shared between all inventory slots, keyed by item type
+    # Slots are pooled and rebound to different items, so we only ever load and scale each icon once
+    pixmaps = {}
+
     def __init__(self, col, row, item, slot_width, slot_height, game_display_index, status_bar_signal):
 
         super().__init__()
 
-        # Position in the inventory's 7x4 grid
-        self.col, self.row = col, row
-
-        # The item object stored in this non-empty slot
-        self.item = item
+        self.slot_width, self.slot_height = slot_width, slot_height
 
         self.setFixedSize(QSize(slot_width, slot_height))
 
@@ -38,10 +46,11 @@ class InventorySlot(QLabel):
 
         self.status_bar_signal = status_bar_signal
 
-        # This inventory slot's widget is visually display as an image, the image of item being stored
-        self.setPixmap(QPixmap(self.item.path_to_icon).scaled(int(slot_width/2), int(slot_height/2), Qt.KeepAspectRatio))
         self.setAlignment(Qt.AlignCenter)
 
+        # Set the position in the inventory's 7x4 grid and the item object stored in this non-empty slot
+        self.rebind(col, row, item)
+
         # Create actions in advance to display in right-click menu
         # Define actions for both selling and depositing various amounts,
         # which are to be dynamically displayed on right-click event depending on if a bank or shop interface is visible
@@ -70,6 +79,33 @@ class InventorySlot(QLabel):
         self.deposit_all_action = QAction("Deposit all", self)
         self.deposit_all_action.triggered.connect(self.deposit_all_clicked)
 
+        self.make_five_action = QAction("Make 5", self)
+        self.make_five_action.triggered.connect(self.make_five_clicked)
+
+        self.make_ten_action = QAction("Make 10", self)
+        self.make_ten_action.triggered.connect(self.make_ten_clicked)
+
+        self.make_all_action = QAction("Make all", self)
+        self.make_all_action.triggered.connect(self.make_all_clicked)
+
+    def rebind(self, col, row, item):
+        # Point this slot at a new item and grid position
+        # Called on creation, and when the inventory re-uses this slot widget from its pool for a different item
+
+        self.col, self.row = col, row
+        self.item = item
+
+        # This inventory slot's widget is visually display as an image, the image of item being stored
+        item_type = type(item)
+        if item_type not in self.pixmaps:
+            self.pixmaps[item_type] = QPixmap(item.path_to_icon).scaled(
+                int(self.slot_width/2), int(self.slot_height/2), Qt.KeepAspectRatio
+            )
+        self.setPixmap(self.pixmaps[item_type])
+
+        # A pooled slot may have been released while highlighted
+        self.dehighlight()
+
     def sell_one_clicked(self):
 
         self.sell_slot_clicked.emit(1, type(self.item))
@@ -106,14 +142,37 @@ class InventorySlot(QLabel):
 
         self.deposit_slot_clicked.emit(28, type(self.item))
 
+    def make_five_clicked(self):
+
+        self.make_slot_clicked.emit(5, self.col, self.row)
+
+    def make_ten_clicked(self):
+
+        self.make_slot_clicked.emit(10, self.col, self.row)
+
+    def make_all_clicked(self):
+        # As with selling/depositing all, the inventory will cap at how many we actually have
+
+        self.make_slot_clicked.emit(28, self.col, self.row)
+
     def contextMenuEvent(self, e):
-        # If we right-click on an inventory item when a shop or bank is visible,
-        # we dynamically create the context menu, displaying the selling/depositing actions defined in init
+        # If we right-click on an inventory item when a map, shop or bank is visible,
+        # we dynamically create the context menu, displaying the making/selling/depositing actions defined in init
 
-        if self.game_display_index.is_shop_visible():
+        if self.game_display_index.is_map_visible():
+            # Making many items needs another item to already be selected, which the main inventory class checks
+
+            context = QMenu(self)
+            context.addAction(self.make_five_action)
+            context.addAction(self.make_ten_action)
+            context.addAction(self.make_all_action)
+            context.exec_(e.globalPos())
+
+        elif self.game_display_index.is_shop_visible():
             # Only want to display selling actions if the game display is a shop
 
-            self.status_bar_signal.emit("%s sells for %sg" % (self.item.title, self.item.sell_price))
+            shop = self.game_display_index.get_visible_shop()
+            self.status_bar_signal.emit("%s sells for %sg" % (self.item.title, shop.sell_price(type(self.item))))
 
             context = QMenu(self)
             context.addAction(self.sell_one_action)
@@ -150,6 +209,10 @@ class InventorySlot(QLabel):
                 self.select_clicked.emit(self.col, self.row)
                 e.accept()
 
+            elif e.button() == Qt.RightButton:
+                # Keep any selected item selected, as the right-click menu uses it for making many items
+                e.accept()
+
             else:
                 e.ignore()
 
@@ -158,7 +221,8 @@ class InventorySlot(QLabel):
             if e.button() == Qt.LeftButton:
 
                 if self.game_display_index.is_shop_visible():
-                    self.status_bar_signal.emit("%s sells for %sg" % (self.item.title, self.item.sell_price))
+                    shop = self.game_display_index.get_visible_shop()
+                    self.status_bar_signal.emit("%s sells for %sg" % (self.item.title, shop.sell_price(type(self.item))))
 
                 elif self.game_display_index.is_bank_visible():
                     self.deposit_one_clicked()
@@ -187,6 +251,11 @@ class EmptyInventorySlot(QLabel):
 
         self.status_bar_signal = status_bar_signal
 
+    def rebind(self):
+        # Empty slots have no payload, so there's nothing to change when re-using one from the inventory's pool
+
+        pass
+
     def mouseReleaseEvent(self, e):
         # If we click on this empty inventory slot, pass control up the mouseReleaseEvent() hierarchy to Game object
         # which will de-select any inventory item that was selected
@@ -268,11 +337,6 @@ class GoldPouch(QWidget):
         assert self.gold >= 0
         self.redraw()
 
-    def can_afford_to_buy(self, item_buy_price):
-        # Returns how many of the item we can afford to buy based on the gold we have
-
-        return int(self.gold/item_buy_price)
-
 
 class Inventory(QWidget):
     # An inventory holds a collection of instantiated concrete item types
@@ -282,6 +346,9 @@ class Inventory(QWidget):
     # - An empty slot placeholder (EmptyInventorySlot)
     # - An item slot (InventorySlot) which is basically a wrapper around an Item object
 
+    # Emits an action (see `actions.py`) to start on the game's action scheduler, e.g. lighting many logs one per tick
+    action_started = pyqtSignal(object)
+
     def __init__(self, skills, game_display_index, status_bar_signal):
 
         super().__init__()
@@ -327,32 +394,33 @@ class Inventory(QWidget):
         # and similarly, de-highlighted if un-selected
         self.selected = None
 
+        # Slot widgets are pooled rather than closed and re-created every time an item moves in or out of the inventory
+        # When an item is removed its slot widget goes back to the pool, to be rebound to the next item added
+        # The item slot factory connects up the slot's signals once, when the widget is first created
+        self.item_slot_pool = WidgetPool(self.create_item_slot)
+        self.empty_slot_pool = WidgetPool(self.create_empty_slot)
+
+        # Cache of the best tool in the inventory, keyed by (tool type, skill set) as passed to `get_tool`
+        # Every click on a tree/rock asks for the best tool, so only re-scan the inventory when the answer could change:
+        # the whole cache is cleared whenever the inventory's contents change, and entries for a tool type
+        # are cleared when a skill using that type of tool levels up (as we may be able to use a better tool)
+        self.best_tool_cache = {}
+        self.skills.skill_levelled_up.connect(self.skill_levelled_up)
+
         # A fresh inventory has a copper axe, a copper pickaxe, a tinderbox, and a knife
-        # Whenever adding inventory items to the grid, make sure we connect the signals to the appropriate slots
         init_items = [CopperAxe(), CopperPickaxe(), Tinderbox(), Knife()]
         for init_index in range(len(init_items)):
 
             init_col, init_row = init_index % 4, int(init_index/4)
 
-            init_slot = InventorySlot(
-                col=init_col, row=init_row,
-                item=init_items[init_index],
-                slot_width=self.slot_width, slot_height=self.slot_height,
-                game_display_index=self.game_display_index,
-                status_bar_signal=self.status_bar_signal
-            )
-
-            init_slot.sell_slot_clicked.connect(self.sell)
-            init_slot.deposit_slot_clicked.connect(self.deposit)
-            init_slot.select_clicked.connect(self.inventory_item_selected)
-
+            init_slot = self.item_slot_pool.acquire(init_col, init_row, init_items[init_index])
             self.inventory.addWidget(init_slot, init_row, init_col)
 
         # Fill remaining slots with empty inventory placeholder slots
         for i in range(len(init_items), self.inventory_size):
 
             col, row = i % 4, int(i/4)
-            self.inventory.addWidget(EmptyInventorySlot(self.slot_width, self.slot_height, self.status_bar_signal), row, col)
+            self.inventory.addWidget(self.empty_slot_pool.acquire(), row, col)
 
         # Put bold 'INVENTORY' text and the gold pouch widget above the item grid
         overall_layout = QVBoxLayout()
@@ -371,6 +439,55 @@ class Inventory(QWidget):
 
         self.setLayout(overall_layout)
 
+    def create_item_slot(self, col, row, item):
+        # Factory for the item slot pool - when creating a new inventory slot, make sure to connect up all the signals
+
+        item_slot = InventorySlot(
+            col=col, row=row,
+            item=item,
+            slot_width=self.slot_width, slot_height=self.slot_height,
+            game_display_index=self.game_display_index,
+            status_bar_signal=self.status_bar_signal
+        )
+
+        item_slot.sell_slot_clicked.connect(self.sell)
+        item_slot.deposit_slot_clicked.connect(self.deposit)
+        item_slot.select_clicked.connect(self.inventory_item_selected)
+        item_slot.make_slot_clicked.connect(self.make)
+
+        return item_slot
+
+    def create_empty_slot(self):
+        # Factory for the empty slot pool
+
+        return EmptyInventorySlot(self.slot_width, self.slot_height, self.status_bar_signal)
+
+    def set_slot(self, col, row, item=None):
+        # Replace whatever slot widget is at grid position (col, row) with a slot holding `item`,
+        # or an empty placeholder slot if `item` is None
+        # The old slot widget is released back to its pool, and the new one acquired from a pool
+
+        old_slot = self.inventory.itemAtPosition(row, col).widget()
+        self.inventory.removeWidget(old_slot)
+
+        # Contents are changing, so any cached best tools may be out of date
+        self.best_tool_cache.clear()
+
+        if type(old_slot) == InventorySlot:
+            self.item_slot_pool.release(old_slot)
+        else:
+            self.empty_slot_pool.release(old_slot)
+
+        if item is None:
+            new_slot = self.empty_slot_pool.acquire()
+        else:
+            new_slot = self.item_slot_pool.acquire(col, row, item)
+
+        self.inventory.addWidget(new_slot, row, col)
+
+        # Pooled widgets were hidden on release, so need explicitly showing again
+        new_slot.show()
+
     def number_items(self):
         # Returns number of items in the inventory, i.e. the number of non-empty inventory slots
 
@@ -409,6 +526,9 @@ class Inventory(QWidget):
 
         assert issubclass(tool_type, Tool)  # Restricting our item type to tools
 
+        if (tool_type, skill_set) in self.best_tool_cache:
+            return self.best_tool_cache[(tool_type, skill_set)]
+
         best_tool = None  # Keep track of best tool (i.e. highest strength we can use based on skills) seen so far
 
         for i in range(self.inventory_size):
@@ -431,8 +551,18 @@ class Inventory(QWidget):
                         if skill_set.can_use(item):
                             best_tool = item
 
+        self.best_tool_cache[(tool_type, skill_set)] = best_tool
+
         return best_tool
 
+    def skill_levelled_up(self, skill):
+        # Slot for the skill set's level up signal: forget the cached best tools of any type this skill uses,
+        # as we might now have the level to use a better one
+
+        for tool_type, skill_set in list(self.best_tool_cache):
+            if skill_set is not None and any(issubclass(t, tool_type) for t in skill.relevant_tools):
+                del self.best_tool_cache[(tool_type, skill_set)]
+
     def add_to(self, items):
         # Takes a list of Item objects, and adds to the inventory
         # They need to be wrapped in inventory slot wrappers to fit in grid layout
@@ -455,18 +585,10 @@ class Inventory(QWidget):
                 inventory_col, inventory_row = inventory_index % 4, int(inventory_index / 4)
                 inventory_slot = self.inventory.itemAtPosition(inventory_row, inventory_col)
 
-            # Insert item into this position by removing empty widget there and inserting new inventory item slot
+            # Insert item into this position by swapping the empty widget there for an inventory item slot
             # Then move pointer to next grid position
 
-            inventory_slot.widget().close()
-            self.inventory.removeItem(inventory_slot)
-
-            # When creating a new inventory slot, make sure to connect up all the signals & slots
-            item_slot = InventorySlot(inventory_col, inventory_row, item, self.slot_width, self.slot_height, self.game_display_index, self.status_bar_signal)
-            item_slot.sell_slot_clicked.connect(self.sell)
-            item_slot.deposit_slot_clicked.connect(self.deposit)
-            item_slot.select_clicked.connect(self.inventory_item_selected)
-            self.inventory.addWidget(item_slot, inventory_row, inventory_col)
+            self.set_slot(inventory_col, inventory_row, item)
 
             inventory_index += 1
             inventory_col, inventory_row = inventory_index % 4, int(inventory_index / 4)
@@ -537,11 +659,7 @@ class Inventory(QWidget):
                 removed_items.append(slot.widget().item)
 
                 # Remove inventory slot wrapper and replace with an empty inventory slot
-                slot.widget().close()
-                self.inventory.removeItem(slot)
-
-                empty_slot = EmptyInventorySlot(self.slot_width, self.slot_height, self.status_bar_signal)
-                self.inventory.addWidget(empty_slot, row, col)
+                self.set_slot(col, row)
 
         return removed_items
 
@@ -637,54 +755,30 @@ class Inventory(QWidget):
                     self.deselect_item()
 
                 else:
-                    # We clicked on a tool and a resource (in either order), do the combining
+                    # We clicked on a tool and a resource (in either order), do the combining using the recipe for them
                     # `result` will be a dictionary, storing if it succeeded/failed, what to do if it succeeded, etc.
 
-                    result = tool_item.use_on_resource_item(
-                        skills=self.skills,
-                        resource=resource_item,
-                        visible_map=self.game_display_index.get_last_viewed_map()
-                    )
-
-                    if result['success']:
-                        # We could combine the items, now see if we need to remove / replace the resource in inventory
-
-                        if result['action'] == 'remove':
-                            # Remove the resource, e.g. tinderbox lighted a log and log needs to disappear
-
-                            removed_col, removed_row = resource_grid_item.widget().col, resource_grid_item.widget().row
-
-                            resource_grid_item.widget().close()
-                            self.inventory.removeItem(resource_grid_item)
-
-                            empty_slot = EmptyInventorySlot(self.slot_width, self.slot_height, self.status_bar_signal)
-                            self.inventory.addWidget(empty_slot, removed_row, removed_col)
+                    recipe = recipe_book.lookup(type(tool_item), type(resource_item))
 
-                        else:
-
-                            assert result['action'] == 'replace'
-
-                            # Replace the resource with whatever the tool made with it
-                            # e.g. log made into a shortbow using a knife
-
-                            replaced_col, replaced_row = resource_grid_item.widget().col, resource_grid_item.widget().row
+                    if recipe is None:
+                        result = {
+                            'success': False,
+                            'message': "You can't use a %s on a %s" % (tool_item.title.lower(), resource_item.title.lower())
+                        }
 
-                            resource_grid_item.widget().close()
-                            self.inventory.removeItem(resource_grid_item)
-
-                            replaced_slot = InventorySlot(
-                                col=replaced_col, row=replaced_row,
-                                item=result['generated_item'],
-                                slot_width=self.slot_width, slot_height=self.slot_height,
-                                game_display_index=self.game_display_index,
-                                status_bar_signal=self.status_bar_signal
-                            )
+                    else:
+                        result = recipe.use(
+                            skills=self.skills,
+                            tool=tool_item,
+                            resources=[resource_item],
+                            visible_map=self.game_display_index.get_last_viewed_map()
+                        )
 
-                            replaced_slot.sell_slot_clicked.connect(self.sell)
-                            replaced_slot.deposit_slot_clicked.connect(self.deposit)
-                            replaced_slot.select_clicked.connect(self.inventory_item_selected)
+                    if result['success']:
+                        # We could combine the items, now remove / replace the resource in inventory
 
-                            self.inventory.addWidget(replaced_slot, replaced_row, replaced_col)
+                        resource_slot = resource_grid_item.widget()
+                        self.apply_tool_result(result, [(resource_slot.col, resource_slot.row)])
 
                         # Need to deselect whatever item was selected
                         if tool_currently_selected:
@@ -700,6 +794,116 @@ class Inventory(QWidget):
                         self.status_bar_signal.emit(result['message'])
                         self.deselect_item()
 
+    def apply_tool_result(self, result, positions):
+        # Apply the result of successfully using a tool on the resources at the grid `positions` (list of (col, row))
+        # The inventory is changed in one go, with updates disabled until we're done so it's only re-drawn once
+
+        self.setUpdatesEnabled(False)
+
+        if result['action'] == 'remove':
+            # Remove the resources, e.g. tinderbox lighted a log and log needs to disappear
+
+            for col, row in positions:
+                self.set_slot(col, row)
+
+        else:
+
+            assert result['action'] == 'replace'
+
+            # Replace the resources with whatever the tool made with them
+            # e.g. logs made into shortbows using a knife
+
+            assert len(result['generated_items']) == len(positions)
+
+            for (col, row), generated_item in zip(positions, result['generated_items']):
+                self.set_slot(col, row, generated_item)
+
+        self.setUpdatesEnabled(True)
+
+    def use_tool_on_resources(self, tool, resource_type, amount):
+        # Use a tool in the inventory on up to `amount` resources of a type in the inventory, as one transaction
+        # Returns the result dictionary from the tool, and if it failed, updates the status bar with why
+
+        positions = []
+        have_tool = False
+
+        for i in range(self.inventory_size):
+
+            col, row = i % 4, int(i / 4)
+            slot = self.inventory.itemAtPosition(row, col).widget()
+
+            if type(slot) == EmptyInventorySlot:
+                continue
+
+            if slot.item is tool:
+                have_tool = True
+
+            elif type(slot.item) == resource_type and len(positions) < amount:
+                positions.append((col, row))
+
+        recipe = recipe_book.lookup(type(tool), resource_type)
+
+        if recipe is None:
+            result = {
+                'success': False,
+                'message': "You can't use a %s on a %s" % (tool.title.lower(), resource_type.title.lower())
+            }
+
+        elif not have_tool:
+            result = {'success': False, 'message': "You no longer have the %s" % tool.title}
+
+        elif not positions:
+            result = {'success': False, 'message': "No more %ss to use the %s on" % (resource_type.title, tool.title)}
+
+        else:
+            result = recipe.use(
+                skills=self.skills,
+                tool=tool,
+                resources=[self.inventory.itemAtPosition(row, col).widget().item for col, row in positions],
+                visible_map=self.game_display_index.get_last_viewed_map()
+            )
+
+        if result['success']:
+            self.apply_tool_result(result, positions)
+        else:
+            self.status_bar_signal.emit(result['message'])
+
+        return result
+
+    def make(self, amount, col, row):
+        # This function is emitted to when we right-click make an InventorySlot in map mode
+        # The item right-clicked on and the selected item should be a tool and a resource (in either order),
+        # and we use the tool on (up to) `amount` resources of that type
+        # Recipes that can batch instantly do it in one transaction, otherwise we start an action doing one per tick
+
+        if self.selected is None or self.selected == (col, row):
+            self.status_bar_signal.emit("Select a tool or resource first, then right-click what to use it on")
+            return
+
+        current_item = self.inventory.itemAtPosition(self.selected[1], self.selected[0]).widget().item
+        new_item = self.inventory.itemAtPosition(row, col).widget().item
+
+        self.deselect_item()
+
+        if isinstance(current_item, Tool) and isinstance(new_item, Resource):
+            tool, resource = current_item, new_item
+        elif isinstance(current_item, Resource) and isinstance(new_item, Tool):
+            tool, resource = new_item, current_item
+        else:
+            self.status_bar_signal.emit("Try using a tool on a resource instead")
+            return
+
+        recipe = recipe_book.lookup(type(tool), type(resource))
+
+        if recipe is None:
+            self.status_bar_signal.emit("You can't use a %s on a %s" % (tool.title.lower(), resource.title.lower()))
+
+        elif recipe.instant_batch:
+            self.use_tool_on_resources(tool, type(resource), amount)
+
+        else:
+            self.action_started.emit(CraftAction(self, tool, type(resource), amount))
+
     def deselect_item(self):
         # If there is a currently selected item, deselect it and un-highlight relevant InventorySlot
         # This can be called from Game.mouseReleaseEvent, which is why all our mouseReleaseEvents have .ignore()
@@ -256,22 +256,11 @@ class GoldOre(Ore):
 
 class Tool(Item):
     # Abstract class for tool items. Will have multiple abstract subclasses for more specific tools, e.g. Axe
+    # Some tools can be used on resources in the inventory - what they do is defined by the recipes in `recipes.py`
 
     def __init__(self):
         super().__init__()
 
-    def use_on_resource_item(self, skills, resource, visible_map):
-        # If we use a tool on a resource (or vica-versa) in the inventory, we want to try and combine them
-        # Obviously not all combinations make sense (e.g. tinderbox on an ore?!), so most of the combinations won't
-        # do anything. This is the purpose of this function.
-        # If we overwrite this function in a subclass, we will handle the interaction there,
-        # otherwise assume the tool cannot be used on a resource and fails to combine
-
-        return {
-            'success': False,
-            'message': "You don't know how to use this tool on any resource"
-        }
-
 
 class Tinderbox(Tool):
     # Concrete tool item for Tinderbox
@@ -286,47 +275,6 @@ class Tinderbox(Tool):
     def __init__(self):
         super().__init__()
 
-    def use_on_resource_item(self, skills, resource, visible_map):
-
-        # Check we're trying to use the tinderbox on a log
-        if not isinstance(resource, Log):
-            return {
-                'success': False,
-                'message': "You can only use a tinderbox on a log"
-            }
-
-        # Check we have the skill level to use this tinderbox (redundant, as it's 1 but good practice to check)
-        if not skills.can_use(self):
-            return {
-                'success': False,
-                'message': "You don't have the skill level to use this tinderbox"
-            }
-
-        # Check we have the skill level to burn this log type
-        if not skills.can_burn(resource):
-            return {
-                'success': False,
-                'message': "You don't have the skill level to burn this log"
-            }
-
-        # Check we can light a log on the map
-        if not visible_map.can_light_fire():
-            return {
-                'success': False,
-                'message': "You cannot light a fire here"
-            }
-
-        # We can do the processing, i.e. burning the log and gaining firemaking xp
-        # We are processing item, which has a different skill mapping than generation (e.g. generating logs from tree)
-        # processing a log is firemaking xp, generating a log is woodcutting xp
-        skills.add_experience([resource], generated=False)
-        visible_map.light_fire(resource.ticks_for_fire_to_disappear)
-
-        return {
-            'success': True,
-            'action': 'remove'
-        }
-
 
 class Knife(Tool):
     # Concrete tool item for Knife
@@ -341,48 +289,6 @@ class Knife(Tool):
     def __init__(self):
         super().__init__()
 
-    def use_on_resource_item(self, skills, resource, visible_map):
-
-        # Check we're trying to use a knife on a log
-        if not isinstance(resource, Log):
-            return {
-                'success': False,
-                'message': "You can only use a knife on a log"
-            }
-
-        # Check we have the skill level to use this knife (redundant, as it's 1 but good practice to check)
-        if not skills.can_use(self):
-            return {
-                'success': False,
-                'message': "You don't have the skill level to use this knife"
-            }
-
-        # Check we have the skill level to fletch this log type
-        if not skills.can_fletch(resource):
-            return {
-                'success': False,
-                'message': "You don't have the skill level to fletch this log"
-            }
-
-        # We can do the processing, i.e. turning the log into a shortbow of corresponding type
-        # We are generating an item, a shortbow, so make sure to use generation xp mapping
-
-        generated_item = {
-            OakLog: OakShortbow,
-            WillowLog: WillowShortbow,
-            MapleLog: MapleShortbow,
-            YewLog: YewShortbow,
-            MagicLog: MagicShortbow
-        }[type(resource)]()
-
-        skills.add_experience([generated_item], generated=True)
-
-        return {
-            'success': True,
-            'action': 'replace',
-            'generated_item': generated_item
-        }
-
 
 class Axe(Tool):
     # Abstract class to be subclassed by all instantiable woodcutting axe types, e.g. Copper Axe, Steel Axe, etc.
@@ -553,3 +459,9 @@ concrete_types = [
     YewShortbow,
     MagicShortbow
 ]
+
+# Precompute each concrete type's position in the list above as an integer sort rank
+# Sorting (e.g. in the bank) can then use a constant time attribute lookup per item type,
+# rather than searching `concrete_types.index()` for every comparison
+for sort_rank, concrete_type in enumerate(concrete_types):
+    concrete_type.sort_rank = sort_rank
@@ -0,0 +1,625 @@
+import os
+import sys
+import json
+import time
+import queue
+import struct
+import argparse
+import threading
+import numpy as np
+from tiles import code_to_feature, NPC, Fire
+from protocol import Writer, Reader, write_value, read_value, length_room
+from world import World, Entity, PLAYER, directions, skill_types, title_to_item_type, player_from_record
+
+# Append-only journal of everything that changes the multiplayer world (see `world.py`), for recovering the world
+# after a crash, and as a trace of a real session to replay, e.g. to benchmark the server's tick
+# Each event is a command the world ran - a player joining, leaving, moving, transporting, gathering, using a tool,
+# buying, selling, depositing or withdrawing, or a game tick - with its outcome (whether they moved, the xp gained,
+# how many items and how much gold changed hands), and every random draw the world made running it (see `Chance`)
+# Replaying the commands through a world with the same draws ends in exactly the same state, so every change that
+# follows from a command (xp, items, the bank, shops, depleted trees/rocks, NPCs wandering, fires) doesn't need its
+# own event - and the outcomes are checked as the replay goes, so a journal that doesn't match the world is caught
+# Writing never holds up the game: the world hands each event to a writer thread, which encodes everything that has
+# built up and appends it to the file every `flush_seconds`, so a crash loses at most that much
+# The journal would grow forever, so every `compact_ticks` ticks it is compacted: the world's whole state is written
+# as a snapshot to a new file, which replaces the journal, and events carry on after it. A journal is always a
+# snapshot followed by the events since
+# If the journal can't be written (e.g. the disk is full), the writer stops writing and keeps the error, and the world
+# stops at its next tick rather than carrying on with changes that aren't recorded (see `JournaledWorld.tick`)
+# File format: the magic bytes, a version (2 bytes, big endian), then records, each a varint length then:
+# - the event kind byte
+# - the number of values (varint), then each value (see `write_value`)
+# - the number of draws (varint), then each draw (varint)
+# A record cut short by a crash mid-write ends the journal
+# E.g. `python server.py --journal world.journal`, then `python journal.py world.journal --tick 500` for the world
+# at tick 500 (any tick since the journal was last compacted), or `python journal.py world.journal --benchmark` to
+# time replaying every tick
+
+magic = b'STARJRNL'
+journal_version = 1
+
+# Event kinds
+EVENT_SNAPSHOT = 0   # [world state as JSON] - always first (see `world_state`)
+EVENT_TICK = 1       # [tick]
+EVENT_JOIN = 2       # [player record as JSON, map name, x, y, next id]
+EVENT_LEAVE = 3      # [player id]
+EVENT_MOVE = 4       # [player id, direction index, moved]
+EVENT_TRANSPORT = 5  # [player id, x, y, map name after]
+EVENT_GATHER = 6     # [player id, x, y, resources gathered, xp gained]
+EVENT_USE = 7        # [player id, tool title, resource title, xp gained]
+EVENT_BUY = 8        # [player id, x, y, item title, amount asked for, amount bought, gold paid]
+EVENT_SELL = 9       # [player id, x, y, item title, amount asked for, amount sold, gold made]
+EVENT_DEPOSIT = 10   # [player id, item title, amount asked for, amount deposited]
+EVENT_WITHDRAW = 11  # [player id, item title, amount asked for, amount withdrawn]
+
+event_names = {
+    EVENT_SNAPSHOT: 'snapshot', EVENT_TICK: 'tick', EVENT_JOIN: 'join', EVENT_LEAVE: 'leave', EVENT_MOVE: 'move',
+    EVENT_TRANSPORT: 'transport', EVENT_GATHER: 'gather', EVENT_USE: 'use', EVENT_BUY: 'buy', EVENT_SELL: 'sell',
+    EVENT_DEPOSIT: 'deposit', EVENT_WITHDRAW: 'withdraw'
+}
+
+direction_names = list(directions)
+
+# Entities other than players are saved by the title of the tile type they're displayed as
+entity_tile_types = {tile_type.title: tile_type for tile_type in code_to_feature.values() if issubclass(tile_type, NPC)}
+entity_tile_types[Fire.title] = Fire
+
+
+def world_state(world):
+    # Everything about the world that changes as it runs, as plain data (a snapshot to compact the journal to)
+    # It's all copied out, so the writer thread can encode it while the world carries on
+
+    maps = {}
+    for map_name, world_map in world.maps.items():
+        maps[map_name] = {
+            'nodes': [[x, y, node.health, node.ticks_left] for (x, y), node in world_map.nodes.items()],
+            'entities': [
+                [entity.id, entity.kind, None if entity.tile_type is None else entity.tile_type.title,
+                 entity.x, entity.y, entity.initial_x, entity.initial_y, entity.ticks_left]
+                for entity in world_map.entities.values()
+            ],
+            'shops': [
+                [x, y, [
+                    [index, item_type.title, int(stock.stock[index]), int(stock.base_stock[index]),
+                     int(stock.ticks_since_change[index])]
+                    for index, item_type in enumerate(stock.item_types) if item_type is not None
+                ]]
+                for (x, y), stock in world_map.shops.items()
+            ]
+        }
+
+    return {
+        'ticks': world.ticks,
+        'next_id': world.next_id,
+        'maps': maps,
+        'players': [[player.record(), player.map_name] for player in world.players.values()],
+        'bank': world.bank_state()
+    }
+
+
+def restore_world(world, state):
+    # Put a snapshot (see `world_state`) into a world loaded from the same maps, replacing what's there
+
+    world.ticks = state['ticks']
+    world.next_id = state['next_id']
+
+    for map_name, map_state in state['maps'].items():
+
+        world_map = world.maps[map_name]
+
+        for x, y, health, ticks_left in map_state['nodes']:
+            world_map.nodes[(x, y)].health = health
+            world_map.nodes[(x, y)].ticks_left = ticks_left
+
+        for entity_id in list(world_map.entities):
+            world_map.remove_entity(entity_id)
+
+        for entity_id, kind, title, x, y, initial_x, initial_y, ticks_left in map_state['entities']:
+            entity = Entity(entity_id, kind, None if title is None else entity_tile_types[title], x, y)
+            entity.initial_x, entity.initial_y = initial_x, initial_y
+            entity.ticks_left = ticks_left
+            world_map.add_entity(entity)
+
+        for x, y, entries in map_state['shops']:
+            world_map.shops[(x, y)].restore([
+                (index, title_to_item_type[title], stock, base_stock, ticks)
+                for index, title, stock, base_stock, ticks in entries
+            ])
+
+    world.players = {}
+    for record, map_name in state['players']:
+        world.players[record['id']] = player_from_record(record, map_name)
+
+    world.bank_storage.restore([
+        (index, title_to_item_type[title], quantity) for index, title, quantity in state['bank']
+    ])
+
+
+def total_experience(player):
+
+    return sum(player.experience.values())
+
+
+class JournaledWorld(World):
+    # A world that records every command it runs to a journal, once `start_journal()` is called
+    # Until then it runs like any world, e.g. while being recovered from the journal it will then carry on
+
+    def __init__(self, compact_ticks=3600, **world_arguments):
+
+        super().__init__(**world_arguments)
+
+        self.journal = None
+        self.compact_ticks = compact_ticks
+
+    def start_journal(self, journal):
+        # Start recording to a journal writer, which is first compacted to the world as it is now
+
+        self.journal = journal
+        self.journal.compact(world_state(self))
+
+    def begin(self):
+        # Start collecting the random draws of the command about to run
+
+        if self.journal is not None:
+            self.chance.draws = []
+
+    def end(self, kind, values):
+        # Record the command that's run, with its outcome (`values`) and the draws it made
+
+        if self.journal is not None:
+            self.journal.append(kind, values, self.chance.draws)
+            self.chance.draws = None
+
+    def join(self, player, map_name, x, y):
+
+        self.begin()
+        super().join(player, map_name, x, y)
+        entity = self.entity(player)
+        self.end(EVENT_JOIN, [json.dumps(player.record()), player.map_name, entity.x, entity.y, self.next_id])
+
+    def remove_player(self, player):
+
+        self.begin()
+        super().remove_player(player)
+        self.end(EVENT_LEAVE, [player.id])
+
+    def move(self, player, direction):
+
+        self.begin()
+        moved = super().move(player, direction)
+        self.end(EVENT_MOVE, [player.id, direction_names.index(direction), int(moved)])
+
+        return moved
+
+    def transport(self, player, x, y):
+
+        self.begin()
+        message = super().transport(player, x, y)
+        self.end(EVENT_TRANSPORT, [player.id, x, y, player.map_name])
+
+        return message
+
+    def gather(self, player, x, y):
+
+        self.begin()
+        space, experience = player.space_for(), total_experience(player)
+        outcome = super().gather(player, x, y)
+        self.end(EVENT_GATHER, [player.id, x, y, space - player.space_for(), total_experience(player) - experience])
+
+        return outcome
+
+    def use(self, player, tool_type, resource_type):
+
+        self.begin()
+        experience = total_experience(player)
+        message = super().use(player, tool_type, resource_type)
+        self.end(EVENT_USE, [player.id, tool_type.title, resource_type.title, total_experience(player) - experience])
+
+        return message
+
+    def buy(self, player, x, y, item_type, amount):
+
+        self.begin()
+        count, gold = player.count(item_type), player.gold
+        message = super().buy(player, x, y, item_type, amount)
+        self.end(EVENT_BUY, [
+            player.id, x, y, item_type.title, amount, player.count(item_type) - count, gold - player.gold
+        ])
+
+        return message
+
+    def sell(self, player, x, y, item_type, amount):
+
+        self.begin()
+        count, gold = player.count(item_type), player.gold
+        message = super().sell(player, x, y, item_type, amount)
+        self.end(EVENT_SELL, [
+            player.id, x, y, item_type.title, amount, count - player.count(item_type), player.gold - gold
+        ])
+
+        return message
+
+    def deposit(self, player, item_type, amount):
+
+        self.begin()
+        count = player.count(item_type)
+        message = super().deposit(player, item_type, amount)
+        self.end(EVENT_DEPOSIT, [player.id, item_type.title, amount, count - player.count(item_type)])
+
+        return message
+
+    def withdraw(self, player, item_type, amount):
+
+        self.begin()
+        count = player.count(item_type)
+        message = super().withdraw(player, item_type, amount)
+        self.end(EVENT_WITHDRAW, [player.id, item_type.title, amount, player.count(item_type) - count])
+
+        return message
+
+    def tick(self):
+
+        if self.journal is not None and self.journal.error is not None:
+            raise RuntimeError("Journal stopped: %s" % self.journal.error)
+
+        self.begin()
+        super().tick()
+        self.end(EVENT_TICK, [self.ticks])
+
+        if self.journal is not None and self.ticks % self.compact_ticks == 0:
+            self.journal.compact(world_state(self))
+
+
+def encode_event(writer, kind, values, draws):
+    # One record, as a view of the writer's buffer (see `Writer.frame`), to write out before encoding the next
+
+    writer.reset(length_room)
+
+    writer.byte(kind)
+    writer.varint(len(values))
+    for value in values:
+        write_value(writer, value)
+    writer.varint(len(draws))
+    for draw in draws:
+        writer.varint(draw)
+
+    return writer.frame(length_room)
+
+
+def read_events(path):
+    # Every event in a journal, in order, as (kind, values, draws)
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    header_size = len(magic) + 2
+
+    assert data[:len(magic)] == magic, "%s isn't a journal" % path
+    version, = struct.unpack('>H', data[len(magic):header_size])
+    assert version == journal_version, "Journal is version %s, but this reads version %s" % (version, journal_version)
+
+    reader = Reader(data, header_size)
+
+    while reader.position < len(data):
+
+        try:
+            length = reader.varint()
+        except IndexError:
+            return
+
+        end = reader.position + length
+        if end > len(data):
+            # Cut short by a crash while it was written
+            return
+
+        kind = reader.byte()
+        values = [read_value(reader) for i in range(reader.varint())]
+        draws = [reader.varint() for i in range(reader.varint())]
+
+        assert reader.position == end
+        yield kind, values, draws
+
+
+class JournalWriter:
+    # The writer thread of a journal (see the top). The world calls `append()` with each event and `compact()`
+    # with a snapshot of its state; both return straight away. `close()` waits for everything to be written
+    # `error` says why the journal couldn't be written, or is None. Once set, nothing more is written, and what's
+    # handed to the writer is dropped
+
+    def __init__(self, path, flush_seconds=0.2):
+
+        self.path = path
+        self.flush_seconds = flush_seconds
+
+        self.pending = queue.SimpleQueue()
+
+        # Counts of events and bytes written, and compactions
+        self.events_written = 0
+        self.bytes_written = 0
+        self.compactions = 0
+        self.error = None
+
+        self.worker = threading.Thread(target=self.run_writes, daemon=True)
+        self.worker.start()
+
+    def append(self, kind, values, draws):
+
+        self.pending.put((kind, values, draws))
+
+    def compact(self, state):
+
+        self.pending.put(state)
+
+    def close(self):
+
+        self.pending.put(None)
+        self.worker.join()
+
+    def run_writes(self):
+
+        writer = Writer()
+        f = None
+
+        while True:
+
+            batch = [self.pending.get()]
+
+            while True:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            if self.error is None:
+                try:
+                    f = self.write_batch(writer, f, batch)
+
+                except OSError as e:
+                    self.error = "couldn't write %s (%s)" % (self.path, e.strerror or e)
+                    print("Journal stopped: %s" % self.error, file=sys.stderr)
+
+                    if f is not None:
+                        try:
+                            f.close()
+                        except OSError:
+                            pass
+                        f = None
+
+            if None in batch:
+                if f is not None:
+                    f.close()
+                break
+
+            # Let events build up, so they're written a batch at a time
+            time.sleep(self.flush_seconds)
+
+    def write_batch(self, writer, f, batch):
+        # Write the events and snapshots handed over since the last batch, returning the journal file now open
+
+        for item in batch:
+
+            if isinstance(item, dict):
+                # Everything before the snapshot is in it, so start the journal again from it
+                if f is not None:
+                    f.close()
+                self.write_snapshot(writer, item)
+                f = open(self.path, 'ab')
+
+            elif item is not None:
+                with encode_event(writer, *item) as record:
+                    f.write(record)
+                    self.bytes_written += len(record)
+                self.events_written += 1
+
+        f.flush()
+        return f
+
+    def write_snapshot(self, writer, state):
+        # Write a new journal of just the snapshot, then swap it in for the old one
+
+        temporary_path = self.path + '.tmp'
+
+        with open(temporary_path, 'wb') as f:
+            f.write(magic + struct.pack('>H', journal_version))
+            with encode_event(writer, EVENT_SNAPSHOT, [json.dumps(state)], []) as record:
+                f.write(record)
+                self.bytes_written += len(record)
+
+        os.replace(temporary_path, self.path)
+
+        self.compactions += 1
+
+
+def replay_event(world, kind, values, draws):
+    # Run one event's command on the world again, with the draws it made, and check the outcome is the same
+
+    world.chance.replay = iter(draws)
+
+    if kind == EVENT_SNAPSHOT:
+        restore_world(world, json.loads(values[0]))
+
+    elif kind == EVENT_TICK:
+        world.tick()
+        assert world.ticks == values[0], "Journal ticks out of order"
+
+    elif kind == EVENT_JOIN:
+        record, map_name, x, y, next_id = values
+        world.join(player_from_record(json.loads(record), map_name), map_name, x, y)
+        world.next_id = next_id
+
+    else:
+
+        player = world.players[values[0]]
+
+        if kind == EVENT_LEAVE:
+            world.remove_player(player)
+            outcome = []
+
+        elif kind == EVENT_MOVE:
+            outcome = [int(world.move(player, direction_names[values[1]]))]
+
+        elif kind == EVENT_TRANSPORT:
+            world.transport(player, values[1], values[2])
+            world.take_departures()
+            outcome = [player.map_name]
+
+        elif kind == EVENT_GATHER:
+            space, experience = player.space_for(), total_experience(player)
+            world.gather(player, values[1], values[2])
+            outcome = [space - player.space_for(), total_experience(player) - experience]
+
+        elif kind == EVENT_USE:
+            experience = total_experience(player)
+            world.use(player, title_to_item_type[values[1]], title_to_item_type[values[2]])
+            outcome = [total_experience(player) - experience]
+
+        elif kind in (EVENT_BUY, EVENT_SELL):
+            item_type = title_to_item_type[values[3]]
+            count, gold = player.count(item_type), player.gold
+            if kind == EVENT_BUY:
+                world.buy(player, values[1], values[2], item_type, values[4])
+                outcome = [player.count(item_type) - count, gold - player.gold]
+            else:
+                world.sell(player, values[1], values[2], item_type, values[4])
+                outcome = [count - player.count(item_type), player.gold - gold]
+
+        elif kind in (EVENT_DEPOSIT, EVENT_WITHDRAW):
+            item_type = title_to_item_type[values[1]]
+            count = player.count(item_type)
+            if kind == EVENT_DEPOSIT:
+                world.deposit(player, item_type, values[2])
+                outcome = [count - player.count(item_type)]
+            else:
+                world.withdraw(player, item_type, values[2])
+                outcome = [player.count(item_type) - count]
+
+        else:
+            raise ValueError("Unknown event kind %s" % kind)
+
+        assert outcome == values[len(values) - len(outcome):], "Replaying %s at tick %s didn't match the journal" % (
+            event_names[kind], world.ticks
+        )
+
+    assert next(world.chance.replay, None) is None, "%s at tick %s drew less than the journal" % (
+        event_names[kind], world.ticks
+    )
+    world.chance.replay = None
+
+
+def replay(path, world, until_tick=None, on_event=None):
+    # Replay a journal into a world loaded from the same maps, up to the end of tick `until_tick` (or to the end)
+    # `on_event` is called with each event before it's replayed
+    # The journal only goes back to the snapshot it was last compacted to, so raises a ValueError if `until_tick` is
+    # before that
+
+    for kind, values, draws in read_events(path):
+
+        if kind == EVENT_TICK and until_tick is not None and values[0] > until_tick:
+            break
+
+        if on_event is not None:
+            on_event(kind, values, draws)
+
+        replay_event(world, kind, values, draws)
+
+        if kind == EVENT_SNAPSHOT and until_tick is not None and world.ticks > until_tick:
+            raise ValueError("Journal was compacted at tick %s, so can't be replayed to tick %s" % (
+                world.ticks, until_tick
+            ))
+
+    return world
+
+
+def recover(world, path):
+    # Recover a server's world from its journal after a crash or restart: the maps, shops and bank carry on as they
+    # were. The players in it had their connections go with the server, so they're taken out
+
+    replay(path, world)
+
+    for player in list(world.players.values()):
+        world.remove_player(player)
+
+
+def describe(world):
+    # Summary of a world's state, for the replay tool
+
+    lines = ["Tick %s" % world.ticks]
+
+    for player in sorted(world.players.values(), key=lambda player: player.id):
+        entity = world.entity(player)
+        items = {}
+        for item in player.inventory:
+            if item is not None:
+                items[item.title] = items.get(item.title, 0) + 1
+        lines.append("  %s (#%s) on %s at (%s, %s), %sg, levels %s, inventory %s" % (
+            player.name, player.id, player.map_name, entity.x, entity.y, player.gold,
+            ", ".join("%s %s" % (skill_type.title, player.level(skill_type)) for skill_type in skill_types),
+            ", ".join("%s x%s" % (title, count) for title, count in sorted(items.items())) or "empty"
+        ))
+
+    for map_name, world_map in sorted(world.maps.items()):
+        lines.append("  %s: %s/%s trees/rocks depleted, %s fires, %s players" % (
+            map_name, sum(1 for node in world_map.nodes.values() if node.health == 0), len(world_map.nodes),
+            sum(1 for entity in world_map.entities.values() if entity.tile_type is Fire),
+            sum(1 for entity in world_map.entities.values() if entity.kind == PLAYER)
+        ))
+
+    bank = ["%s x%s" % (title, quantity) for index, title, quantity in world.bank_state()]
+    lines.append("  Bank: %s" % (", ".join(bank) or "empty"))
+
+    return "\n".join(lines)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Replay a world event journal")
+    parser.add_argument('journal')
+    parser.add_argument('--tick', type=int, default=None, help="replay up to the end of this tick (default: all)")
+    parser.add_argument('--events', action='store_true', help="print every event as it's replayed")
+    parser.add_argument('--benchmark', action='store_true', help="time replaying each tick and its events")
+    args = parser.parse_args()
+
+    world = World()
+
+    counts = {}
+    tick_seconds = []
+    tick_start = [None]
+
+    def on_event(kind, values, draws):
+
+        counts[event_names[kind]] = counts.get(event_names[kind], 0) + 1
+
+        if args.events:
+            print("%6s %-9s %s%s" % (world.ticks, event_names[kind], values if kind != EVENT_SNAPSHOT else '',
+                                     " draws %s" % draws if draws else ""))
+
+        # A tick's time is the world tick and the events until the next one, like the server's tick
+        if kind == EVENT_TICK:
+            if tick_start[0] is not None:
+                tick_seconds.append(time.perf_counter() - tick_start[0])
+            tick_start[0] = time.perf_counter()
+
+    start = time.perf_counter()
+    try:
+        replay(args.journal, world, until_tick=args.tick, on_event=on_event)
+    except ValueError as e:
+        parser.error(str(e))
+    seconds = time.perf_counter() - start
+
+    if tick_start[0] is not None:
+        tick_seconds.append(time.perf_counter() - tick_start[0])
+
+    print(describe(world))
+    print("Events: %s" % ", ".join("%s %s" % (name, count) for name, count in sorted(counts.items())))
+
+    if args.benchmark and tick_seconds:
+        print("Replayed %s ticks in %.2fs (%.0f ticks a second)" % (
+            len(tick_seconds), seconds, len(tick_seconds) / seconds
+        ))
+        print("Tick ms p50/p95/p99/max: %s" % "/".join(
+            "%.3f" % (1000 * value) for value in list(np.percentile(tick_seconds, [50, 95, 99])) + [max(tick_seconds)]
+        ))
+
+
+if __name__ == '__main__':
+    main()
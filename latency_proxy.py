@@ -0,0 +1,68 @@
+import asyncio
+import argparse
+
+# Proxy between multiplayer clients and the server that delays everything sent either way, to try out the game with
+# the latency of a slow network on one machine
+# E.g. with the server on port 8765, `python latency_proxy.py --port 8766 --delay 100`, then connect clients to
+# port 8766: `python client.py --port 8766 --name alice`
+
+
+class LatencyProxy:
+
+    def __init__(self, server_host, server_port, delay_seconds):
+
+        self.server_host = server_host
+        self.server_port = server_port
+        self.delay_seconds = delay_seconds
+
+    async def pipe(self, reader, writer):
+        # Forward what's read to the writer `delay_seconds` later
+        # Every chunk is delayed by the same amount, so they arrive in the order they were read
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            loop.call_later(self.delay_seconds, writer.write, data)
+
+        loop.call_later(self.delay_seconds, writer.close)
+
+    async def handle_client(self, client_reader, client_writer):
+
+        server_reader, server_writer = await asyncio.open_connection(self.server_host, self.server_port)
+
+        await asyncio.gather(
+            self.pipe(client_reader, server_writer),
+            self.pipe(server_reader, client_writer),
+            return_exceptions=True
+        )
+
+    async def serve(self, host, port):
+
+        server = await asyncio.start_server(self.handle_client, host, port)
+
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Delay traffic between multiplayer clients and the server")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8766, help="port clients connect to")
+    parser.add_argument('--server-host', default='localhost')
+    parser.add_argument('--server-port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=100, help="milliseconds added each way")
+    args = parser.parse_args()
+
+    proxy = LatencyProxy(args.server_host, args.server_port, args.delay / 1000)
+    print("Forwarding %s:%s to %s:%s with %sms delay each way" % (
+        args.host, args.port, args.server_host, args.server_port, args.delay
+    ))
+    asyncio.run(proxy.serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
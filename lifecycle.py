@@ -0,0 +1,80 @@
+from collections import Counter
+from PyQt5.QtWidgets import QApplication
+
+
+class WidgetLifecycle:
+    # Owns the game timer connections of widgets that can leave the game while it's running, e.g. tiles swapped out of
+    # a map, or displays dropped from the main game display, so that they're cleaned up deterministically
+    # A widget that's only detached with setParent(None) or close() is never deleted, and if the game timer is still
+    # connected to one of its slots it stays referenced and keeps receiving ticks forever (like a fire that's gone out)
+    # Instead, connect any timer slots through `connect_timer`, and when the widget leaves the game either:
+    # - `disconnect_timer` it, if it's going back into a pool to be re-used (pools with a lifecycle do this on release)
+    # - `retire` it, which disconnects its timer slots, detaches it and schedules it for deletion
+    # Pools are registered here too, so we can print one report of live widget counts by class and pool usage,
+    # to check the number of widgets stays flat over a long session
+
+    def __init__(self, timer):
+
+        self.timer = timer
+
+        # Mapping from widget to the list of its slots we've connected to the game timer
+        self.widget_to_timer_slots = {}
+
+        # Mapping from a name to a pool of widgets, to include in the report
+        self.pools = {}
+
+        self.retired = 0
+
+    def connect_timer(self, widget, slot):
+        # Connect `slot` (a method of `widget`) to the game timer, and keep track of it to disconnect later
+
+        self.timer.timeout.connect(slot)
+
+        if widget not in self.widget_to_timer_slots:
+            self.widget_to_timer_slots[widget] = []
+        self.widget_to_timer_slots[widget].append(slot)
+
+    def disconnect_timer(self, widget):
+        # Disconnect every timer slot we connected for this widget (if any)
+
+        for slot in self.widget_to_timer_slots.pop(widget, []):
+            self.timer.timeout.disconnect(slot)
+
+    def retire(self, widget):
+        # The widget has left the game for good - disconnect it from the timer and schedule it for deletion
+
+        self.disconnect_timer(widget)
+
+        widget.setParent(None)
+        widget.deleteLater()
+
+        self.retired += 1
+
+    def register_pool(self, name, pool):
+
+        self.pools[name] = pool
+
+    def live_widget_counts(self):
+        # Count every widget that currently exists in the application, by class name
+
+        return Counter(type(widget).__name__ for widget in QApplication.allWidgets())
+
+    def report(self):
+        # Multi-line debug report of live widgets by class, timer connections we own, and pool usage
+
+        live_widget_counts = self.live_widget_counts()
+
+        lines = ["Live widgets: %s" % sum(live_widget_counts.values())]
+        for class_name, count in live_widget_counts.most_common():
+            lines.append("    %s: %s" % (class_name, count))
+
+        lines.append("Widgets connected to timer: %s (%s slots)" % (
+            len(self.widget_to_timer_slots), sum(len(slots) for slots in self.widget_to_timer_slots.values())
+        ))
+        lines.append("Widgets retired: %s" % self.retired)
+
+        lines.append("Pools:")
+        for name in self.pools:
+            lines.append("    %s: %s" % (name, self.pools[name]))
+
+        return '\n'.join(lines)
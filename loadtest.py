@@ -0,0 +1,550 @@
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import itertools
+import subprocess
+import multiprocessing
+import numpy as np
+from collections import deque
+from world import WorldMap, Chance, directions
+from protocol import encode, split_frames, decode_snapshot, item_types, FRAME_MESSAGE, FRAME_SNAPSHOT
+
+# Load test for the multiplayer server (see `server.py`): how many players can one server hold?
+# Starts a server on localhost, then ramps up through a number of bots, e.g. 10, then 25, then 50, ... Bots are
+# headless clients, run on asyncio loops in one or more processes, that play the game through the real protocol:
+# they walk (finding paths over the map's static tiles from `maps/*.json`), gather from trees and rocks, bank what they
+# gathered, and trade at shops, over and over
+# For each number of bots, once they've settled in, it reports:
+# - percentiles of how long game ticks and flushes take on the server, and how late ticks start
+# - the server process's CPU use and peak memory
+# - bytes a second sent to each client
+# - action latency: from a bot sending a move to getting the snapshot with it in, and from sending a bank/shop
+#   intent to getting the reply
+# E.g. `python loadtest.py --bots 10,50,100,200 --processes 2 --step-seconds 30`
+
+# What bots can gather from with the tools they start with
+gatherable_titles = ['Oak Tree', 'Copper Rock', 'Tin Rock']
+
+# Items bots gather, and so bank and sell
+resource_titles = ['Oak Log', 'Copper Ore', 'Tin Ore']
+
+
+def load_static_map(map_name):
+    # A map bots find their way around - the server's model of it, of which bots only use the static tiles
+
+    with open('maps/%s.json' % map_name) as f:
+        return WorldMap(map_name, json.load(f), itertools.count(1).__next__, Chance())
+
+
+def path_next_to(world_map, start, targets):
+    # Shortest path, as a list of directions, from `start` to a tile next to any of the target positions
+    # The path only avoids static tiles - bots step around players and NPCs when they get stuck
+    # Returns None if there's no way there
+
+    def walkable(x, y):
+        return world_map.in_bounds(x, y) and world_map.tiles[y][x] is None
+
+    goals = set(
+        (x + dx, y + dy) for x, y in targets for dx, dy in directions.values() if walkable(x + dx, y + dy)
+    )
+
+    queue = deque([start])
+    previous = {start: None}
+
+    while queue:
+
+        position = queue.popleft()
+
+        if position in goals:
+            path = []
+            while previous[position] is not None:
+                position, direction = previous[position]
+                path.append(direction)
+            return path[::-1]
+
+        for direction, (dx, dy) in directions.items():
+            next_position = (position[0] + dx, position[1] + dy)
+            if next_position not in previous and walkable(*next_position):
+                previous[next_position] = (position, direction)
+                queue.append(next_position)
+
+    return None
+
+
+class Recorder:
+    # Measurements from one process's bots, kept for each step of the ramp
+    # Only what happens in a step's measuring window (after the bots have settled in) counts
+
+    def __init__(self, windows):
+
+        # (start, end) times of each step's measuring window, by `time.time()`
+        self.windows = windows
+
+        self.move_latency = [[] for window in windows]
+        self.action_latency = [[] for window in windows]
+        self.bytes_received = [0] * len(windows)
+        self.errors = [0] * len(windows)
+
+    def step(self):
+        # Index of the step whose measuring window we're in, or None
+
+        now = time.time()
+
+        for index, (start, end) in enumerate(self.windows):
+            if start <= now < end:
+                return index
+
+    def record(self, measurements, value):
+
+        index = self.step()
+        if index is not None:
+            measurements[index].append(value)
+
+    def received(self, amount):
+
+        index = self.step()
+        if index is not None:
+            self.bytes_received[index] += amount
+
+    def error(self):
+
+        index = self.step()
+        if index is not None:
+            self.errors[index] += 1
+
+
+class Bot:
+    # A headless player: keeps track of its own state from the server's snapshots, and plays the game in a loop of
+    # gathering, banking and trading
+
+    def __init__(self, name, host, port, maps, recorder, move_interval, gather_seconds, reply_timeout=5.0):
+
+        self.name = name
+        self.host = host
+        self.port = port
+        self.maps = maps
+        self.recorder = recorder
+        self.move_interval = move_interval
+        self.gather_seconds = gather_seconds
+        self.reply_timeout = reply_timeout
+
+        self.player_id = None
+        self.map_name = None
+        self.snapshots = {}
+        self.snapshot = None
+
+        # Moves sent, by seq, with the time they were sent, until a snapshot shows the server applied them
+        self.move_seq = 0
+        self.move_sent = {}
+
+        # Set when a snapshot or a reply to a bank/shop intent comes in
+        self.snapshot_arrived = asyncio.Event()
+        self.reply_arrived = asyncio.Event()
+        self.reply_sent = None
+
+        # Task reading the server's frames while connected, cancelled when the bot stops
+        self.read_task = None
+
+    def send(self, message):
+
+        self.writer.write(encode(message))
+
+    async def read_frames(self):
+
+        received = bytearray()
+
+        while True:
+
+            data = await self.reader.read(65536)
+            if not data:
+                break
+
+            self.recorder.received(len(data))
+            received.extend(data)
+
+            for kind, payload in split_frames(received):
+                if kind == FRAME_SNAPSHOT:
+                    self.handle_snapshot(payload)
+                elif kind == FRAME_MESSAGE:
+                    self.handle_message(json.loads(payload))
+
+    def handle_snapshot(self, payload):
+
+        seq, baseline_seq, tick, snapshot = decode_snapshot(payload, self.snapshots)
+
+        for old_seq in [old_seq for old_seq in self.snapshots if old_seq < baseline_seq]:
+            del self.snapshots[old_seq]
+
+        self.snapshots[seq] = snapshot
+        self.snapshot = snapshot
+        self.send({'type': 'ack', 'seq': seq})
+
+        now = time.perf_counter()
+        for move_seq in [move_seq for move_seq in self.move_sent if move_seq <= snapshot.move_seq]:
+            self.recorder.record(self.recorder.move_latency, now - self.move_sent.pop(move_seq))
+
+        self.snapshot_arrived.set()
+
+    def handle_message(self, message):
+
+        if message['type'] == 'welcome':
+            self.player_id = message['player']
+
+        elif message['type'] == 'map':
+            self.map_name = message['map']
+            self.snapshots = {}
+            self.snapshot = None
+
+        if message['type'] in ('message', 'bank', 'shop') and self.reply_sent is not None:
+            self.recorder.record(self.recorder.action_latency, time.perf_counter() - self.reply_sent)
+            self.reply_sent = None
+            self.reply_arrived.set()
+
+    def position(self):
+
+        code, x, y = self.snapshot.entities[self.player_id]
+        return x, y
+
+    def inventory_titles(self):
+
+        return [item_types[code].title for code in self.snapshot.inventory if code != 0]
+
+    async def wait_for_snapshot(self, condition, timeout):
+        # Wait until the latest snapshot meets the condition, returning if it did
+
+        deadline = time.perf_counter() + timeout
+
+        while self.snapshot is None or not condition():
+
+            self.snapshot_arrived.clear()
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+
+            try:
+                await asyncio.wait_for(self.snapshot_arrived.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+
+        return True
+
+    async def move(self, direction):
+        # Move one tile, returning if the player moved
+
+        before = self.position()
+
+        self.move_seq += 1
+        seq = self.move_seq
+        self.move_sent[seq] = time.perf_counter()
+        self.send({'type': 'move', 'direction': direction, 'seq': seq})
+
+        await self.wait_for_snapshot(lambda: self.snapshot.move_seq >= seq, self.reply_timeout)
+        await asyncio.sleep(self.move_interval)
+
+        return self.position() != before
+
+    async def request(self, intent):
+        # Send a bank/shop intent and wait for the server's reply
+
+        self.reply_arrived.clear()
+        self.reply_sent = time.perf_counter()
+        self.send(intent)
+
+        try:
+            await asyncio.wait_for(self.reply_arrived.wait(), self.reply_timeout)
+        except asyncio.TimeoutError:
+            self.reply_sent = None
+            self.recorder.error()
+
+    async def walk_next_to(self, targets, maximum_moves=200):
+        # Walk to a tile next to one of the targets, returning the target reached (or None if we couldn't)
+
+        for i in range(maximum_moves):
+
+            x, y = self.position()
+            for target in targets:
+                if abs(target[0] - x) + abs(target[1] - y) == 1:
+                    return target
+
+            path = path_next_to(self.maps[self.map_name], (x, y), targets)
+
+            if path is None or not await self.move(path[0]):
+                # Someone's in the way (or boxed us in) - step aside
+                await self.move(random.choice(list(directions)))
+
+        return None
+
+    async def gather(self):
+
+        world_map = self.maps[self.map_name]
+        title = random.choice(gatherable_titles)
+        targets = [position for position, node in world_map.nodes.items() if node.tile_type.title == title]
+
+        target = await self.walk_next_to(random.sample(targets, min(5, len(targets))))
+        if target is None:
+            return
+
+        self.send({'type': 'interact', 'x': target[0], 'y': target[1]})
+
+        await self.wait_for_snapshot(lambda: 0 not in self.snapshot.inventory, self.gather_seconds)
+
+    async def bank(self):
+
+        world_map = self.maps[self.map_name]
+        chests = [
+            (x, y) for y, row in enumerate(world_map.tiles) for x, tile_type in enumerate(row)
+            if tile_type is not None and tile_type.title == 'Bank Chest'
+        ]
+
+        target = await self.walk_next_to(chests)
+        if target is None:
+            return
+
+        await self.request({'type': 'interact', 'x': target[0], 'y': target[1]})
+
+        deposited = [title for title in resource_titles if title in self.inventory_titles()]
+        for title in deposited:
+            await self.request({'type': 'deposit', 'item': title, 'amount': 28})
+
+        # Take one back out, to sell
+        if deposited:
+            await self.request({'type': 'withdraw', 'item': random.choice(deposited), 'amount': 1})
+
+    async def trade(self):
+
+        world_map = self.maps[self.map_name]
+
+        target = await self.walk_next_to(random.sample(list(world_map.shops), 1))
+        if target is None:
+            return
+
+        await self.request({'type': 'interact', 'x': target[0], 'y': target[1]})
+        if not await self.wait_for_snapshot(lambda: len(self.snapshot.shop) > 0, self.reply_timeout):
+            return
+
+        for title in set(self.inventory_titles()):
+            if title in resource_titles:
+                await self.request({'type': 'sell', 'x': target[0], 'y': target[1], 'item': title, 'amount': 28})
+
+        # Buy the cheapest thing in the shop, and sell it straight back
+        code, quantity, price = min(self.snapshot.shop.values(), key=lambda entry: entry[2])
+        title = item_types[code].title
+        await self.request({'type': 'buy', 'x': target[0], 'y': target[1], 'item': title, 'amount': 1})
+        await self.request({'type': 'sell', 'x': target[0], 'y': target[1], 'item': title, 'amount': 1})
+
+    async def run(self):
+
+        try:
+
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.send({'type': 'hello', 'name': self.name})
+            self.read_task = asyncio.create_task(self.read_frames())
+
+            await self.wait_for_snapshot(lambda: self.player_id in self.snapshot.entities, self.reply_timeout)
+
+            while True:
+                await self.gather()
+                await self.bank()
+                await self.trade()
+
+        except (ConnectionError, KeyError, asyncio.TimeoutError):
+            self.recorder.error()
+
+        except Exception as e:
+            # Anything else is a bug in the bot, but it still stopped playing, so it's counted and logged rather than
+            # lost in the gathered results
+            self.recorder.error()
+            print("Bot %s stopped: %s: %s" % (self.name, e.__class__.__name__, e), file=sys.stderr)
+
+        finally:
+            if self.read_task is not None:
+                self.read_task.cancel()
+            if hasattr(self, 'writer'):
+                self.writer.close()
+
+
+def bots_in_process(process_index, processes, bots):
+    # This process's share of a number of bots
+
+    return bots // processes + (1 if process_index < bots % processes else 0)
+
+
+async def run_bots(process_index, args, steps, starts, windows, until):
+    # Add bots as each step of the ramp starts, until this process's share of the step's bots are playing
+
+    recorder = Recorder(windows)
+    maps = {map_name: load_static_map(map_name) for map_name in ['surface', 'cave', 'lower_cave']}
+
+    tasks = []
+
+    for step_bots, start in zip(steps, starts):
+
+        await asyncio.sleep(max(0.0, start - time.time()))
+
+        for i in range(len(tasks), bots_in_process(process_index, args.processes, step_bots)):
+            bot = Bot(
+                'bot%s-%s' % (process_index, i), args.host, args.port, maps, recorder,
+                args.move_interval, args.gather_seconds
+            )
+            tasks.append(asyncio.create_task(bot.run()))
+
+            # Spread out connecting, rather than all at once
+            await asyncio.sleep(args.connect_interval)
+
+    # Bots stop wherever they are when the last step ends
+    await asyncio.sleep(max(0.0, until - time.time()))
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return recorder
+
+
+def bot_process(process_index, args, steps, starts, windows, until, results):
+
+    random.seed(args.seed + process_index)
+
+    recorder = asyncio.run(run_bots(process_index, args, steps, starts, windows, until))
+    results.put((recorder.move_latency, recorder.action_latency, recorder.bytes_received, recorder.errors))
+
+
+def request_stats(host, port, reset):
+    # Ask the server for its stats (see `ServerStats`)
+
+    with socket.create_connection((host, port)) as connection:
+
+        connection.sendall(encode({'type': 'stats', 'reset': reset}))
+
+        received = bytearray()
+        while True:
+            data = connection.recv(65536)
+            if not data:
+                break
+            received.extend(data)
+
+    kind, payload = split_frames(received)[0]
+    return json.loads(payload)['stats']
+
+
+def wait_for_server(host, port, timeout=10.0):
+
+    deadline = time.time() + timeout
+
+    while True:
+        try:
+            socket.create_connection((host, port)).close()
+            return
+        except ConnectionError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def percentiles(values):
+
+    if not values:
+        return "-"
+
+    return "/".join("%.1f" % (1000 * value) for value in np.percentile(values, [50, 95, 99]))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Load test the multiplayer server with a ramp of bots")
+    parser.add_argument('--bots', default='10,25,50,100', help="comma separated numbers of bots to ramp through")
+    parser.add_argument('--processes', type=int, default=1, help="processes to run the bots in")
+    parser.add_argument('--step-seconds', type=float, default=30, help="how long each number of bots plays for")
+    parser.add_argument('--settle-seconds', type=float, default=5, help="time at the start of a step not measured")
+    parser.add_argument('--move-interval', type=float, default=0.3, help="seconds bots wait between moves")
+    parser.add_argument('--gather-seconds', type=float, default=15, help="longest bots gather for at a time")
+    parser.add_argument('--connect-interval', type=float, default=0.01, help="seconds between bots connecting")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8799)
+    parser.add_argument('--external-server', action='store_true', help="use a server that's already running")
+    parser.add_argument('--sharded', action='store_true', help="start the sharded server (see `sharded_server.py`)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    steps = [int(bots) for bots in args.bots.split(',')]
+
+    server = None
+    if not args.external_server:
+        server_script = 'sharded_server.py' if args.sharded else 'server.py'
+        server = subprocess.Popen([sys.executable, server_script, '--host', args.host, '--port', str(args.port)],
+                                  stdout=subprocess.DEVNULL)
+
+    try:
+
+        wait_for_server(args.host, args.port)
+
+        # Every process works from the same timetable
+        first_start = time.time() + 1
+        starts = [first_start + i * args.step_seconds for i in range(len(steps))]
+        windows = [(start + args.settle_seconds, start + args.step_seconds) for start in starts]
+        # Bots keep playing a moment after the last step, so it's measured with all of them connected
+        until = first_start + len(steps) * args.step_seconds + 1
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=bot_process, args=(i, args, steps, starts, windows, until, results))
+            for i in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+
+        stats = []
+        for start, end in windows:
+            time.sleep(max(0.0, start - time.time()))
+            request_stats(args.host, args.port, reset=True)
+            time.sleep(max(0.0, end - time.time()))
+            stats.append(request_stats(args.host, args.port, reset=True))
+
+        process_results = [results.get() for process in processes]
+        for process in processes:
+            process.join()
+
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print("%6s %8s %22s %22s %14s %6s %8s %10s %18s %18s %6s" % (
+        "Bots", "Clients", "Tick ms p50/95/99", "Flush ms p50/95/99", "Late ms p99", "CPU%", "RSS MB",
+        "KB/s/bot", "Move ms p50/95/99", "Bank/shop ms", "Errors"
+    ))
+
+    for index, (step_bots, step_stats) in enumerate(zip(steps, stats)):
+
+        move_latency = [value for result in process_results for value in result[0][index]]
+        action_latency = [value for result in process_results for value in result[1][index]]
+        bytes_received = sum(result[2][index] for result in process_results)
+        errors = sum(result[3][index] for result in process_results)
+
+        window_seconds = windows[index][1] - windows[index][0]
+
+        def server_percentiles(key):
+            if step_stats[key] is None:
+                return "-"
+            return "/".join("%.1f" % value for value in step_stats[key][:3])
+
+        print("%6s %8s %22s %22s %14s %6.0f %8s %10.2f %18s %18s %6s" % (
+            step_bots,
+            step_stats['clients'],
+            server_percentiles('tick_ms'),
+            server_percentiles('flush_ms'),
+            "-" if step_stats['tick_lateness_ms'] is None else "%.1f" % step_stats['tick_lateness_ms'][2],
+            step_stats['cpu_percent'],
+            "-" if step_stats['max_rss_kb'] is None else "%.0f" % (step_stats['max_rss_kb'] / 1024),
+            bytes_received / 1024 / max(1, step_bots) / window_seconds,
+            percentiles(move_latency),
+            percentiles(action_latency),
+            errors
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 import json
 import random
 from PyQt5.QtCore import QSize, Qt, pyqtSignal
+from pools import WidgetPool
+from utilities import window_range
 from PyQt5.QtWidgets import QWidget, QGridLayout
 from tiles import code_to_feature, EmptyTile, ShopTile, Interactable, BankChestTile, NPC, TransportTile, Player, Fire
 
@@ -11,10 +13,14 @@ class Map(QWidget):
 
     # Signals emitted whenever we want to change the game display panel to:
     bank_clicked = pyqtSignal()          # - the (only) bank widget, by clicking on bank chest tile
-    shop_clicked = pyqtSignal(object)    # - a (one of possible many unique) shop widgets, by clicking on a shopkeeper
+    shop_clicked = pyqtSignal(object)    # - a (one of possible many unique) shop's stock, by clicking on a shopkeeper
     transport_clicked = pyqtSignal(str, int, int)  # - a different map by clicking on transport tile
 
-    def __init__(self, map_name, path_to_map_json, inventory, skills, timer, status_bar_signal):
+    # Signals emitted to the game's action scheduler:
+    gather_clicked = pyqtSignal(object)  # - start gathering from a tree/rock (emits the tile) by clicking on it
+    player_moved = pyqtSignal()          # - cancel whatever the player was doing, as they moved
+
+    def __init__(self, map_name, path_to_map_json, inventory, skills, timer, lifecycle, status_bar_signal):
 
         super().__init__()
 
@@ -22,6 +28,7 @@ class Map(QWidget):
         self.height = 850
 
         self.timer = timer
+        self.lifecycle = lifecycle
         self.skills = skills
         self.map_name = map_name
         self.inventory = inventory
@@ -87,8 +94,8 @@ class Map(QWidget):
         # - or when transporting between maps (also remove from the map we transported from)
         self.player = None
 
-        # Accumulates all the shop instances in this map
-        self.shops = []
+        # Accumulates all the shop tiles in this map
+        self.shop_tiles = []
 
         # Create the grid layout for the visible window around player we will display as this widget's layout
         self.player_window = QGridLayout()
@@ -100,6 +107,14 @@ class Map(QWidget):
         # On first draw of the window we only want to add tiles, not remove - there was nothing added
         self.drawn_initially = False
 
+        # Empty tiles and fires are swapped in and out of the map as the player moves between maps and lights fires
+        # Rather than closing and re-creating these tile widgets each time, re-use them from pools
+        # Any timer slots are connected through the widget lifecycle, so they are disconnected when a tile is released
+        self.empty_tile_pool = WidgetPool(self.create_empty_tile, lifecycle=self.lifecycle)
+        self.fire_pool = WidgetPool(self.create_fire, lifecycle=self.lifecycle)
+        self.lifecycle.register_pool("%s empty tiles" % self.map_name, self.empty_tile_pool)
+        self.lifecycle.register_pool("%s fires" % self.map_name, self.fire_pool)
+
         # Populate the list of lists of tiles - the map - based on JSON specification for this map
 
         assert len(loaded_map['map']) == self.map_rows
@@ -153,13 +168,13 @@ class Map(QWidget):
                             tile.clicked.connect(self.interactable_clicked_on)
 
                         if isinstance(tile, Interactable):
-                            self.timer.timeout.connect(tile.regenerate)
+                            self.lifecycle.connect_timer(tile, tile.regenerate)
 
                         if isinstance(tile, ShopTile):
-                            self.shops.append(tile.shop)
+                            self.shop_tiles.append(tile)
 
                         if isinstance(tile, NPC):
-                            self.timer.timeout.connect(tile.tick_move)
+                            self.lifecycle.connect_timer(tile, tile.tick_move)
                             tile.move.connect(self.npc_move)
 
                     tile.setStyleSheet("background-color: %s;" % self.background_color)
@@ -168,8 +183,7 @@ class Map(QWidget):
                 else:
                     # Set to an empty tile
 
-                    tile = EmptyTile(x=col_index, y=row_index, tile_width=self.tile_width, tile_height=self.tile_height)
-                    tile.setStyleSheet("background-color: %s;" % self.background_color)
+                    tile = self.empty_tile_pool.acquire(col_index, row_index)
                     row_of_tiles.append(tile)
 
             assert len(row_of_tiles) == self.map_cols
@@ -178,50 +192,56 @@ class Map(QWidget):
 
         assert(len(self.map)) == self.map_rows
 
-    def calculate_window_range(self):
-        # Calculate the square grid around the player defining the window we display in the game map widget
-        # Need to cap at the boundaries if window around player would extend past a map border
-        # Return the absolute coordinates with respect to the list of lists `self.map`
+    def create_empty_tile(self, x, y):
+        # Factory for the empty tile pool
 
-        # We only ever want to draw a window around player if this map has a player on it
-        # As only the map that is visible has the player on it
-        assert self.player is not None
+        empty_tile = EmptyTile(x=x, y=y, tile_width=self.tile_width, tile_height=self.tile_height)
+        empty_tile.setStyleSheet("background-color: %s;" % self.background_color)
 
-        # Work out the row range
+        return empty_tile
 
-        player_y = self.player.y
-        rows_either_side_of_player = int((self.window_rows - 1) / 2)
+    def create_fire(self, x, y, ticks_for_fire_to_disappear):
+        # Factory for the fire pool - the remove signal only needs connecting once, when the fire is first created
+        # The timer is connected when the fire is lit (acquired), and disconnected by the pool when it's released
 
-        if (player_y - rows_either_side_of_player) < 0:
-            # Cap at top of map
-            row_range = list(range(0, self.window_rows))
+        fire_tile = Fire(
+            x=x, y=y,
+            tile_width=self.tile_width,
+            tile_height=self.tile_height,
+            ticks_for_fire_to_disappear=ticks_for_fire_to_disappear
+        )
+        fire_tile.remove_signal.connect(self.remove_fire)
+        fire_tile.setStyleSheet("background-color: %s;" % self.background_color)
 
-        elif (player_y + rows_either_side_of_player) >= self.map_rows:
-            # Cap at bottom of map
-            row_range = list(range(self.map_rows - self.window_rows, self.map_rows))
+        return fire_tile
 
-        else:
-            # No cap necessary
-            row_range = list(range(player_y - rows_either_side_of_player, player_y + rows_either_side_of_player + 1))
+    def release_tile(self, tile):
+        # Take a tile that is being replaced out of the map
+        # Pooled tile types go back to their pool to be re-used, anything else (i.e. the player) is retired for good
 
-        # Work out the column range
+        if isinstance(tile, Fire):
+            tile.setParent(None)
+            self.fire_pool.release(tile)
 
-        player_x = self.player.x
-        cols_either_side_of_player = int((self.window_cols - 1) / 2)
+        elif isinstance(tile, EmptyTile):
+            tile.setParent(None)
+            self.empty_tile_pool.release(tile)
 
-        if (player_x - cols_either_side_of_player) < 0:
-            # Cap at left of map
-            col_range = list(range(0, self.window_cols))
+        else:
+            self.lifecycle.retire(tile)
 
-        elif (player_x + cols_either_side_of_player) >= self.map_cols:
-            # Cap at right of map
-            col_range = list(range(self.map_cols - self.window_cols, self.map_cols))
+    def calculate_window_range(self):
+        # Calculate the square grid around the player defining the window we display in the game map widget
+        # Need to cap at the boundaries if window around player would extend past a map border
+        # Return the absolute coordinates with respect to the list of lists `self.map`
 
-        else:
-            # No cap necessary
-            col_range = list(range(player_x - cols_either_side_of_player, player_x + cols_either_side_of_player + 1))
+        # We only ever want to draw a window around player if this map has a player on it
+        # As only the map that is visible has the player on it
+        assert self.player is not None
 
-        return col_range, row_range
+        return window_range(
+            self.player.x, self.player.y, self.window_cols, self.window_rows, self.map_cols, self.map_rows
+        )
 
     def redraw(self):
         # Populate the grid's layout with a window around player
@@ -305,7 +325,8 @@ class Map(QWidget):
 
         if isinstance(tile, ShopTile):
             # We clicked on a shop, emit signal to change stacked display to the relevant shop interface
-            self.shop_clicked.emit(tile.shop)
+            # The shop's display is keyed by its stock in the game display index
+            self.shop_clicked.emit(tile.stock)
 
         elif isinstance(tile, BankChestTile):
             # We clicked on a bank chest, emit signal to change stacked display to bank interface
@@ -323,10 +344,12 @@ class Map(QWidget):
 
         else:
             # If not interacting with a shop or a bank, it will be an interactable (tree or rock)
-            # We only emit to this slot and interact if it was not depleted (i.e. has health and not waiting to regen)
+            # We only emit to this slot if it was not depleted (i.e. has health and not waiting to regen)
+            # Rather than a single attempt, start gathering from it - one attempt every game tick until it depletes,
+            # the inventory is full, or we move
 
             assert isinstance(tile, Interactable)
-            tile.interact(self.inventory, self.skills)
+            self.gather_clicked.emit(tile)
 
     def swap_tile_positions(self, x1, y1, x2, y2):
         # Takes coordinates to two tile positions in the map
@@ -395,6 +418,8 @@ class Map(QWidget):
                 x2=adjacent_widget.x, y2=adjacent_widget.y
             )
 
+            self.player_moved.emit()
+
             self.redraw()
 
     def npc_move(self, x, y):
@@ -483,8 +508,7 @@ class Map(QWidget):
         )
         self.player.setStyleSheet("background-color: %s;" % self.background_color)
 
-        self.map[y][x].close()
-        self.map[y][x].setParent(None)
+        self.release_tile(self.map[y][x])
 
         self.map[y][x] = self.player
 
@@ -495,14 +519,9 @@ class Map(QWidget):
 
         assert self.player is not None
 
-        self.map[self.player.y][self.player.x].close()
-        self.map[self.player.y][self.player.x].setParent(None)
+        self.release_tile(self.player)
 
-        self.map[self.player.y][self.player.x] = EmptyTile(
-            x=self.player.x, y=self.player.y,
-            tile_width=self.tile_width, tile_height=self.tile_height
-        )
-        self.map[self.player.y][self.player.x].setStyleSheet("background-color: %s;" % self.background_color)
+        self.map[self.player.y][self.player.x] = self.empty_tile_pool.acquire(self.player.x, self.player.y)
 
         self.player = None
 
@@ -540,37 +559,29 @@ class Map(QWidget):
         )
 
         # Empty tile is now to left after swapping
-        to_light_x, to_light_y = self.player.x-1, self.player.y
+        self.place_fire(self.player.x-1, self.player.y, ticks_for_fire_to_disappear)
 
-        fire_tile = Fire(
-            x=to_light_x, y=to_light_y,
-            tile_width=self.tile_width,
-            tile_height=self.tile_height,
-            ticks_for_fire_to_disappear=ticks_for_fire_to_disappear
-        )
-        self.timer.timeout.connect(fire_tile.count_down)
-        fire_tile.remove_signal.connect(self.remove_fire)
-        fire_tile.setStyleSheet("background-color: %s;" % self.background_color)
+        self.redraw()
 
-        self.map[to_light_y][to_light_x].close()
-        self.map[to_light_y][to_light_x].setParent(None)
+    def place_fire(self, x, y, ticks_for_fire_to_disappear):
+        # Replace the empty tile at (x, y) with a fire (lit by the player, or loaded from a saved game)
 
-        self.map[to_light_y][to_light_x] = fire_tile
+        assert isinstance(self.map[y][x], EmptyTile)
 
-        self.redraw()
+        fire_tile = self.fire_pool.acquire(x, y, ticks_for_fire_to_disappear)
+        self.lifecycle.connect_timer(fire_tile, fire_tile.count_down)
+
+        self.release_tile(self.map[y][x])
+
+        self.map[y][x] = fire_tile
 
     def remove_fire(self, x, y):
         # This is the slot emitted to when a fire times out and we need to remove from the map
         # Does not have to be the map the player is currently on
 
-        fire = self.map[y][x]
-
-        fire.close()
-        fire.setParent(None)
+        self.release_tile(self.map[y][x])
 
-        empty_tile = EmptyTile(x=x, y=y, tile_width=self.tile_width, tile_height=self.tile_height)
-        empty_tile.setStyleSheet("background-color: %s;" % self.background_color)
-        self.map[y][x] = empty_tile
+        self.map[y][x] = self.empty_tile_pool.acquire(x, y)
 
         # Re-draw if the player is on this map and the fire's coordinates are in the window range
 
@@ -0,0 +1,290 @@
+import csv
+from PyQt5.QtCore import QSize
+from utilities import generate_label
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QGridLayout, QPushButton
+
+# Session metrics: xp gained, resources gathered and missed attempts for each skill, and rolling rates of them
+# over the last minute and the last hour of game ticks, so we can see (and export) how fast we're actually levelling,
+# e.g. to compare real play against the simulator's expected rates (see `simulator.py`)
+# The model classes don't depend on Qt, only the display widget at the bottom does
+
+# Rolling windows rates are kept over, in game ticks (1 tick = 1 sec)
+minute_ticks = 60
+hour_ticks = 3600
+
+
+class RingBuffer:
+    # Fixed size buffer of the most recent (tick, amount) events, with a running total of the amounts in each of
+    # a number of rolling windows of ticks, e.g. the last minute and the last hour
+    # Events are kept in order of tick, and each window keeps a pointer to its oldest event still in the window, so
+    # recording an event and reading a rate are O(1) (amortised - each event leaves each window once)
+    # If the buffer is full, the oldest event is overwritten, and rates only cover the ticks since then
+
+    def __init__(self, size, windows):
+
+        self.size = size
+        self.windows = windows
+
+        self.ticks = [0] * size
+        self.amounts = [0] * size
+
+        # Events are numbered in the order they're recorded, and event `n` is stored at index `n % size`
+        # We hold events numbered from `self.start` up to (not including) `self.end`
+        self.start = 0
+        self.end = 0
+
+        # For each window, the number of its oldest event still in the window, and the total of its amounts
+        self.window_starts = [0] * len(windows)
+        self.window_totals = [0] * len(windows)
+
+        # The earliest tick we still have every event from (moves on when events are overwritten)
+        self.covered_from = 0
+
+    def add(self, tick, amount):
+
+        assert self.end == self.start or tick >= self.ticks[(self.end - 1) % self.size]
+
+        if self.end - self.start == self.size:
+            # Full, so drop the oldest event (from any windows still including it) to make room
+            oldest_index = self.start % self.size
+
+            for i in range(len(self.windows)):
+                if self.window_starts[i] == self.start:
+                    self.window_totals[i] -= self.amounts[oldest_index]
+                    self.window_starts[i] += 1
+
+            self.covered_from = self.ticks[oldest_index]
+            self.start += 1
+
+        index = self.end % self.size
+        self.ticks[index] = tick
+        self.amounts[index] = amount
+        self.end += 1
+
+        for i in range(len(self.windows)):
+            self.window_totals[i] += amount
+
+    def expire(self, tick):
+        # Move each window on to the events in the `window` ticks up to and including `tick`
+
+        for i in range(len(self.windows)):
+            while self.window_starts[i] < self.end and self.ticks[self.window_starts[i] % self.size] <= tick - self.windows[i]:
+                self.window_totals[i] -= self.amounts[self.window_starts[i] % self.size]
+                self.window_starts[i] += 1
+
+    def total(self, window_index, tick):
+        # Total amount of events in the window up to `tick`
+
+        self.expire(tick)
+
+        return self.window_totals[window_index]
+
+    def rate(self, window_index, tick, started=0):
+        # Amount per tick over the window up to `tick`
+        # If the session (which began at tick `started`) or the events we still have cover less than the window,
+        # the rate is over the ticks they do cover
+
+        ticks_covered = min(self.windows[window_index], tick - max(started, self.covered_from))
+
+        if ticks_covered <= 0:
+            return 0.0
+
+        return self.total(window_index, tick) / ticks_covered
+
+
+class SkillMetrics:
+    # Xp, resources gathered and misses for one skill, over the session and in rolling windows
+
+    def __init__(self, size):
+
+        self.level = None
+
+        self.experience = RingBuffer(size, [minute_ticks, hour_ticks])
+        self.gathered = RingBuffer(size, [minute_ticks, hour_ticks])
+        self.missed = RingBuffer(size, [minute_ticks, hour_ticks])
+
+        # Session totals
+        self.total_experience = 0
+        self.total_gathered = 0
+        self.total_missed = 0
+
+
+class SessionMetrics:
+    # Metrics for every skill we've done something in this session, keyed by skill title
+    # The game timer calls `tick()`, and events are recorded at the current tick:
+    # - xp gains come from the skill set whenever a skill gains xp
+    # - resources gathered and misses come from gathering actions, one for each attempt
+
+    def __init__(self, size=4096):
+
+        # Size of each ring buffer, so each skill's memory use is fixed however long we play
+        # At most one gathering attempt happens a game tick, so this holds more than an hour of them
+        self.size = size
+
+        self.ticks = 0
+
+        # Mapping from skill title to its metrics, in the order skills were first recorded
+        self.skills = {}
+
+        # Tick each skill's metrics started (rates before then cover less than the window)
+        self.started = {}
+
+    def tick(self):
+        # Slot for the game timer
+
+        self.ticks += 1
+
+    def skill_metrics(self, skill):
+
+        if skill.title not in self.skills:
+            self.skills[skill.title] = SkillMetrics(self.size)
+            self.started[skill.title] = self.ticks
+
+        metrics = self.skills[skill.title]
+        metrics.level = skill.level
+
+        return metrics
+
+    def record_experience(self, skill, xp, idle=False):
+        # Xp gained idle (while the game was closed) isn't part of this session, so isn't recorded
+
+        if idle:
+            return
+
+        metrics = self.skill_metrics(skill)
+        metrics.experience.add(self.ticks, xp)
+        metrics.total_experience += xp
+
+    def record_gathered(self, skill, amount=1):
+
+        metrics = self.skill_metrics(skill)
+        metrics.gathered.add(self.ticks, amount)
+        metrics.total_gathered += amount
+
+    def record_missed(self, skill):
+
+        metrics = self.skill_metrics(skill)
+        metrics.missed.add(self.ticks, 1)
+        metrics.total_missed += 1
+
+    def rates(self, skill_title):
+        # Dictionary of the skill's current rolling rates and session totals
+        # Success rate is over the last hour of gathering attempts (None if there haven't been any)
+
+        metrics = self.skills[skill_title]
+        started = self.started[skill_title]
+
+        gathered = metrics.gathered.total(1, self.ticks)
+        missed = metrics.missed.total(1, self.ticks)
+
+        return {
+            'skill': skill_title,
+            'level': metrics.level,
+            'xp_per_minute': metrics.experience.rate(0, self.ticks, started) * minute_ticks,
+            'xp_per_hour': metrics.experience.rate(1, self.ticks, started) * hour_ticks,
+            'gathered_per_hour': metrics.gathered.rate(1, self.ticks, started) * hour_ticks,
+            'missed_per_hour': metrics.missed.rate(1, self.ticks, started) * hour_ticks,
+            'success_rate': gathered / (gathered + missed) if gathered + missed > 0 else None,
+            'total_xp': metrics.total_experience,
+            'total_gathered': metrics.total_gathered,
+            'total_missed': metrics.total_missed,
+            'ticks': self.ticks - started
+        }
+
+    def export(self, path):
+        # Write the current rates of every skill to a csv file, one row per skill
+
+        rows = [self.rates(skill_title) for skill_title in self.skills]
+
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=[
+                'skill', 'level', 'xp_per_minute', 'xp_per_hour', 'gathered_per_hour', 'missed_per_hour',
+                'success_rate', 'total_xp', 'total_gathered', 'total_missed', 'ticks'
+            ])
+            writer.writeheader()
+            writer.writerows(rows)
+
+        return len(rows)
+
+
+class SessionMetricsDisplay(QWidget):
+    # A widget showing the session metrics, opened from the skills panel
+    # Like other displays, it replaces the main game display until we press the close button/press ESC
+    # Its text is refreshed every game tick (the game connects `refresh` to the timer)
+
+    columns = ["Skill", "Level", "Xp/min", "Xp/hr", "Gathered/hr", "Missed/hr", "Success rate", "Session xp"]
+
+    def __init__(self, metrics, status_bar_signal, path_to_export='metrics.csv'):
+
+        super().__init__()
+
+        self.metrics = metrics
+        self.status_bar_signal = status_bar_signal
+        self.path_to_export = path_to_export
+
+        self.setFixedSize(QSize(1300, 850))
+
+        overall_layout = QVBoxLayout()
+
+        top_layout = QHBoxLayout()
+
+        self.export_button = QPushButton("Export")
+        self.export_button.setFixedSize(QSize(100, 50))
+        self.export_button.clicked.connect(self.export)
+
+        self.close_button = QPushButton("Close")
+        self.close_button.setFixedSize(QSize(100, 50))
+
+        top_layout.addWidget(generate_label("SESSION RATES", 30, w=900, h=50))
+        top_layout.addWidget(self.export_button)
+        top_layout.addWidget(self.close_button)
+
+        overall_layout.addLayout(top_layout)
+
+        # One row of labels per skill, added the first time the skill has metrics
+        self.grid = QGridLayout()
+        for col, column in enumerate(self.columns):
+            self.grid.addWidget(generate_label(column, 15, w=150, h=50), 0, col)
+
+        self.skill_title_to_labels = {}
+
+        overall_layout.addLayout(self.grid)
+        overall_layout.addStretch()
+
+        self.setLayout(overall_layout)
+
+        self.refresh()
+
+    def refresh(self):
+
+        for skill_title in self.metrics.skills:
+
+            if skill_title not in self.skill_title_to_labels:
+                row = len(self.skill_title_to_labels) + 1
+                labels = [generate_label("", 15, w=150, h=50) for column in self.columns]
+                for col, label in enumerate(labels):
+                    self.grid.addWidget(label, row, col)
+                self.skill_title_to_labels[skill_title] = labels
+
+            rates = self.metrics.rates(skill_title)
+
+            texts = [
+                skill_title,
+                str(rates['level']),
+                "%.0f" % rates['xp_per_minute'],
+                "%.0f" % rates['xp_per_hour'],
+                "%.1f" % rates['gathered_per_hour'],
+                "%.1f" % rates['missed_per_hour'],
+                "-" if rates['success_rate'] is None else "%.0f%%" % (100 * rates['success_rate']),
+                str(rates['total_xp'])
+            ]
+
+            for label, text in zip(self.skill_title_to_labels[skill_title], texts):
+                label.setText(text)
+
+    def export(self):
+
+        exported = self.metrics.export(self.path_to_export)
+        self.status_bar_signal.emit("Exported rates for %s skill%s to %s" % (
+            exported, "" if exported == 1 else "s", self.path_to_export
+        ))
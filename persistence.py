@@ -0,0 +1,352 @@
+import queue
+import sqlite3
+import threading
+from items import concrete_types
+from inventory import InventorySlot
+from tiles import Interactable, NPC, Fire
+
+# Persistence of the game between runs, in an SQLite database: the player (skills, inventory, gold pouch and where
+# they are), the bank, every shop's stock, and the dynamic state of the maps (trees/rocks part gathered or depleted,
+# fires burning, where NPCs have wandered to)
+# Saving is done every game tick without the game waiting on the disk:
+# - on the game's thread, we capture the state as rows of each table (cheap - the maps are small, and it's all in
+#   memory), and compare them with the rows last captured, so only what changed this tick is sent on
+# - one writer thread owns the database connection, and writes each tick's changes in one transaction. If the disk
+#   falls behind, the ticks waiting are coalesced, so they go in one transaction with only the latest row of each key
+# The database is in WAL mode, so a transaction appends to the write-ahead log rather than re-writing pages in place,
+# and with synchronous=NORMAL commits don't wait for an fsync - a crash can only lose the last few ticks, never corrupt
+# If a write fails (e.g. another game has the database locked for longer than the busy timeout), its changes are kept
+# and retried with the next, and the error is kept for the game to report until a write succeeds again
+# On start we load everything back synchronously, before the game timer starts
+
+path_to_database = 'starscape.db'
+
+# Every table: (key columns, value columns). Rows are keyed tuples, so comparing captures is comparing dictionaries
+tables = {
+    'player': (('id',), ('map_name', 'x', 'y', 'gold')),
+    'skills': (('title',), ('experience',)),
+    'inventory': (('slot',), ('title',)),
+    'bank': (('slot',), ('title', 'quantity')),
+    'shop_stock': (('map_name', 'x', 'y', 'slot'), ('title', 'stock', 'base_stock', 'ticks_since_change')),
+    'resources': (('map_name', 'x', 'y'), ('health', 'ticks_left')),
+    'fires': (('map_name', 'x', 'y'), ('ticks_left',)),
+    'npcs': (('map_name', 'initial_x', 'initial_y'), ('x', 'y'))
+}
+
+title_to_item_type = {item_type.title: item_type for item_type in concrete_types}
+
+
+def connect(path, busy_seconds=5.0):
+    # Statements wait up to `busy_seconds` for another connection's lock on the database before failing
+
+    connection = sqlite3.connect(path, timeout=busy_seconds)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+
+    for table, (keys, values) in tables.items():
+        connection.execute('CREATE TABLE IF NOT EXISTS %s (%s, PRIMARY KEY (%s))' % (
+            table, ', '.join(keys + values), ', '.join(keys)
+        ))
+
+    connection.commit()
+    return connection
+
+
+def load_state(path=path_to_database):
+    # Every table's rows, as {table: {key tuple: value tuple}} - empty if nothing has been saved
+
+    connection = connect(path)
+
+    state = {}
+    for table, (keys, values) in tables.items():
+        state[table] = {
+            row[:len(keys)]: row[len(keys):]
+            for row in connection.execute('SELECT %s FROM %s' % (', '.join(keys + values), table))
+        }
+
+    connection.close()
+    return state
+
+
+def capture_state(game):
+    # The game's state as rows of every table, in the same form as `load_state`
+
+    state = {table: {} for table in tables}
+
+    player_map = game.stacked_game_display_index.get_last_viewed_map()
+    state['player'][(game.player_id,)] = (
+        player_map.map_name, player_map.player.x, player_map.player.y, game.inventory.gold_pouch.gold
+    )
+
+    for skill in game.skills.skills.values():
+        state['skills'][(skill.title,)] = (skill.experience,)
+
+    for slot in range(game.inventory.inventory_size):
+        inventory_slot = game.inventory.inventory.itemAtPosition(
+            slot // game.inventory.cols, slot % game.inventory.cols
+        ).widget()
+        if type(inventory_slot) == InventorySlot:
+            state['inventory'][(slot,)] = (inventory_slot.item.title,)
+
+    bank_storage = game.bank_storage
+    for slot, item_type in enumerate(bank_storage.item_types):
+        if item_type is not None:
+            state['bank'][(slot,)] = (item_type.title, bank_storage.quantity(slot))
+
+    for map_name, map_obj in game.map_name_to_obj.items():
+
+        for shop_tile in map_obj.shop_tiles:
+            stock = shop_tile.stock
+            for slot, item_type in enumerate(stock.item_types):
+                if item_type is not None:
+                    state['shop_stock'][(map_name, shop_tile.x, shop_tile.y, slot)] = (
+                        item_type.title, int(stock.stock[slot]), int(stock.base_stock[slot]),
+                        int(stock.ticks_since_change[slot])
+                    )
+
+        for row in map_obj.map:
+            for tile in row:
+
+                if isinstance(tile, Interactable):
+                    state['resources'][(map_name, tile.x, tile.y)] = (tile.health, tile.ticks_left)
+
+                elif isinstance(tile, Fire):
+                    state['fires'][(map_name, tile.x, tile.y)] = (tile.ticks_left,)
+
+                elif isinstance(tile, NPC):
+                    state['npcs'][(map_name, tile.initial_x, tile.initial_y)] = (tile.x, tile.y)
+
+    return state
+
+
+def changes_between(old_state, new_state):
+    # The rows to write to go from one captured state to the next: {table: (rows to upsert, keys to delete)}
+    # Tables with nothing changed are left out
+
+    changes = {}
+
+    for table, rows in new_state.items():
+
+        old_rows = old_state.get(table, {})
+
+        upserts = {key: values for key, values in rows.items() if old_rows.get(key) != values}
+        deletes = [key for key in old_rows if key not in rows]
+
+        if upserts or deletes:
+            changes[table] = (upserts, deletes)
+
+    return changes
+
+
+def apply_state(game, state):
+    # Put a saved state (from the database or a quick save) back into the game, which has the player taken off
+    # every map - on start, or loading a quick save. Everything saved is replaced, the maps' dynamic state included
+    # Returns where the player was saved as (map name, x, y), or None if nothing was saved (the game is left as it is)
+    # Rows that no longer match the game (e.g. a map was edited since) are skipped
+
+    player = state['player'].get((game.player_id,))
+    if player is None:
+        return None
+
+    map_name, x, y, gold = player
+    game.inventory.gold_pouch.gold = gold
+    game.inventory.gold_pouch.redraw()
+
+    for (title,), (experience,) in state['skills'].items():
+        for skill in game.skills.skills.values():
+            if skill.title == title:
+                skill.set_experience(experience)
+
+    for slot in range(game.inventory.inventory_size):
+        title = state['inventory'].get((slot,), (None,))[0]
+        game.inventory.set_slot(
+            slot % game.inventory.cols, slot // game.inventory.cols,
+            title_to_item_type[title]() if title in title_to_item_type else None
+        )
+
+    game.bank_storage.restore([
+        (slot, title_to_item_type[title], quantity) for (slot,), (title, quantity) in state['bank'].items()
+        if title in title_to_item_type and slot < game.bank_storage.limit
+    ])
+
+    shop_entries = {}
+    for (shop_map_name, shop_x, shop_y, slot), (title, stock, base_stock, ticks) in state['shop_stock'].items():
+        if title in title_to_item_type:
+            shop_entries.setdefault((shop_map_name, shop_x, shop_y), []).append(
+                (slot, title_to_item_type[title], stock, base_stock, ticks)
+            )
+
+    for name, map_obj in game.map_name_to_obj.items():
+
+        assert map_obj.player is None
+
+        for shop_tile in map_obj.shop_tiles:
+            if (name, shop_tile.x, shop_tile.y) in shop_entries:
+                shop_tile.stock.restore(shop_entries[(name, shop_tile.x, shop_tile.y)])
+
+        # Put out any fires burning, so the NPCs can move back to where they were
+        npcs = []
+        for row in map_obj.map:
+            for tile in row:
+
+                if isinstance(tile, Interactable) and (name, tile.x, tile.y) in state['resources']:
+                    tile.restore(*state['resources'][(name, tile.x, tile.y)])
+
+                elif isinstance(tile, Fire):
+                    map_obj.remove_fire(tile.x, tile.y)
+
+                elif isinstance(tile, NPC) and (name, tile.initial_x, tile.initial_y) in state['npcs']:
+                    npcs.append(tile)
+
+        # NPCs can only move onto empty tiles, and might be in each other's way, so keep moving the ones that can
+        # until none can (it's only ever a few NPCs a map)
+        while npcs:
+
+            moved = [
+                npc for npc in npcs
+                if map_obj.can_insert_player(*state['npcs'][(name, npc.initial_x, npc.initial_y)])
+            ]
+
+            if not moved:
+                break
+
+            for npc in moved:
+                npc_x, npc_y = state['npcs'][(name, npc.initial_x, npc.initial_y)]
+                if map_obj.can_insert_player(npc_x, npc_y):
+                    map_obj.swap_tile_positions(npc.x, npc.y, npc_x, npc_y)
+                npcs.remove(npc)
+
+        for (fire_map_name, fire_x, fire_y), (ticks_left,) in state['fires'].items():
+            if fire_map_name == name and map_obj.can_insert_player(fire_x, fire_y):
+                map_obj.place_fire(fire_x, fire_y, ticks_left)
+
+    return map_name, x, y
+
+
+class WorldStore:
+    # The writer side of the database: the game calls `save()` every tick with its captured state, which is compared
+    # with the last and the changes queued for the writer thread (see the top) - the game never waits on the disk
+    # `close()` waits for everything queued to be written (or to fail a last time)
+    # `last_error` is the error the last write failed with, or None if it succeeded
+
+    def __init__(self, path=path_to_database, state=None, retry_seconds=1.0):
+
+        self.path = path
+
+        # The last state captured, which the next is compared with. Starts as what was loaded
+        self.state = {} if state is None else state
+
+        self.pending = queue.SimpleQueue()
+
+        # Counts of ticks saved with changes, the transactions they were written in, and writes that failed
+        self.ticks_saved = 0
+        self.transactions = 0
+        self.failures = 0
+        self.last_error = None
+
+        # While a write has failed, it's retried this often even if no more changes come in
+        self.retry_seconds = retry_seconds
+
+        self.writer = threading.Thread(target=self.run_writes, daemon=True)
+        self.writer.start()
+
+    def save(self, state):
+
+        changes = changes_between(self.state, state)
+        self.state = state
+
+        if changes:
+            self.ticks_saved += 1
+            self.pending.put(changes)
+
+    def close(self):
+
+        self.pending.put(None)
+        self.writer.join()
+
+    def run_writes(self):
+
+        connection = None
+
+        # Changes that failed to be written, to go first in the next write
+        failed = None
+
+        while True:
+
+            try:
+                batch = [self.pending.get(timeout=None if failed is None else self.retry_seconds)]
+            except queue.Empty:
+                batch = []
+
+            while True:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = None in batch
+            batch = ([] if failed is None else [failed]) + [changes for changes in batch if changes is not None]
+
+            if batch:
+
+                changes = coalesce(batch)
+
+                try:
+                    if connection is None:
+                        connection = connect(self.path)
+                    self.write(connection, changes)
+
+                except sqlite3.Error as e:
+                    failed = changes
+                    self.failures += 1
+                    self.last_error = "%s: %s" % (e.__class__.__name__, e)
+
+                else:
+                    failed = None
+                    self.transactions += 1
+                    self.last_error = None
+
+            if stopping:
+                break
+
+        if connection is not None:
+            connection.close()
+
+    def write(self, connection, changes):
+        # Write the changes of one or more ticks in one transaction
+
+        with connection:
+            for table, (upserts, deletes) in changes.items():
+
+                keys, values = tables[table]
+
+                if deletes:
+                    connection.executemany('DELETE FROM %s WHERE %s' % (
+                        table, ' AND '.join('%s = ?' % key for key in keys)
+                    ), deletes)
+
+                if upserts:
+                    connection.executemany('INSERT OR REPLACE INTO %s (%s) VALUES (%s)' % (
+                        table, ', '.join(keys + values), ', '.join('?' for column in keys + values)
+                    ), [key + values for key, values in upserts.items()])
+
+
+def coalesce(batch):
+    # Merge the changes of several ticks, in order, into the changes of one: a key's latest upsert or delete wins
+
+    merged = {}
+
+    for changes in batch:
+        for table, (upserts, deletes) in changes.items():
+
+            table_upserts, table_deletes = merged.setdefault(table, ({}, set()))
+
+            for key in deletes:
+                table_upserts.pop(key, None)
+                table_deletes.add(key)
+
+            for key, values in upserts.items():
+                table_deletes.discard(key)
+                table_upserts[key] = values
+
+    return {table: (upserts, list(deletes)) for table, (upserts, deletes) in merged.items()}
@@ -0,0 +1,87 @@
+class WidgetPool:
+    # A pool of reusable widgets of one type, so we don't close and construct a new widget (with new signal
+    # connections, pixmaps, etc.) every time something like an inventory slot or an empty map tile changes
+    # Widgets are created by `factory`, which is called with the payload the widget should display (e.g. the item
+    # for an inventory slot, or the coordinates for an empty tile), and connects up any signals once, on creation
+    # Released widgets are hidden and kept in the pool; acquiring a widget reuses a pooled one if there is one,
+    # calling its `rebind()` method with the new payload, and only falls back on the factory if the pool is empty
+    # If `maximum_size` is set, widgets released when the pool is already that size are deleted instead
+    # If the pool is given a widget lifecycle, released widgets are disconnected from the game timer, and any widgets
+    # deleted are retired through it
+    # The pool also keeps counts of what it's done, to see how much allocation churn it is saving
+
+    def __init__(self, factory, maximum_size=None, lifecycle=None):
+
+        self.factory = factory
+        self.maximum_size = maximum_size
+        self.lifecycle = lifecycle
+
+        self.free_widgets = []
+
+        self.created = 0
+        self.reused = 0
+        self.released = 0
+        self.discarded = 0
+
+    def acquire(self, *payload):
+        # Get a widget displaying `payload`, from the pool if possible
+
+        if self.free_widgets:
+            widget = self.free_widgets.pop()
+            widget.rebind(*payload)
+            self.reused += 1
+
+        else:
+            widget = self.factory(*payload)
+            self.created += 1
+
+        return widget
+
+    def release(self, widget):
+        # Return a widget to the pool once it's no longer displayed (i.e. removed from its layout/map)
+
+        widget.hide()
+        self.released += 1
+
+        if self.lifecycle is not None:
+            self.lifecycle.disconnect_timer(widget)
+
+        if self.maximum_size is not None and len(self.free_widgets) >= self.maximum_size:
+
+            if self.lifecycle is not None:
+                self.lifecycle.retire(widget)
+            else:
+                widget.setParent(None)
+                widget.deleteLater()
+
+            self.discarded += 1
+
+        else:
+            self.free_widgets.append(widget)
+
+    def size(self):
+        # How many widgets are waiting in the pool to be reused
+
+        return len(self.free_widgets)
+
+    def in_use(self):
+        # How many widgets created by this pool are currently acquired
+
+        return self.created - self.discarded - len(self.free_widgets)
+
+    def metrics(self):
+
+        return {
+            'size': self.size(),
+            'in_use': self.in_use(),
+            'created': self.created,
+            'reused': self.reused,
+            'released': self.released,
+            'discarded': self.discarded
+        }
+
+    def __str__(self):
+
+        return "size %s, in use %s, created %s, reused %s, released %s, discarded %s" % (
+            self.size(), self.in_use(), self.created, self.reused, self.released, self.discarded
+        )
@@ -0,0 +1,481 @@
+import json
+from items import concrete_types
+from tiles import code_to_feature, NPC, Player, Fire
+from skills import Mining, Woodcutting, Firemaking, Fletching
+
+# Wire format between the multiplayer server and its clients
+# Client -> server, one JSON object per line (intents), each with a 'type':
+# - {'type': 'hello', 'name': str}                    first message, joins the world
+# - {'type': 'move', 'direction': 'up'/'down'/'left'/'right', 'seq': int}   moves are numbered by the client
+# - {'type': 'interact', 'x': int, 'y': int}          click a tile: gather, open a shop/bank, or transport
+# - {'type': 'buy'/'sell', 'x': int, 'y': int, 'item': title, 'amount': int}   with the shop at (x, y)
+# - {'type': 'deposit'/'withdraw', 'item': title, 'amount': int}              with the bank (next to a chest)
+# - {'type': 'use', 'tool': title, 'item': title}     use a tool on a resource in the inventory
+# - {'type': 'ack', 'seq': int}                       the client has the snapshot numbered `seq`
+# Server -> client, a stream of frames, each a varint length then that many bytes: a kind byte, then
+# - FRAME_MESSAGE: a JSON object
+#   - {'type': 'welcome', 'player': id}               the id of the client's own player entity
+#   - {'type': 'map', 'map': name}                    the player is now on this map (load its static tiles)
+#   - {'type': 'shop', 'x': int, 'y': int}            a shop was opened (its stock comes in snapshots)
+#   - {'type': 'bank', 'contents': [...]}             the bank was opened/changed
+#   - {'type': 'message', 'text': str}                status bar text, e.g. why an intent failed
+# - FRAME_SNAPSHOT: a binary snapshot of what the player can see and their own state (see `Snapshot`), as the
+#   difference from an earlier snapshot the client acknowledged (a delta), or from nothing (a keyframe)
+FRAME_MESSAGE = 0
+FRAME_SNAPSHOT = 1
+
+# Things sent as numbers, the same on the server and clients as they're made from the same classes
+# Entities (players, NPCs and fires) by the tile type they're displayed as, items by their sort rank (0 is empty)
+entity_types = [Player] + [tile_type for tile_type in code_to_feature.values() if issubclass(tile_type, NPC)] + [Fire]
+entity_type_to_code = {entity_type: code for code, entity_type in enumerate(entity_types)}
+
+item_types = [None] + concrete_types
+
+skill_titles = [skill_type.title for skill_type in [Mining, Woodcutting, Firemaking, Fletching]]
+
+inventory_size = 28
+
+# Which parts of a snapshot a delta has changes to, as bit flags
+ENTITIES = 1
+DEPLETED = 2
+INVENTORY = 4
+GOLD = 8
+EXPERIENCE = 16
+SHOP = 32
+
+
+def encode(message):
+    # An intent from a client
+
+    return json.dumps(message, separators=(',', ':')).encode() + b'\n'
+
+
+def decode(line):
+
+    return json.loads(line)
+
+
+def item_code(item):
+
+    return 0 if item is None else item.sort_rank + 1
+
+
+class Writer:
+    # Writes frames into a bytearray that's kept and reused: `reset()` and write the next frame over the last one,
+    # so encoding doesn't allocate once the buffer has grown to fit the largest frame
+    # Frames are read out as memoryviews of the buffer, which must be released (or copied) before the next write
+
+    def __init__(self, size=4096):
+
+        self.buffer = bytearray(size)
+        self.position = 0
+
+    def reset(self, position=0):
+
+        self.position = position
+
+    def reserve(self, size):
+
+        if self.position + size > len(self.buffer):
+            self.buffer.extend(bytes(max(size, len(self.buffer))))
+
+    def byte(self, value):
+
+        self.reserve(1)
+        self.buffer[self.position] = value
+        self.position += 1
+
+    def varint(self, value):
+        # Unsigned LEB128: 7 bits a byte, least significant first, with the top bit set on all but the last byte
+
+        assert value >= 0
+
+        buffer = self.buffer
+        position = self.position
+
+        if position + 10 > len(buffer):
+            self.reserve(10)
+            buffer = self.buffer
+
+        while value >= 0x80:
+            buffer[position] = (value & 0x7f) | 0x80
+            value >>= 7
+            position += 1
+
+        buffer[position] = value
+        self.position = position + 1
+
+    def bytes(self, data):
+
+        self.reserve(len(data))
+        self.buffer[self.position:self.position + len(data)] = data
+        self.position += len(data)
+
+    def frame(self, start):
+        # Finish a frame whose kind byte and payload were written from `start`, leaving room before it for its length
+        # (`length_room` bytes), by writing its length so it ends where the frame starts. Returns a view of the frame
+
+        length = self.position - start
+
+        length_bytes = []
+        while length >= 0x80:
+            length_bytes.append((length & 0x7f) | 0x80)
+            length >>= 7
+        length_bytes.append(length)
+
+        assert len(length_bytes) <= start
+
+        self.buffer[start - len(length_bytes):start] = bytes(length_bytes)
+
+        return memoryview(self.buffer)[start - len(length_bytes):self.position]
+
+
+# Room left for a frame's length before it (the length isn't known until the frame's written), enough for 2MB frames
+length_room = 3
+
+
+class Reader:
+    # Reads varints from bytes/a memoryview, without copying it
+
+    def __init__(self, data, position=0):
+
+        self.data = data
+        self.position = position
+
+    def byte(self):
+
+        value = self.data[self.position]
+        self.position += 1
+        return value
+
+    def varint(self):
+
+        data = self.data
+        position = self.position
+        value = 0
+        shift = 0
+
+        while True:
+            b = data[position]
+            position += 1
+            value |= (b & 0x7f) << shift
+            if b < 0x80:
+                break
+            shift += 7
+
+        self.position = position
+        return value
+
+
+# Tags of the values written by `write_value`, for files of plain values (quick saves and the event journal):
+# each value is a tag byte then the value - None; a non-negative or negative int as a varint (of its magnitude);
+# or a string as its UTF-8 length (varint) and bytes
+TAG_NONE = 0
+TAG_INT = 1
+TAG_NEGATIVE_INT = 2
+TAG_STR = 3
+
+
+def write_value(writer, value):
+
+    if value is None:
+        writer.byte(TAG_NONE)
+
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        writer.byte(TAG_STR)
+        writer.varint(len(data))
+        writer.bytes(data)
+
+    elif value >= 0:
+        writer.byte(TAG_INT)
+        writer.varint(int(value))
+
+    else:
+        writer.byte(TAG_NEGATIVE_INT)
+        writer.varint(-int(value))
+
+
+def read_value(reader):
+
+    tag = reader.byte()
+
+    if tag == TAG_NONE:
+        return None
+
+    if tag == TAG_INT:
+        return reader.varint()
+
+    if tag == TAG_NEGATIVE_INT:
+        return -reader.varint()
+
+    if tag == TAG_STR:
+        length = reader.varint()
+        reader.position += length
+        return bytes(reader.data[reader.position - length:reader.position]).decode('utf-8')
+
+    raise ValueError("Unknown value tag %s" % tag)
+
+
+def encode_message(message):
+    # A JSON message from the server, as a frame
+
+    writer = Writer()
+    writer.reset(length_room)
+    writer.byte(FRAME_MESSAGE)
+    writer.bytes(json.dumps(message, separators=(',', ':')).encode())
+
+    return bytes(writer.frame(length_room))
+
+
+def split_frames(received):
+    # Take the whole frames from the front of a bytearray of what's been received so far, as (kind, payload) pairs
+    # A partial frame at the end is left in `received` for when the rest arrives
+
+    frames = []
+    reader = Reader(received)
+
+    while reader.position < len(received):
+
+        start = reader.position
+
+        try:
+            length = reader.varint()
+        except IndexError:
+            reader.position = start
+            break
+
+        if reader.position + length > len(received):
+            reader.position = start
+            break
+
+        frames.append((received[reader.position], bytes(received[reader.position + 1:reader.position + length])))
+        reader.position += length
+
+    del received[:reader.position]
+
+    return frames
+
+
+class Snapshot:
+    # Everything a client displays, as the server saw it at one flush:
+    # - entities: id -> (entity type code, x, y) for every entity in the chunks around the player
+    # - depleted: frozenset of (x, y) of the depleted trees/rocks in those chunks
+    # - inventory: tuple of item codes, one per slot
+    # - gold
+    # - experience: tuple of xp, one per skill in `skill_titles`
+    # - shop: index -> (item code, quantity, buy price) for the stock of the shop the player has open (if any)
+    # - move_seq: seq of the last move of the player's the server has applied, so the client knows which of its
+    #   predicted moves the snapshot includes
+    # Snapshots are never changed once made, so the server and client can keep them to take deltas against
+
+    def __init__(self, entities, depleted, inventory, gold, experience, shop, move_seq):
+
+        self.entities = entities
+        self.depleted = depleted
+        self.inventory = inventory
+        self.gold = gold
+        self.experience = experience
+        self.shop = shop
+        self.move_seq = move_seq
+
+    def same_as(self, other):
+
+        return (
+            self.entities == other.entities and self.depleted == other.depleted and self.inventory == other.inventory
+            and self.gold == other.gold and self.experience == other.experience and self.shop == other.shop
+            and self.move_seq == other.move_seq
+        )
+
+
+# What keyframes are the difference from
+empty_snapshot = Snapshot({}, frozenset(), (0,) * inventory_size, 0, (0,) * len(skill_titles), {}, 0)
+
+
+def write_sorted(writer, values):
+    # Sorted ids/indexes, each as the difference from the last (so ids near each other take a byte each)
+
+    writer.varint(len(values))
+
+    last = 0
+    for value in values:
+        writer.varint(value - last)
+        last = value
+
+
+def read_sorted(reader):
+
+    values = []
+
+    last = 0
+    for i in range(reader.varint()):
+        last += reader.varint()
+        values.append(last)
+
+    return values
+
+
+def write_positions(writer, positions):
+
+    writer.varint(len(positions))
+
+    for x, y in positions:
+        writer.varint(x)
+        writer.varint(y)
+
+
+def read_positions(reader):
+
+    return [(reader.varint(), reader.varint()) for i in range(reader.varint())]
+
+
+def encode_snapshot(writer, seq, baseline_seq, tick, snapshot, baseline):
+    # Write a frame holding the snapshot as the difference from the baseline (seq 0 and `empty_snapshot` for a
+    # keyframe) into the writer, returning a view of the frame. Only the parts of the snapshot that changed are written:
+    # - header: seq, baseline seq, tick, move seq, then a byte of flags saying which parts follow
+    # - entities: ids of entities gone, then (id, type code, x, y) of entities that appeared or moved
+    # - depleted: positions of trees/rocks that depleted, then those that regenerated
+    # - inventory: (slot, item code) of slots that changed
+    # - gold
+    # - experience: (skill index, xp) of skills that gained xp
+    # - shop: stock indexes gone, then (index, item code, quantity, price) of stock that changed
+
+    writer.reset(length_room)
+
+    writer.byte(FRAME_SNAPSHOT)
+    writer.varint(seq)
+    writer.varint(baseline_seq)
+    writer.varint(tick)
+    writer.varint(snapshot.move_seq)
+
+    flags_position = writer.position
+    writer.byte(0)
+    flags = 0
+
+    if snapshot.entities != baseline.entities:
+
+        flags |= ENTITIES
+
+        write_sorted(writer, sorted(entity_id for entity_id in baseline.entities if entity_id not in snapshot.entities))
+
+        changed_ids = sorted(
+            entity_id for entity_id, entity in snapshot.entities.items() if baseline.entities.get(entity_id) != entity
+        )
+        writer.varint(len(changed_ids))
+
+        last = 0
+        for entity_id in changed_ids:
+            code, x, y = snapshot.entities[entity_id]
+            writer.varint(entity_id - last)
+            writer.varint(code)
+            writer.varint(x)
+            writer.varint(y)
+            last = entity_id
+
+    if snapshot.depleted != baseline.depleted:
+        flags |= DEPLETED
+        write_positions(writer, sorted(snapshot.depleted - baseline.depleted))
+        write_positions(writer, sorted(baseline.depleted - snapshot.depleted))
+
+    if snapshot.inventory != baseline.inventory:
+        flags |= INVENTORY
+        changed_slots = [slot for slot in range(inventory_size) if snapshot.inventory[slot] != baseline.inventory[slot]]
+        writer.varint(len(changed_slots))
+        for slot in changed_slots:
+            writer.varint(slot)
+            writer.varint(snapshot.inventory[slot])
+
+    if snapshot.gold != baseline.gold:
+        flags |= GOLD
+        writer.varint(snapshot.gold)
+
+    if snapshot.experience != baseline.experience:
+        flags |= EXPERIENCE
+        changed_skills = [i for i in range(len(skill_titles)) if snapshot.experience[i] != baseline.experience[i]]
+        writer.varint(len(changed_skills))
+        for i in changed_skills:
+            writer.varint(i)
+            writer.varint(snapshot.experience[i])
+
+    if snapshot.shop != baseline.shop:
+
+        flags |= SHOP
+
+        write_sorted(writer, sorted(index for index in baseline.shop if index not in snapshot.shop))
+
+        changed_indexes = sorted(index for index, entry in snapshot.shop.items() if baseline.shop.get(index) != entry)
+        writer.varint(len(changed_indexes))
+        for index in changed_indexes:
+            writer.varint(index)
+            for value in snapshot.shop[index]:
+                writer.varint(value)
+
+    writer.buffer[flags_position] = flags
+
+    return writer.frame(length_room)
+
+
+def decode_snapshot(payload, snapshots):
+    # Read a snapshot frame's payload (after the kind byte) as the difference from the baseline snapshot it names,
+    # looked up in `snapshots` (seq -> snapshots the client has). Returns (seq, baseline seq, tick, snapshot)
+
+    reader = Reader(payload)
+
+    seq = reader.varint()
+    baseline_seq = reader.varint()
+    tick = reader.varint()
+    move_seq = reader.varint()
+    flags = reader.byte()
+
+    baseline = empty_snapshot if baseline_seq == 0 else snapshots[baseline_seq]
+
+    entities = baseline.entities
+    if flags & ENTITIES:
+
+        entities = dict(entities)
+
+        for entity_id in read_sorted(reader):
+            del entities[entity_id]
+
+        last = 0
+        for i in range(reader.varint()):
+            last += reader.varint()
+            entities[last] = (reader.varint(), reader.varint(), reader.varint())
+
+    depleted = baseline.depleted
+    if flags & DEPLETED:
+        depleted_now = read_positions(reader)
+        regenerated = read_positions(reader)
+        depleted = depleted.union(depleted_now).difference(regenerated)
+
+    inventory = baseline.inventory
+    if flags & INVENTORY:
+        inventory = list(inventory)
+        for i in range(reader.varint()):
+            slot = reader.varint()
+            inventory[slot] = reader.varint()
+        inventory = tuple(inventory)
+
+    gold = reader.varint() if flags & GOLD else baseline.gold
+
+    experience = baseline.experience
+    if flags & EXPERIENCE:
+        experience = list(experience)
+        for i in range(reader.varint()):
+            skill_index = reader.varint()
+            experience[skill_index] = reader.varint()
+        experience = tuple(experience)
+
+    shop = baseline.shop
+    if flags & SHOP:
+
+        shop = dict(shop)
+
+        for index in read_sorted(reader):
+            del shop[index]
+
+        for i in range(reader.varint()):
+            index = reader.varint()
+            shop[index] = (reader.varint(), reader.varint(), reader.varint())
+
+    return seq, baseline_seq, tick, Snapshot(entities, depleted, inventory, gold, experience, shop, move_seq)
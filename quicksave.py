@@ -0,0 +1,170 @@
+import os
+import zlib
+import queue
+import struct
+import threading
+from protocol import Writer, Reader, write_value, read_value
+from persistence import tables
+
+# Quick saves: the whole game's state in one compact, versioned binary file, to save and load at any time (F5/F9),
+# and autosaved every few minutes. Separate from the database the game saves to every tick (see `persistence.py`)
+# Saving never makes the game wait:
+# - on the game's thread, the state is captured as the same rows of each table as the database (`capture_state`):
+#   tuples of numbers and strings, which are never changed once made, so the worker thread can read them while the
+#   game carries on changing - a copy-on-write capture, taking well under a millisecond for the whole game
+# - the worker thread encodes the rows, compresses them, and writes them to a temporary file that then replaces the
+#   save, so a crash mid-write never leaves a half-written save. If several saves to the same file are waiting,
+#   only the latest is written. A save that can't be written (e.g. the disk is full) is given up on, with the error
+#   kept for the game to report, and the worker carries on with the next
+# Loading decodes the file straight back into rows, and puts them into the running game with `apply_state`: only
+# the dynamic state is saved, so the maps aren't re-built from their JSON
+# File format: the magic bytes, a version (2 bytes, big endian), then the zlib compressed rows:
+# - for each table: its name, its number of columns, its number of rows, then every row's values in column order
+# - each value is tagged with its type (see `write_value`)
+# The version goes up whenever the tables change, and saves of other versions aren't loaded
+
+magic = b'STARSAVE'
+save_version = 1
+
+path_to_quick_save = 'quicksave.sav'
+path_to_autosave = 'autosave.sav'
+
+
+def encode_save(state):
+    # The bytes of a save file holding the state (as `capture_state`)
+
+    writer = Writer()
+
+    for table, (keys, values) in tables.items():
+
+        rows = state[table]
+
+        write_value(writer, table)
+        writer.varint(len(keys) + len(values))
+        writer.varint(len(rows))
+
+        for key, row_values in rows.items():
+            for value in key + row_values:
+                write_value(writer, value)
+
+    return magic + struct.pack('>H', save_version) + zlib.compress(bytes(writer.buffer[:writer.position]))
+
+
+def decode_save(data):
+    # The state held in the bytes of a save file. Raises a ValueError if it can't be loaded: not a save, a different
+    # version, or damaged
+
+    header_size = len(magic) + 2
+
+    if data[:len(magic)] != magic or len(data) < header_size:
+        raise ValueError("Not a save file")
+
+    version, = struct.unpack('>H', data[len(magic):header_size])
+    if version != save_version:
+        raise ValueError("Save is version %s, but this game loads version %s" % (version, save_version))
+
+    try:
+        reader = Reader(zlib.decompress(data[header_size:]))
+
+        state = {}
+        for i in range(len(tables)):
+
+            table = read_value(reader)
+            columns = reader.varint()
+            keys, values = tables[table]
+            assert columns == len(keys) + len(values)
+
+            state[table] = {}
+            for j in range(reader.varint()):
+                row = tuple(read_value(reader) for column in range(columns))
+                state[table][row[:len(keys)]] = row[len(keys):]
+
+    except (zlib.error, IndexError, KeyError, AssertionError, UnicodeDecodeError) as e:
+        raise ValueError("Save file is damaged (%s)" % e.__class__.__name__)
+
+    return state
+
+
+def load_save(path):
+    # The state in a save file, and a message if it couldn't be loaded (the state is then None)
+
+    if not os.path.exists(path):
+        return None, "No save to load (%s)" % path
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    try:
+        return decode_save(data), None
+    except ValueError as e:
+        return None, "Couldn't load %s: %s" % (path, e)
+
+
+class SaveWriter:
+    # The worker thread encoding, compressing and writing saves (see the top). `save()` hands it a captured state
+    # and returns straight away; `close()` waits for every save handed to it to be written
+    # `last_error` is a message saying why the last save written failed, or None if it succeeded
+
+    def __init__(self):
+
+        self.pending = queue.SimpleQueue()
+
+        # Counts of saves written and saves that failed, and the size of the last one written
+        self.saves_written = 0
+        self.failures = 0
+        self.last_save_bytes = 0
+        self.last_error = None
+
+        self.worker = threading.Thread(target=self.run_saves, daemon=True)
+        self.worker.start()
+
+    def save(self, path, state):
+
+        self.pending.put((path, state))
+
+    def close(self):
+
+        self.pending.put(None)
+        self.worker.join()
+
+    def run_saves(self):
+
+        while True:
+
+            batch = [self.pending.get()]
+
+            while True:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Only the latest state waiting for each file needs writing
+            latest = {}
+            for save in batch:
+                if save is not None:
+                    latest[save[0]] = save[1]
+
+            for path, state in latest.items():
+                try:
+                    self.write(path, encode_save(state))
+                except OSError as e:
+                    self.failures += 1
+                    self.last_error = "Couldn't write %s (%s)" % (path, e.strerror or e)
+                else:
+                    self.last_error = None
+
+            if None in batch:
+                break
+
+    def write(self, path, data):
+
+        temporary_path = path + '.tmp'
+
+        with open(temporary_path, 'wb') as f:
+            f.write(data)
+
+        os.replace(temporary_path, path)
+
+        self.saves_written += 1
+        self.last_save_bytes = len(data)
@@ -0,0 +1,145 @@
+from items import Knife, Tinderbox
+from items import OakLog, WillowLog, MapleLog, YewLog, MagicLog
+from items import OakShortbow, WillowShortbow, MapleShortbow, YewShortbow, MagicShortbow
+
+# Registry of what using a tool on a resource in the inventory does, compiled once on import
+# Every (tool type, input type) combination that does something has a recipe, and anything else can't be combined
+# This doesn't depend on Qt, so the same recipes can be shared by the inventory, batch crafting and offline tools
+
+
+class Recipe:
+    # Using a `tool_type` on an `input_type` resource, which needs `level_required` in the skill titled `skill_title`
+    # Each input used gains `xp` in that skill, and either:
+    # - is replaced by an `output_type` item (e.g. a knife on a log makes a shortbow)
+    #   The xp is for generating the output, so appears in the skill's `xp_gain_per_generation`
+    # - is removed, if `output_type` is None (e.g. a tinderbox on a log burns it)
+    #   The xp is for processing the input, so appears in the skill's `xp_gain_per_process`
+    # `verb` describes the recipe for status messages, e.g. 'fletch', 'burn'
+    # If `lights_fire` is True, using it lights a fire on the map, so can only be done where a fire can be lit,
+    # and only one at a time. Otherwise using it on many inputs at once ('make all') happens instantly
+
+    def __init__(self, tool_type, input_type, output_type, skill_title, level_required, xp, verb, lights_fire=False):
+
+        self.tool_type = tool_type
+        self.input_type = input_type
+        self.output_type = output_type
+        self.skill_title = skill_title
+        self.level_required = level_required
+        self.xp = xp
+        self.verb = verb
+        self.lights_fire = lights_fire
+
+        # Requirements in the same form as transport tiles', for SkillSet.meets_requirements
+        self.requirements = {skill_title: level_required}
+
+        self.instant_batch = not lights_fire
+
+    def use(self, skills, tool, resources, visible_map):
+        # Use the tool on a list of resources of this recipe's input type, as one transaction
+        # Like other interactions, returns a dictionary saying if it succeeded, and if so the action for the inventory
+        # to take on the resources ('remove' or 'replace', along with the generated items to replace them with)
+
+        assert isinstance(tool, self.tool_type)
+        assert len(resources) > 0 and all(type(resource) == self.input_type for resource in resources)
+
+        # Check we have the skill level to use this tool (redundant for knives and tinderboxes, but good practice)
+        if not skills.can_use(tool):
+            return {
+                'success': False,
+                'message': "You don't have the skill level to use this %s" % tool.title.lower()
+            }
+
+        # Check we have the skill level to use the tool on this input
+        if not skills.meets_requirements(self.requirements):
+            return {
+                'success': False,
+                'message': "You need level %s %s to %s this %s" % (
+                    self.level_required, self.skill_title, self.verb, self.input_type.title.lower()
+                )
+            }
+
+        if self.lights_fire:
+
+            assert len(resources) == 1
+
+            # Check we can light a fire on the map
+            if not visible_map.can_light_fire():
+                return {
+                    'success': False,
+                    'message': "You cannot light a fire here"
+                }
+
+        if self.output_type is None:
+            # We are processing the inputs, e.g. burning logs and gaining firemaking xp
+            # Processing an item has a different skill mapping than generation (e.g. generating logs from tree)
+
+            skills.add_experience(resources, generated=False)
+
+            if self.lights_fire:
+                visible_map.light_fire(resources[0].ticks_for_fire_to_disappear)
+
+            return {
+                'success': True,
+                'action': 'remove'
+            }
+
+        # We are generating items, e.g. turning logs into shortbows, so gain generation xp for all of them in one go
+
+        generated_items = [self.output_type() for i in range(len(resources))]
+
+        skills.add_experience(generated_items, generated=True)
+
+        return {
+            'success': True,
+            'action': 'replace',
+            'generated_items': generated_items
+        }
+
+
+class RecipeBook:
+    # Index of recipes by (tool type, input type), so finding what a combination does is one lookup
+
+    def __init__(self, recipes):
+
+        self.recipes = {}
+
+        for recipe in recipes:
+            assert (recipe.tool_type, recipe.input_type) not in self.recipes
+            self.recipes[(recipe.tool_type, recipe.input_type)] = recipe
+
+    def lookup(self, tool_type, input_type):
+        # The recipe for using this type of tool on this type of resource, or None if they can't be combined
+
+        return self.recipes.get((tool_type, input_type))
+
+    def generation_xp(self, skill_title):
+        # Xp gained in a skill for each item generated by its recipes, in the form of a skill's `xp_gain_per_generation`
+
+        return {
+            recipe.output_type: recipe.xp for recipe in self.recipes.values()
+            if recipe.skill_title == skill_title and recipe.output_type is not None
+        }
+
+    def process_xp(self, skill_title):
+        # Xp gained in a skill for each input processed by its recipes, in the form of a skill's `xp_gain_per_process`
+
+        return {
+            recipe.input_type: recipe.xp for recipe in self.recipes.values()
+            if recipe.skill_title == skill_title and recipe.output_type is None
+        }
+
+
+recipe_book = RecipeBook([
+    # Fletching: knife on a log makes a shortbow of the log's type
+    Recipe(Knife, OakLog, OakShortbow, 'Fletching', OakLog.fletching_required, 30, 'fletch'),
+    Recipe(Knife, WillowLog, WillowShortbow, 'Fletching', WillowLog.fletching_required, 100, 'fletch'),
+    Recipe(Knife, MapleLog, MapleShortbow, 'Fletching', MapleLog.fletching_required, 250, 'fletch'),
+    Recipe(Knife, YewLog, YewShortbow, 'Fletching', YewLog.fletching_required, 400, 'fletch'),
+    Recipe(Knife, MagicLog, MagicShortbow, 'Fletching', MagicLog.fletching_required, 600, 'fletch'),
+    # Firemaking: tinderbox on a log burns it, lighting a fire on the map
+    Recipe(Tinderbox, OakLog, None, 'Firemaking', OakLog.firemaking_required, 60, 'burn', lights_fire=True),
+    Recipe(Tinderbox, WillowLog, None, 'Firemaking', WillowLog.firemaking_required, 100, 'burn', lights_fire=True),
+    Recipe(Tinderbox, MapleLog, None, 'Firemaking', MapleLog.firemaking_required, 250, 'burn', lights_fire=True),
+    Recipe(Tinderbox, YewLog, None, 'Firemaking', YewLog.firemaking_required, 500, 'burn', lights_fire=True),
+    Recipe(Tinderbox, MagicLog, None, 'Firemaking', MagicLog.firemaking_required, 750, 'burn', lights_fire=True)
+])
@@ -0,0 +1,512 @@
+import os
+import time
+import asyncio
+import argparse
+import numpy as np
+from collections import deque
+from actions import ActionScheduler
+from tiles import Player, BankChestTile
+from protocol import decode, encode_message, encode_snapshot, item_code, skill_titles
+from protocol import Writer, Snapshot, empty_snapshot, entity_type_to_code
+from world import World, GatherAction, title_to_item_type, directions
+from journal import JournaledWorld, JournalWriter, recover
+
+# Authoritative game server for multiplayer over a local network
+# Owns the whole world (see `world.py`) and runs the game tick, while clients (see `client.py`) send intents
+# (move, interact, buy, etc.) and are sent the state they need to display
+# Everything runs on one asyncio event loop:
+# - each client connection reads intents and applies them to the world straight away, so moves aren't held up
+#   waiting for the next game tick
+# - the game tick (1 sec, like the game's timer) regenerates trees/rocks, moves NPCs, burns fires, restocks shops,
+#   and steps every player's gathering action through the same `ActionScheduler` as the game
+# - changes are flushed to clients many times a game tick, as binary snapshots (see `protocol.py`) of what each
+#   player can see - the chunks of the map around them (their window, plus a margin) - and their own state
+#   Snapshots are sent as the difference from the last one the client acknowledged, with a whole snapshot (keyframe)
+#   every so often, and only rebuilt for clients where something they can see changed. So what it costs to
+#   serialize and send a client's state depends on how busy it is around them, not how big the world is or how
+#   many players there are. Writes are buffered (clients that stop reading are dropped)
+# E.g. `python server.py --port 8765`, then `python client.py --host localhost --port 8765 --name alice`
+
+try:
+    import resource
+except ImportError:
+    # Only on Unix - elsewhere the server doesn't report its memory use
+    resource = None
+
+# The fields each kind of intent has, and what each field has to be: a whole number (`int`), or one of a collection
+# of names (e.g. an item title)
+intent_fields = {
+    'move': {'direction': directions, 'seq': int},
+    'interact': {'x': int, 'y': int},
+    'buy': {'x': int, 'y': int, 'item': title_to_item_type, 'amount': int},
+    'sell': {'x': int, 'y': int, 'item': title_to_item_type, 'amount': int},
+    'deposit': {'item': title_to_item_type, 'amount': int},
+    'withdraw': {'item': title_to_item_type, 'amount': int},
+    'use': {'tool': title_to_item_type, 'item': title_to_item_type},
+    'ack': {'seq': int}
+}
+
+
+def read_intent(line):
+    # The intent sent in a line from a client, and a message if it isn't an intent the server understands (the intent
+    # is then None). Every field is checked here, before any of it is used, so a bad intent can't break the server
+
+    try:
+        intent = decode(line)
+    except ValueError:
+        return None, "Couldn't read intent"
+
+    if not isinstance(intent, dict) or intent.get('type') not in intent_fields:
+        return None, "Unknown intent"
+
+    for field, values in intent_fields[intent['type']].items():
+
+        value = intent.get(field)
+
+        if values is int:
+            # bool is a subclass of int, but isn't a number here
+            if type(value) != int:
+                return None, "Intent '%s' needs a whole number '%s'" % (intent['type'], field)
+
+        elif type(value) != str or value not in values:
+            return None, "Intent '%s' has no valid '%s'" % (intent['type'], field)
+
+    return intent, None
+
+
+class ClientConnection:
+    # A connected client and its player, and which shop/bank display it has open
+
+    def __init__(self, player, writer):
+
+        self.player = player
+        self.writer = writer
+
+        # Name of the map the client was last sent the state of, to notice when the player transports
+        self.map_name = None
+
+        # Position of the shop open on the client (on the player's map), and if the bank is open
+        self.open_shop = None
+        self.bank_open = False
+
+        # Chunks of the map the client was last sent a snapshot of, and if it needs a new snapshot regardless
+        # of whether anything changed in them (e.g. it opened a shop)
+        self.chunks = set()
+        self.stale = True
+
+        # Seq of the last move the client sent that's been applied
+        self.move_seq = 0
+
+        # Snapshots sent to the client that it might still take deltas against, by seq: the last one it acknowledged,
+        # and any sent since
+        self.snapshots = {}
+        self.seq = 0
+        self.acked_seq = None
+        self.keyframe_seq = 0
+
+        # Bytes sent to the client, for the server's stats
+        self.bytes_sent = 0
+
+    def send(self, data):
+
+        self.writer.write(data)
+        self.bytes_sent += len(data)
+
+    def acknowledge(self, seq):
+        # The client has the snapshot, so later deltas can be against it, and earlier ones are no longer needed
+
+        if seq in self.snapshots and (self.acked_seq is None or seq > self.acked_seq):
+
+            self.acked_seq = seq
+
+            for old_seq in [old_seq for old_seq in self.snapshots if old_seq < seq]:
+                del self.snapshots[old_seq]
+
+
+class ServerStats:
+    # How long game ticks and flushes take, how late ticks start (a tick starts late when the last tick and flushes
+    # took longer than a tick), and the server process's CPU time, since the stats were last reset
+    # Reported to monitoring connections (see `GameServer.handle_client`), e.g. the load test (see `loadtest.py`)
+    # Only the latest `size` durations of each are kept, so the stats don't grow if nothing resets them
+
+    def __init__(self, size=65536):
+
+        self.size = size
+        self.reset()
+
+    def reset(self):
+
+        self.tick_seconds = deque(maxlen=self.size)
+        self.flush_seconds = deque(maxlen=self.size)
+        self.tick_lateness = deque(maxlen=self.size)
+
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+
+    def report(self, clients):
+
+        def percentiles(durations):
+            # 50th, 95th and 99th percentiles, and the maximum, in ms
+            if not durations:
+                return None
+            return [round(1000 * value, 3) for value in np.percentile(list(durations), [50, 95, 99, 100])]
+
+        elapsed = time.perf_counter() - self.started
+
+        return {
+            'seconds': elapsed,
+            'clients': len(clients),
+            'tick_ms': percentiles(self.tick_seconds),
+            'flush_ms': percentiles(self.flush_seconds),
+            'tick_lateness_ms': percentiles(self.tick_lateness),
+            'cpu_percent': 100 * (time.process_time() - self.cpu_started) / elapsed if elapsed > 0 else 0.0,
+            # Peak resident memory, in KB on Linux
+            'max_rss_kb': None if resource is None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'bytes_sent': sum(client.bytes_sent for client in clients)
+        }
+
+
+class GameServer:
+
+    def __init__(self, world, tick_seconds=1.0, flush_seconds=0.05, maximum_buffered=1 << 20,
+                 keyframe_interval=100, maximum_snapshots=64):
+
+        self.world = world
+        self.tick_seconds = tick_seconds
+        self.flush_seconds = flush_seconds
+
+        # Clients that have this many bytes waiting to be sent are too slow to keep up, and are disconnected
+        self.maximum_buffered = maximum_buffered
+
+        # Every client is sent a keyframe at least this many snapshots apart, and when it has this many snapshots
+        # sent but not acknowledged (the baseline it acknowledged is dropped, so the next snapshot has to be whole)
+        self.keyframe_interval = keyframe_interval
+        self.maximum_snapshots = maximum_snapshots
+
+        # Snapshots are encoded into the same buffer, one after another
+        self.snapshot_writer = Writer()
+
+        # Gathering actions of every player, stepped once a game tick (players are keyed by their id)
+        self.action_scheduler = ActionScheduler()
+
+        # Mapping from player id to their connection
+        self.clients = {}
+
+        self.stats = ServerStats()
+
+    async def handle_client(self, reader, writer):
+        # Reading a line raises a ValueError if it's longer than the stream's limit, which ends the connection
+
+        try:
+            line = await reader.readline()
+        except (ConnectionError, ValueError):
+            line = b''
+
+        if not line:
+            # Connected and hung up without saying hello, e.g. checking the server is up
+            writer.close()
+            return
+
+        try:
+            hello = decode(line)
+        except ValueError:
+            hello = None
+
+        if not isinstance(hello, dict) or hello.get('type') not in ('stats', 'hello'):
+            writer.close()
+            return
+
+        if hello['type'] == 'stats':
+            # A monitoring connection rather than a player: send the stats (resetting them if asked) and hang up
+            stats = self.stats.report(list(self.clients.values()))
+            if hello.get('reset'):
+                self.stats.reset()
+                for client in self.clients.values():
+                    client.bytes_sent = 0
+            writer.write(encode_message({'type': 'stats', 'stats': stats}))
+            await writer.drain()
+            writer.close()
+            return
+
+        player = self.world.add_player(str(hello.get('name', 'player')))
+        client = ClientConnection(player, writer)
+        self.clients[player.id] = client
+
+        client.send(encode_message({'type': 'welcome', 'player': player.id}))
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                intent, message = read_intent(line)
+                if intent is None:
+                    self.message(client, message)
+                else:
+                    self.handle_intent(client, intent)
+
+        except (ConnectionError, ValueError):
+            pass
+
+        finally:
+            self.disconnect(client)
+
+    def disconnect(self, client):
+
+        if client.player.id not in self.clients:
+            return
+
+        del self.clients[client.player.id]
+        self.action_scheduler.cancel(client.player.id)
+        self.world.remove_player(client.player)
+        client.writer.close()
+
+    def message(self, client, text):
+
+        if text:
+            client.send(encode_message({'type': 'message', 'text': text}))
+
+    def handle_intent(self, client, intent):
+        # Apply an intent from the client to the world (checked by `read_intent`)
+
+        player = client.player
+        world_map = self.world.maps[player.map_name]
+        kind = intent['type']
+
+        if kind == 'move':
+            # Moving stops whatever the player was doing, and closes any shop/bank
+            # The client has already shown the move (see `ThinClient.predict`), and is told the move's seq in the next
+            # snapshot whether or not the player could move, so it can correct its prediction
+            self.action_scheduler.cancel(player.id)
+            client.open_shop, client.bank_open, client.stale = None, False, True
+            client.move_seq = intent['seq']
+            self.world.move(player, intent['direction'])
+
+        elif kind == 'interact':
+
+            x, y = intent['x'], intent['y']
+
+            if not world_map.in_bounds(x, y) or not world_map.is_adjacent(self.world.entity(player), x, y):
+                self.message(client, "Player not within one tile to interact - try moving closer")
+
+            elif (x, y) in world_map.nodes:
+                self.action_scheduler.start(player.id, GatherAction(self.world, player, x, y))
+
+            elif (x, y) in world_map.transports:
+                self.action_scheduler.cancel(player.id)
+                self.message(client, self.world.transport(player, x, y))
+
+            elif (x, y) in world_map.shops:
+                client.open_shop, client.bank_open, client.stale = (x, y), False, True
+                client.send(encode_message({'type': 'shop', 'x': x, 'y': y}))
+
+            elif world_map.tiles[y][x] is BankChestTile:
+                client.open_shop, client.bank_open, client.stale = None, True, True
+                client.send(encode_message({'type': 'bank', 'contents': self.bank_state()}))
+
+        elif kind in ('buy', 'sell'):
+
+            trade = self.world.buy if kind == 'buy' else self.world.sell
+            self.message(client, trade(
+                player, intent['x'], intent['y'], title_to_item_type[intent['item']], max(1, intent['amount'])
+            ))
+
+        elif kind in ('deposit', 'withdraw'):
+
+            self.bank_transaction(client, kind, title_to_item_type[intent['item']], max(1, intent['amount']))
+
+        elif kind == 'use':
+
+            self.message(client, self.world.use(player, title_to_item_type[intent['tool']], title_to_item_type[intent['item']]))
+
+        elif kind == 'ack':
+
+            client.acknowledge(intent['seq'])
+
+    def bank_transaction(self, client, kind, item_type, amount):
+        # Deposit to or withdraw from the shared bank
+
+        transaction = self.world.deposit if kind == 'deposit' else self.world.withdraw
+        self.message(client, transaction(client.player, item_type, amount))
+
+    def bank_state(self):
+
+        return self.world.bank_state()
+
+    def tick(self):
+        # One game tick of the world, then every player's action
+
+        self.world.tick()
+        self.action_scheduler.tick()
+
+    def snapshot(self, client):
+        # What the client's player can see, and their own state, now
+
+        player = client.player
+        world_map = self.world.maps[player.map_name]
+
+        shop = {}
+        if client.open_shop is not None:
+            shop = {
+                index: (item_type.sort_rank + 1, quantity, price)
+                for index, (item_type, quantity, price) in world_map.shop_state(*client.open_shop).items()
+            }
+
+        return Snapshot(
+            entities={
+                entity.id: (entity_type_to_code[entity.tile_type or Player], entity.x, entity.y)
+                for entity in world_map.entities_in(client.chunks)
+            },
+            depleted=world_map.depleted_in(client.chunks),
+            inventory=tuple(item_code(item) for item in player.inventory),
+            gold=player.gold,
+            experience=tuple(player.experience[title] for title in skill_titles),
+            shop=shop,
+            move_seq=client.move_seq
+        )
+
+    def send_snapshot(self, client, snapshot):
+        # Send the snapshot as the difference from the last one the client acknowledged, or whole if it's time for a
+        # keyframe (or the client hasn't acknowledged one we still have). Nothing is sent if nothing changed since the
+        # last snapshot sent
+
+        if client.seq in client.snapshots and snapshot.same_as(client.snapshots[client.seq]):
+            return
+
+        client.seq += 1
+
+        if client.acked_seq in client.snapshots and client.seq - client.keyframe_seq < self.keyframe_interval:
+            baseline_seq, baseline = client.acked_seq, client.snapshots[client.acked_seq]
+        else:
+            baseline_seq, baseline = 0, empty_snapshot
+            client.keyframe_seq = client.seq
+
+        # The transport may hold on to what it's given to write later, so it's given a copy of the frame, rather than
+        # a view of the buffer the next snapshot is encoded into
+        with encode_snapshot(self.snapshot_writer, client.seq, baseline_seq, self.world.ticks, snapshot, baseline) as frame:
+            client.send(bytes(frame))
+
+        client.snapshots[client.seq] = snapshot
+
+        if len(client.snapshots) > self.maximum_snapshots:
+            del client.snapshots[min(client.snapshots)]
+
+    def flush(self):
+        # Send every client a snapshot if something it can see changed since the last flush
+
+        map_name_to_dirty_chunks = {
+            map_name: world_map.take_changes() for map_name, world_map in self.world.maps.items()
+        }
+
+        if self.world.bank_dirty:
+            encoded_bank = encode_message({'type': 'bank', 'contents': self.bank_state()})
+            self.world.bank_dirty = False
+        else:
+            encoded_bank = None
+
+        for client in list(self.clients.values()):
+
+            player = client.player
+
+            # Players who moved to another map start again from a keyframe, as nothing they could see is still there
+            if client.map_name != player.map_name:
+                client.map_name = player.map_name
+                client.open_shop = None
+                client.snapshots = {}
+                client.acked_seq = None
+                client.stale = True
+                client.send(encode_message({'type': 'map', 'map': client.map_name}))
+
+            world_map = self.world.maps[player.map_name]
+            entity = world_map.entities[player.id]
+            chunks = world_map.chunks_around(entity.x, entity.y)
+
+            if client.stale or player.dirty or chunks != client.chunks \
+                    or not chunks.isdisjoint(map_name_to_dirty_chunks[player.map_name]):
+
+                client.chunks = chunks
+                client.stale = False
+                player.dirty = False
+
+                self.send_snapshot(client, self.snapshot(client))
+
+            # Outcomes of the player's actions since the last flush, e.g. why gathering stopped
+            for text in player.messages:
+                self.message(client, text)
+            player.messages.clear()
+
+            if encoded_bank is not None and client.bank_open:
+                client.send(encoded_bank)
+
+            if client.writer.transport.get_write_buffer_size() > self.maximum_buffered:
+                self.disconnect(client)
+
+    async def run_ticks(self):
+        # Fixed game tick, scheduled against the loop's clock so it doesn't drift however long a tick takes
+
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + self.tick_seconds
+
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            self.stats.tick_lateness.append(max(0.0, loop.time() - next_tick))
+            next_tick += self.tick_seconds
+
+            start = time.perf_counter()
+            self.tick()
+            self.stats.tick_seconds.append(time.perf_counter() - start)
+
+    async def run_flushes(self):
+
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+
+            start = time.perf_counter()
+            self.flush()
+            self.stats.flush_seconds.append(time.perf_counter() - start)
+
+    async def serve(self, host, port):
+
+        server = await asyncio.start_server(self.handle_client, host, port)
+
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.run_ticks(), self.run_flushes())
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="StarScape multiplayer server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--journal', default=None,
+                        help="record every change to the world to this journal, recovering from it if it exists")
+    parser.add_argument('--compact-ticks', type=int, default=3600, help="compact the journal every this many ticks")
+    args = parser.parse_args()
+
+    if args.journal is None:
+        server = GameServer(World())
+        print("Serving on %s:%s" % (args.host, args.port))
+        asyncio.run(server.serve(args.host, args.port))
+        return
+
+    # Journal the world (see `journal.py`), carrying on from where the journal left off if the server ran before
+    world = JournaledWorld(compact_ticks=args.compact_ticks)
+    if os.path.exists(args.journal):
+        recover(world, args.journal)
+        print("Recovered the world at tick %s from %s" % (world.ticks, args.journal))
+
+    journal = JournalWriter(args.journal)
+    world.start_journal(journal)
+
+    server = GameServer(world)
+    print("Serving on %s:%s, journaling to %s" % (args.host, args.port, args.journal))
+
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    finally:
+        journal.close()
+
+
+if __name__ == '__main__':
+    main()
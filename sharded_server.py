@@ -0,0 +1,567 @@
+import os
+import json
+import socket
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from bank_service import BankService, shared_account
+from protocol import Writer, Reader, split_frames, length_room, decode, encode_message
+from server import GameServer, ClientConnection, ServerStats, read_intent
+from world import World, PlayerState, player_from_record, title_to_item_type
+
+# Multiplayer server with each map in its own process, so the world runs on as many cores as there are maps
+# Maps only meet at transport tiles and the shared bank, so each can run as its own game server (a shard, see
+# `ShardServer`) with its own game tick and flushes, on its own core
+# A coordinator process (see `Coordinator`) holds every client's connection and is what clients connect to, with the
+# same protocol as `server.py` - clients can't tell the difference:
+# - it relays each client's intents to the shard hosting the player's map, and the shard's frames back to the client
+# - when a player transports to a map on another shard, the shard hands the player over (their inventory, gold and
+#   skills) through the coordinator to the shard with that map
+# - it runs the shared bank as a service (see `bank_service.py`): shards send it deposits and withdrawals, which are
+#   transactions on threads of the coordinator's, and it sends every shard the bank's new contents
+# Shards talk to the coordinator over a socket each (see `Link`)
+# E.g. `python sharded_server.py --port 8765`, then connect clients as usual
+
+# Link frames: a varint length, then a kind byte, the id of the player it's about (0 for none), and the data
+# Coordinator -> shard
+LINK_JOIN = 0          # JSON: a player arrives on one of the shard's maps, {'player': record, 'map', 'x', 'y', ...}
+LINK_INTENT = 1        # an intent line from the player's client
+# Shard -> coordinator
+LINK_FRAME = 3         # a frame for the player's client
+LINK_HANDOFF = 4       # JSON: the player transported to a map on another shard, in the same form as LINK_JOIN
+LINK_BANK_REQUEST = 5  # JSON: {'op': 'deposit'/'withdraw', 'item': title, 'amount': int}
+# Both ways
+LINK_LEAVE = 2         # the player's client disconnected (to the shard), or is to be hung up on (to the coordinator)
+LINK_BANK_REPLY = 6    # JSON: outcome of a bank request, for the player - sent back if the player has left the shard
+LINK_BANK_STATE = 7    # JSON: the bank's contents (to the shards when they change)
+LINK_STATS = 8         # JSON: a request for the shard's stats {'reset': bool}, and its reply
+
+
+class Link:
+    # One end of the connection between the coordinator and a shard
+    # Frames are encoded into one reused buffer (like snapshots) and copied out to the stream
+
+    def __init__(self, reader, writer):
+
+        self.reader = reader
+        self.writer = writer
+
+        self.frame_writer = Writer()
+
+    def send(self, kind, player_id, data):
+
+        self.frame_writer.reset(length_room)
+        self.frame_writer.byte(kind)
+        self.frame_writer.varint(player_id)
+        self.frame_writer.bytes(data)
+
+        with self.frame_writer.frame(length_room) as frame:
+            self.writer.write(bytes(frame))
+
+    def send_json(self, kind, player_id, message):
+
+        self.send(kind, player_id, json.dumps(message, separators=(',', ':')).encode())
+
+    async def frames(self):
+        # Every frame received, as (kind, player id, data), until the other end hangs up
+
+        received = bytearray()
+
+        while True:
+
+            data = await self.reader.read(65536)
+            if not data:
+                break
+
+            received.extend(data)
+
+            for kind, payload in split_frames(received):
+                reader = Reader(payload)
+                player_id = reader.varint()
+                yield kind, player_id, payload[reader.position:]
+
+
+class LinkWriter:
+    # Stands in for a client's stream writer on a shard: what's written goes over the link, for the coordinator to
+    # write to the client's connection
+    # The coordinator is the one that can see if a client is too slow to keep up, so nothing is buffered here
+
+    class Transport:
+
+        def get_write_buffer_size(self):
+            return 0
+
+    def __init__(self, link, player_id):
+
+        self.transport = LinkWriter.Transport()
+        self.link = link
+        self.player_id = player_id
+
+    def write(self, data):
+
+        self.link.send(LINK_FRAME, self.player_id, data)
+
+    def close(self):
+        pass
+
+
+class ShardServer(GameServer):
+    # Game server for some of the maps, with its players' clients behind the coordinator
+    # Everything but the bank is the same as `GameServer`: the bank's contents are a copy kept up to date by the
+    # coordinator, and deposits/withdrawals are requests to it, with the items out of the inventory while they're
+    # in flight
+
+    def __init__(self, world, **kwargs):
+
+        super().__init__(world, **kwargs)
+
+        # Connection to the coordinator (see `serve_link`)
+        self.link = None
+
+        # The bank's contents, as `World.bank_state`
+        self.bank_contents = []
+
+    def join(self, player_id, arrival):
+
+        player = player_from_record(arrival['player'], arrival['map'])
+        self.world.join(player, arrival['map'], arrival['x'], arrival['y'])
+
+        client = ClientConnection(player, LinkWriter(self.link, player_id))
+        self.clients[player_id] = client
+
+        # Carry on numbering snapshots and moves from where the last shard left off, so acknowledgements of its
+        # snapshots still on their way can't be mistaken for ones of ours
+        client.seq = client.keyframe_seq = arrival['seq']
+        client.move_seq = arrival['move_seq']
+
+    def hand_off_departures(self):
+        # Players who transported to a map on another shard leave this one, to be sent on by the coordinator
+
+        for player, x, y in self.world.take_departures():
+
+            client = self.clients.pop(player.id)
+
+            self.link.send_json(LINK_HANDOFF, player.id, {
+                'player': player.record(), 'map': player.map_name, 'x': x, 'y': y,
+                'seq': client.seq, 'move_seq': client.move_seq
+            })
+
+    def handle_intent(self, client, intent):
+
+        super().handle_intent(client, intent)
+        self.hand_off_departures()
+
+    def bank_transaction(self, client, kind, item_type, amount):
+
+        player = client.player
+
+        if not self.world.next_to_bank(player):
+            self.message(client, "You need to be next to a bank chest")
+            return
+
+        if kind == 'deposit':
+
+            items = player.remove_items(amount, item_type)
+
+            if not items:
+                self.message(client, "You have no %ss to deposit" % item_type.title)
+                return
+
+            amount = len(items)
+
+        else:
+
+            amount = min(amount, player.space_for())
+
+            if amount == 0:
+                self.message(client, "Inventory full")
+                return
+
+        self.link.send_json(LINK_BANK_REQUEST, player.id, {'op': kind, 'item': item_type.title, 'amount': amount})
+
+    def bank_reply(self, player_id, reply):
+        # Give the player what the bank sent back: the items it had no room for, or the items withdrawn
+
+        client = self.clients.get(player_id)
+
+        if client is None:
+            # The player left for another shard while the request was in flight - the coordinator sends it on
+            self.link.send_json(LINK_BANK_REPLY, player_id, reply)
+            return
+
+        player = client.player
+        item_type = title_to_item_type[reply['item']]
+
+        amount = reply['requested'] - reply['amount'] if reply['op'] == 'deposit' else reply['amount']
+        fits = min(amount, player.space_for())
+
+        if fits > 0:
+            player.add_items([item_type() for i in range(fits)])
+
+        if amount > fits:
+            # The inventory filled up (e.g. gathering) while waiting - put what doesn't fit back
+            self.link.send_json(LINK_BANK_REQUEST, player_id, {'op': 'deposit', 'item': reply['item'], 'amount': amount - fits})
+
+        self.message(client, reply['message'])
+
+    def bank_state(self):
+
+        return self.bank_contents
+
+    def flush(self):
+
+        self.hand_off_departures()
+        super().flush()
+
+    async def run_link(self):
+
+        async for kind, player_id, data in self.link.frames():
+
+            if kind == LINK_JOIN:
+                self.join(player_id, json.loads(data))
+
+            elif kind == LINK_INTENT and player_id in self.clients:
+                # Intents for a player who has just left for another shard are dropped, like intents sent while
+                # the player is between maps in one server
+                self.relayed_intent(self.clients[player_id], data)
+
+            elif kind == LINK_LEAVE and player_id in self.clients:
+                self.disconnect(self.clients[player_id])
+
+            elif kind == LINK_BANK_REPLY:
+                self.bank_reply(player_id, json.loads(data))
+
+            elif kind == LINK_BANK_STATE:
+                self.bank_contents = json.loads(data)
+                self.world.bank_dirty = True
+
+            elif kind == LINK_STATS:
+                stats = self.stats.report(list(self.clients.values()))
+                if json.loads(data).get('reset'):
+                    self.stats.reset()
+                    for client in self.clients.values():
+                        client.bytes_sent = 0
+                self.link.send_json(LINK_STATS, 0, stats)
+
+    def relayed_intent(self, client, line):
+        # Bad intents are checked for like in `GameServer.handle_client`, and the client told
+        # A shard hosts many players, so if an intent still fails, that client is dropped (the coordinator is asked to
+        # hang up on them) rather than the shard stopping, and every player on it with it
+
+        intent, message = read_intent(line)
+        if intent is None:
+            self.message(client, message)
+            return
+
+        try:
+            self.handle_intent(client, intent)
+        except (KeyError, TypeError, ValueError):
+            self.disconnect(client)
+            self.link.send(LINK_LEAVE, client.player.id, b'')
+
+    async def serve_link(self, link_socket):
+        # Run until the coordinator hangs up
+
+        self.link = Link(*await asyncio.open_connection(sock=link_socket))
+
+        tasks = [asyncio.create_task(self.run_ticks()), asyncio.create_task(self.run_flushes())]
+
+        await self.run_link()
+
+        for task in tasks:
+            task.cancel()
+
+
+def run_shard(map_names, shard_index, shard_count, link_socket, tick_seconds, flush_seconds):
+    # A shard's process
+    # Ids are counted in steps of one more than the number of shards, with the coordinator (which gives players their
+    # ids) counting from the step itself, so no two processes ever hand out the same id
+
+    world = World(map_names=map_names, first_id=shard_index + 1, id_step=shard_count + 1)
+    server = ShardServer(world, tick_seconds=tick_seconds, flush_seconds=flush_seconds)
+
+    asyncio.run(server.serve_link(link_socket))
+
+
+class RelayedClient:
+    # A client connected to the coordinator, and which shard its player is on
+
+    def __init__(self, writer, shard):
+
+        self.writer = writer
+        self.shard = shard
+
+        # Bytes sent to the client, for the server's stats
+        self.bytes_sent = 0
+
+    def send(self, data):
+
+        self.writer.write(data)
+        self.bytes_sent += len(data)
+
+
+class Coordinator:
+    # Starts a shard process for each group of maps, then relays between clients and the shards (see the top)
+
+    def __init__(self, map_groups, tick_seconds=1.0, flush_seconds=0.05, maximum_buffered=1 << 20, bank_threads=4):
+
+        self.map_groups = map_groups
+        self.tick_seconds = tick_seconds
+        self.flush_seconds = flush_seconds
+
+        # Clients that have this many bytes waiting to be sent are too slow to keep up, and are disconnected
+        self.maximum_buffered = maximum_buffered
+
+        # Which shard hosts each map
+        self.map_to_shard = {map_name: shard for shard, map_names in enumerate(map_groups) for map_name in map_names}
+
+        # Player ids, in steps so they never collide with the shards' ids for NPCs and fires (see `run_shard`)
+        self.id_step = len(map_groups) + 1
+        self.next_id = self.id_step
+
+        # Each shard's process, the coordinator's end of the socket to it, and the link over it once serving
+        self.processes = []
+        self.link_sockets = []
+        self.links = []
+
+        # Mapping from player id to their client
+        self.clients = {}
+
+        # Bank transactions run on threads, so the coordinator's event loop never waits for a commit
+        self.bank = BankService(on_commit=self.bank_committed)
+        self.bank_executor = ThreadPoolExecutor(max_workers=bank_threads)
+        self.bank_dirty = False
+
+        # Shards' replies to stats requests, one request at a time
+        self.stats = ServerStats()
+        self.stats_lock = asyncio.Lock()
+        self.stats_replies = asyncio.Queue()
+
+    def start_shards(self):
+        # Start the shards' processes
+        # They're started fresh rather than forked, so each only has its own end of its own socket open (and knows
+        # the coordinator is gone when it's closed), and none start as a copy of the coordinator's event loop
+
+        context = multiprocessing.get_context('spawn')
+
+        for shard, map_names in enumerate(self.map_groups):
+
+            coordinator_socket, shard_socket = socket.socketpair()
+
+            process = context.Process(
+                target=run_shard,
+                args=(map_names, shard, len(self.map_groups), shard_socket, self.tick_seconds, self.flush_seconds),
+                daemon=True
+            )
+            process.start()
+            shard_socket.close()
+
+            self.processes.append(process)
+            self.link_sockets.append(coordinator_socket)
+
+    def new_id(self):
+
+        player_id = self.next_id
+        self.next_id += self.id_step
+        return player_id
+
+    async def handle_client(self, reader, writer):
+        # Lines longer than the stream's limit end the connection, like in `GameServer.handle_client`
+
+        try:
+            line = await reader.readline()
+        except (ConnectionError, ValueError):
+            line = b''
+
+        if not line:
+            writer.close()
+            return
+
+        try:
+            hello = decode(line)
+        except ValueError:
+            hello = None
+
+        if not isinstance(hello, dict) or hello.get('type') not in ('stats', 'hello'):
+            writer.close()
+            return
+
+        if hello['type'] == 'stats':
+            writer.write(encode_message({'type': 'stats', 'stats': await self.report_stats(hello.get('reset'))}))
+            await writer.drain()
+            writer.close()
+            return
+
+        # A new player starts on the surface, like in `World.add_player`
+        player = PlayerState(self.new_id(), str(hello.get('name', 'player')), 'surface')
+        client = RelayedClient(writer, self.map_to_shard[player.map_name])
+        self.clients[player.id] = client
+
+        client.send(encode_message({'type': 'welcome', 'player': player.id}))
+        self.links[client.shard].send_json(LINK_JOIN, player.id, {
+            'player': player.record(), 'map': player.map_name, 'x': 2, 'y': 2, 'seq': 0, 'move_seq': 0
+        })
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.links[client.shard].send(LINK_INTENT, player.id, line)
+
+        except (ConnectionError, ValueError):
+            pass
+
+        finally:
+            self.disconnect(player.id)
+
+    def disconnect(self, player_id):
+
+        if player_id not in self.clients:
+            return
+
+        client = self.clients.pop(player_id)
+        self.links[client.shard].send(LINK_LEAVE, player_id, b'')
+        client.writer.close()
+
+    def bank_committed(self, records):
+        # Called on the bank's committer thread - the shards are sent the new contents with the next bank update
+
+        self.bank_dirty = True
+
+    def transact(self, request):
+        # Apply a bank request (on a bank thread), returning the reply: the request, with how many items were
+        # deposited/withdrawn, and a message for the player if none were
+
+        transaction = self.bank.deposit if request['op'] == 'deposit' else self.bank.withdraw
+        amount, message = transaction(shared_account, request['item'], request['amount'])
+
+        return {'op': request['op'], 'item': request['item'], 'requested': request['amount'], 'amount': amount,
+                'message': message}
+
+    def bank_request(self, player_id, request):
+        # Start the request on a bank thread, to reply when it's done
+
+        future = asyncio.get_running_loop().run_in_executor(self.bank_executor, self.transact, request)
+        future.add_done_callback(lambda future: self.send_bank_reply(player_id, future.result()))
+
+    def send_bank_reply(self, player_id, reply):
+        # Send the outcome of a bank request to the shard the player is on now
+
+        if player_id in self.clients:
+            self.links[self.clients[player_id].shard].send_json(LINK_BANK_REPLY, player_id, reply)
+
+        elif reply['op'] == 'withdraw' and reply['amount'] > 0:
+            # The player disconnected - put back what they were withdrawing
+            self.bank_request(player_id, {'op': 'deposit', 'item': reply['item'], 'amount': reply['amount']})
+
+    async def run_link(self, shard):
+
+        async for kind, player_id, data in self.links[shard].frames():
+
+            if kind == LINK_FRAME:
+                client = self.clients.get(player_id)
+                if client is not None:
+                    client.send(data)
+                    if client.writer.transport.get_write_buffer_size() > self.maximum_buffered:
+                        self.disconnect(player_id)
+
+            elif kind == LINK_HANDOFF:
+                arrival = json.loads(data)
+                if player_id in self.clients:
+                    client = self.clients[player_id]
+                    client.shard = self.map_to_shard[arrival['map']]
+                    self.links[client.shard].send(LINK_JOIN, player_id, data)
+
+            elif kind == LINK_BANK_REQUEST:
+                self.bank_request(player_id, json.loads(data))
+
+            elif kind == LINK_BANK_REPLY:
+                # Sent back by a shard the player has left
+                self.send_bank_reply(player_id, json.loads(data))
+
+            elif kind == LINK_LEAVE:
+                self.disconnect(player_id)
+
+            elif kind == LINK_STATS:
+                self.stats_replies.put_nowait(json.loads(data))
+
+        raise RuntimeError("Shard %s stopped" % shard)
+
+    async def run_bank_updates(self):
+        # Send the shards the bank's contents when they've changed, at most once a flush
+
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+
+            if self.bank_dirty:
+                self.bank_dirty = False
+                contents = self.bank.state(shared_account)
+                for link in self.links:
+                    link.send_json(LINK_BANK_STATE, 0, contents)
+
+    async def report_stats(self, reset):
+        # Stats of the whole server: the worst of the shards' tick and flush times (as every player is on one of
+        # them), and the CPU and memory of every process
+
+        async with self.stats_lock:
+
+            for link in self.links:
+                link.send_json(LINK_STATS, 0, {'reset': bool(reset)})
+
+            shard_stats = [await self.stats_replies.get() for link in self.links]
+
+        stats = self.stats.report(list(self.clients.values()))
+        if reset:
+            self.stats.reset()
+            for client in self.clients.values():
+                client.bytes_sent = 0
+
+        for key in ['tick_ms', 'flush_ms', 'tick_lateness_ms']:
+            reported = [shard[key] for shard in shard_stats if shard[key] is not None]
+            stats[key] = [max(values) for values in zip(*reported)] if reported else None
+
+        stats['cpu_percent'] += sum(shard['cpu_percent'] for shard in shard_stats)
+        if stats['max_rss_kb'] is not None:
+            stats['max_rss_kb'] += sum(shard['max_rss_kb'] for shard in shard_stats)
+        stats['shards'] = shard_stats
+
+        return stats
+
+    async def serve(self, host, port):
+
+        for link_socket in self.link_sockets:
+            self.links.append(Link(*await asyncio.open_connection(sock=link_socket)))
+
+        server = await asyncio.start_server(self.handle_client, host, port)
+
+        async with server:
+            await asyncio.gather(
+                server.serve_forever(), self.run_bank_updates(), *[self.run_link(shard) for shard in range(len(self.links))]
+            )
+
+
+def main():
+
+    map_names = sorted(file_name.replace('.json', '') for file_name in os.listdir('maps') if file_name.endswith('.json'))
+
+    parser = argparse.ArgumentParser(description="StarScape multiplayer server, with the maps in separate processes")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--shards', type=int, default=len(map_names), help="processes to share the maps between")
+    args = parser.parse_args()
+
+    shards = max(1, min(args.shards, len(map_names)))
+    map_groups = [map_names[shard::shards] for shard in range(shards)]
+
+    coordinator = Coordinator(map_groups)
+    coordinator.start_shards()
+    print("Serving on %s:%s, maps in %s processes: %s" % (
+        args.host, args.port, shards, ", ".join("+".join(map_names) for map_names in map_groups)
+    ))
+    asyncio.run(coordinator.serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
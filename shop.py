@@ -1,3 +1,4 @@
+import numpy as np
 from PyQt5.QtGui import QPixmap
 from items import concrete_types
 from utilities import generate_label
@@ -7,11 +8,10 @@ from PyQt5.QtWidgets import QWidget, QLabel, QGridLayout, QVBoxLayout, QHBoxLayo
 
 class ShopSlot(QWidget):
     # Represents a slot in the shop's 10 x 10 item grid (one out of the 100 slots) - similar code to BankSlot
-    # ShopSlot a wrapper around a collection of instantiated items of the same type for sale,
-    # Visually displayed in shop's grid as item icon, item name, and how many for sale
-    # If there are no items in the collection, it's effectively an empty slot placeholder and has no visual display
-    # Once added to the shop's grid, the slot object is permanently in that grid position, but by making the item list
-    # empty/non-empty as we sell/buy it effectively alternates between empty placeholder or collection of sellable items
+    # ShopSlot is a view onto one entry of the shop's stock model (`ShopStock`), displaying the item type for sale
+    # as item icon, item name, and how many for sale
+    # If nothing is for sale at the slot's index, it's effectively an empty slot placeholder and has no visual display
+    # Once added to the shop's grid, the slot object is permanently in that grid position
 
     slot_clicked = pyqtSignal(int, type)  # number to buy x type of item buying
 
@@ -27,11 +27,12 @@ class ShopSlot(QWidget):
 
         self.setFixedSize(QSize(self.slot_width, self.slot_height))
 
-        # `self.items` and `self.item_type` either:
-        # - an empty list and None if no items being stored here: empty placeholder for slot in shop
-        # - or a list of item instances and the concrete type of item objects in the list (guaranteed to all be same)
-        self.items = []
+        # `self.item_type`, `self.quantity` and `self.buy_price` either:
+        # - None, 0 and None if no items for sale here: empty placeholder for slot in shop
+        # - or the concrete type of item for sale, how many are for sale, and the current price of buying one
         self.item_type = None
+        self.quantity = 0
+        self.buy_price = None
 
         # A shop slot visually represented as the item's image, its title, and how many in this slot (how many for sale)
         slot_layout = QVBoxLayout()
@@ -59,26 +60,20 @@ class ShopSlot(QWidget):
         self.buy_all_action.triggered.connect(self.buy_all_clicked)
 
     def update_text_label(self):
-        # Update QLabel visually representing the item's title and the number of items stored in shop slot
-        # Need to update whenever:
-        # - all items of the type removed, so now it's an empty placeholder
-        # - some items added so it's no longer empty: set to the title and how many now in shop
-        # - some more items were added and it was non-empty to begin with: update how many in shop
+        # Update QLabel visually representing the item's title and the number of items for sale
 
-        if len(self.items) == 0:
+        if self.quantity == 0:
             # Empty, remove text
             self.text_label.setText("")
 
         else:
             # Not empty, so include text: item title x amount for sale
-            self.text_label.setText("%s x %s" % (self.item_type.title, len(self.items)))
+            self.text_label.setText("%s x %s" % (self.item_type.title, self.quantity))
 
     def update_item_image(self):
-        # Only call this method when we want to change the image, i.e.
-        # empty -> non-empty (so add image): when adding
-        # non-empty -> empty (so remove image): when removing
+        # Only call this method when we want to change the image, i.e. empty <-> non-empty, or a different item type
 
-        if len(self.items) == 0:
+        if self.quantity == 0:
             # Now empty, remove image
             self.item_image.clear()
 
@@ -92,77 +87,45 @@ class ShopSlot(QWidget):
     def is_empty_slot(self):
         # Is the slot not representing items for sale i.e. an empty placeholder
 
-        return len(self.items) == 0
+        return self.quantity == 0
 
-    def add_items(self, new_items):
-        # Add items to the shop slot, whether it was empty before or not empty
-        # If it was not empty, we assume (and check) all the items being added are the same type as those already stored
+    def set_contents(self, item_type, quantity, buy_price):
+        # Re-draw the slot to display the entry at its index in the shop's stock model
+        # A stocked item type that has sold out is displayed as an empty slot until it restocks
+        # Only create a new QPixmap if the slot changes between empty and non-empty, or changes item type
 
-        assert len(new_items) > 0
+        if quantity == 0:
+            item_type, buy_price = None, None
 
-        if len(self.items) == 0:
-            # Was empty, now need to make it not empty
+        image_changed = item_type != self.item_type
 
-            self.items.extend(new_items)
-            self.item_type = type(self.items[0])
+        self.item_type = item_type
+        self.quantity = quantity
+        self.buy_price = buy_price
 
-            # Only add an image if there wasn't something here before to save creating new QPixmaps constantly
+        if image_changed:
             self.update_item_image()
 
-        else:
-            # Already items here, add to collection
-
-            self.items.extend(new_items)
-
-        # Update text in both cases, empty -> non-empty and non-empty -> non-empty
         self.update_text_label()
 
-        # Check all the item types in this slot's item collection are the same after adding new items
-        assert all(type(self.items[i]) == self.item_type for i in range(len(self.items)))
-
-    def remove_items(self, amount):
-        # This function is called from Shop.buy_from(), and it will only request an amount that is never more
-        # than what is in the shop slot.
-        # This is because buy_from() is emitted to when we right-click buy from a non-empty shop slot
-        # and the options for buying (e.g. buy 1, 5, etc.) are dynamically presented on a right-click,
-        # based on how many is in the slot
-        # (actual amount passed in is what was requested, but capped at inventory space or what we can afford)
-
-        assert 0 < amount <= len(self.items)
-        assert len(self.items) > 0
-
-        removed_items = self.items[:amount]
-        self.items = self.items[amount:]
-
-        if len(self.items) == 0:
-            # If no more items, make sure to set item type of shop slot to None
-            # Only update image if we removed it, otherwise it would be the same and creating new QPixmaps constantly
-            self.item_type = None
-            self.update_item_image()
-
-        # Update text label in both cases: non-empty -> empty and non-empty -> non-empty
-        self.update_text_label()
-
-        return removed_items
-
     def contextMenuEvent(self, e):
 
-        if len(self.items) > 0:
+        if self.quantity > 0:
             # Only want to right-click on shop slots that actually have items
             # Only add the actions we have the number of items for, e.g. don't add 'buy 10' if we only have 5 items
 
-            self.status_bar_signal.emit("%s costs %sg to buy" % (self.item_type.title, self.item_type.buy_price))
+            self.status_bar_signal.emit("%s costs %sg to buy" % (self.item_type.title, self.buy_price))
 
             context = QMenu(self)
             context.addAction(self.buy_one_action)
 
-            if len(self.items) >= 5:
+            if self.quantity >= 5:
                 context.addAction(self.buy_five_action)
 
-            if len(self.items) >= 10:
+            if self.quantity >= 10:
                 context.addAction(self.buy_ten_action)
 
-            if len(self.items) >= 2:
+            if self.quantity >= 2:
                 context.addAction(self.buy_all_action)
 
             context.exec_(e.globalPos())
@@ -172,8 +135,8 @@ class ShopSlot(QWidget):
 
         self.status_bar_signal.emit("")
 
-        if e.button() == Qt.LeftButton and len(self.items) > 0:
-            self.status_bar_signal.emit("%s costs %sg to buy" % (self.item_type.title, self.item_type.buy_price))
+        if e.button() == Qt.LeftButton and self.quantity > 0:
+            self.status_bar_signal.emit("%s costs %sg to buy" % (self.item_type.title, self.buy_price))
 
         e.ignore()
 
@@ -191,25 +154,295 @@ class ShopSlot(QWidget):
 
     def buy_all_clicked(self):
 
-        self.slot_clicked.emit(len(self.items), self.item_type)
+        self.slot_clicked.emit(self.quantity, self.item_type)
+
+
+class ShopStock:
+    # The stock model behind a shop display, with the shop's economy: what it stocks, how many, and at what price
+    # There is one instance per shop tile, so every shopkeeper keeps their own stock
+    # Each stocked item type takes one entry (one slot in the shop grid) and has:
+    # - a base quantity: how many the shop normally stocks. Initial stock sets this, and types we sell to the shop
+    #   that it doesn't normally stock have a base quantity of 0
+    # - the current stock, which drifts back towards the base quantity by one item every `ticks_per_restock` ticks,
+    #   restocking if we bought below the base, or depleting if we oversold past it
+    # - base prices (the item type's `buy_price` and `sell_price`) and an elasticity, which scale the prices by how
+    #   far the current stock is from the base: buying gets more expensive as the shop runs low, and selling pays less
+    #   as we sell past the base quantity
+    # Entries are stored in fixed-size NumPy arrays indexed by slot (item types in a parallel list, None if unused),
+    # so the shop economy can restock/deplete every entry of a shop in one vectorised pass per game tick
+    # Item instances aren't stored, just how many there are - bought items are instantiated when they are bought
+    # Changed entries are accumulated in `self.dirty_indexes`, for the shop display to re-draw only those slots
+
+    # Bounds on how far stock levels can push prices away from the base prices
+    minimum_price_multiplier = 0.25
+    maximum_price_multiplier = 3.0
+
+    def __init__(self, init_items, limit, elasticity, ticks_per_restock):
+
+        self.limit = limit
+        self.default_elasticity = elasticity
+        self.ticks_per_restock = ticks_per_restock
+
+        self.item_types = [None for i in range(self.limit)]
+        self.type_to_index = {}
+
+        self.stock = np.zeros(self.limit, dtype=np.int64)
+        self.base_stock = np.zeros(self.limit, dtype=np.int64)
+        self.base_buy_price = np.zeros(self.limit, dtype=np.float64)
+        self.base_sell_price = np.zeros(self.limit, dtype=np.float64)
+        self.elasticity = np.zeros(self.limit, dtype=np.float64)
+        self.ticks_since_change = np.zeros(self.limit, dtype=np.int64)
+
+        self.dirty_indexes = set()
+
+        # The initial stock items define what the shop stocks, and the base quantity of each
+        for item in init_items:
+
+            item_type = type(item)
+            assert item_type in concrete_types
+
+            index = self.find_item_type_index(item_type)
+
+            if index is None:
+                index = self.add_entry(item_type)
+
+            self.stock[index] += 1
+            self.base_stock[index] += 1
+
+    def add_entry(self, item_type):
+        # Start stocking a new item type in the first unused entry, with a base quantity of 0
+
+        index = self.item_types.index(None)
+
+        self.item_types[index] = item_type
+        self.type_to_index[item_type] = index
+
+        self.stock[index] = 0
+        self.base_stock[index] = 0
+        self.base_buy_price[index] = item_type.buy_price
+        self.base_sell_price[index] = item_type.sell_price
+        self.elasticity[index] = self.default_elasticity
+        self.ticks_since_change[index] = 0
+
+        self.dirty_indexes.add(index)
+
+        return index
+
+    def restore(self, entries):
+        # Replace every entry with saved ones (e.g. loading a saved game), each given as
+        # (index, item type, stock, base quantity, ticks since the stock last changed)
+
+        for index, item_type in enumerate(self.item_types):
+            if item_type is not None:
+                del self.type_to_index[item_type]
+                self.item_types[index] = None
+                self.dirty_indexes.add(index)
+
+        for index, item_type, stock, base_stock, ticks_since_change in entries:
+
+            assert self.item_types[index] is None and item_type in concrete_types
+
+            self.item_types[index] = item_type
+            self.type_to_index[item_type] = index
+
+            self.stock[index] = stock
+            self.base_stock[index] = base_stock
+            self.base_buy_price[index] = item_type.buy_price
+            self.base_sell_price[index] = item_type.sell_price
+            self.elasticity[index] = self.default_elasticity
+            self.ticks_since_change[index] = ticks_since_change
+
+            self.dirty_indexes.add(index)
+
+    def remove_entry(self, index):
+        # Stop stocking an item type the shop doesn't normally stock, once it's all gone, freeing up its slot
+
+        assert self.stock[index] == 0 and self.base_stock[index] == 0
+
+        del self.type_to_index[self.item_types[index]]
+        self.item_types[index] = None
+
+        self.dirty_indexes.add(index)
+
+    def find_item_type_index(self, item_type):
+        # Entry index for this concrete item type, or None if the shop doesn't stock it
+
+        return self.type_to_index.get(item_type)
+
+    def space_for(self, item_type):
+        # There is space to sell an item type to the shop if it already stocks it, or there is an unused entry
+
+        if self.find_item_type_index(item_type) is not None:
+            return True
+
+        return len(self.type_to_index) < self.limit
+
+    def quantity(self, index):
+
+        return int(self.stock[index])
+
+    def price_multiplier(self, index, stock):
+        # How far the price of the item at `index` is from its base prices when the shop has `stock` of it
+        # Linear in how far stock is below (more expensive) or above (cheaper) the base quantity,
+        # relative to the base quantity, and clamped so prices never go to zero or run away
+
+        base_stock = self.base_stock[index]
+        multiplier = 1 + self.elasticity[index] * (base_stock - stock) / max(base_stock, 1)
+
+        return min(max(multiplier, self.minimum_price_multiplier), self.maximum_price_multiplier)
+
+    def buy_price(self, index, stock=None):
+        # Price of buying one item from this entry, at the current stock level unless specified
+        # We never buy an item for less than 1 gold
+
+        if stock is None:
+            stock = self.stock[index]
+
+        return max(1, int(round(self.base_buy_price[index] * self.price_multiplier(index, stock))))
+
+    def sell_price(self, item_type, stock=None):
+        # Price the shop pays for one item of this type, at the current stock level unless specified
+        # If the shop doesn't stock the type yet, price as if it did with a base quantity of 0
+
+        index = self.find_item_type_index(item_type)
+
+        if index is None:
+            stock = 0 if stock is None else stock
+            multiplier = 1 - self.default_elasticity * stock
+            multiplier = min(max(multiplier, self.minimum_price_multiplier), self.maximum_price_multiplier)
+            return int(round(item_type.sell_price * multiplier))
+
+        if stock is None:
+            stock = self.stock[index]
+
+        return int(round(self.base_sell_price[index] * self.price_multiplier(index, stock)))
+
+    def buy_cost(self, index, amount):
+        # Total cost of buying `amount` items from this entry one after another, each at the price for the stock left
+
+        stock = int(self.stock[index])
+        assert amount <= stock
+
+        return sum(self.buy_price(index, stock - i) for i in range(amount))
+
+    def affordable_amount(self, index, gold, amount):
+        # How many of `amount` items (bought one after another, getting more expensive) we can afford with `gold`
+
+        stock = int(self.stock[index])
+        cost = 0
+
+        for i in range(amount):
+
+            cost += self.buy_price(index, stock - i)
+
+            if cost > gold:
+                return i
+
+        return amount
+
+    def buy(self, amount, item_type):
+        # Remove `amount` items of the type from stock, returning the new item instances and how much they cost
+        # The amount is guaranteed to be in stock
+
+        index = self.find_item_type_index(item_type)
+        assert index is not None
+        assert 0 < amount <= self.stock[index]
+
+        cost = self.buy_cost(index, amount)
+
+        self.stock[index] -= amount
+        self.dirty_indexes.add(index)
+
+        return [item_type() for i in range(amount)], cost
+
+    def sell(self, items_to_sell):
+        # Add a non-empty list of items, all of the same type, to stock, returning the gold made from selling them
+        # Each item is priced at the stock level when it's sold, so overselling past the base quantity pays less
+        # We assume in this function there is space_for() the item type
+
+        assert len(items_to_sell) > 0
+        assert all(type(x) in concrete_types for x in items_to_sell)
+
+        item_type_to_sell = type(items_to_sell[0])
+
+        assert all(type(items_to_sell[i]) == item_type_to_sell for i in range(len(items_to_sell)))
+        assert self.space_for(item_type_to_sell)
+
+        index = self.find_item_type_index(item_type_to_sell)
+
+        if index is None:
+            index = self.add_entry(item_type_to_sell)
+
+        stock = int(self.stock[index])
+        gold_made = sum(self.sell_price(item_type_to_sell, stock + i) for i in range(len(items_to_sell)))
+
+        self.stock[index] += len(items_to_sell)
+        self.dirty_indexes.add(index)
+
+        return gold_made
+
+    def tick(self):
+        # Called once every game tick (by the ShopEconomy), processing every entry of this shop at once
+        # Entries whose stock is away from its base quantity count ticks, and every `ticks_per_restock` ticks
+        # move one item back towards the base quantity (restocking or depleting)
+        # Types the shop doesn't normally stock are dropped from the shop once they have depleted to nothing
+
+        away_from_base = self.stock != self.base_stock
+
+        self.ticks_since_change[away_from_base] += 1
+        self.ticks_since_change[~away_from_base] = 0
+
+        due = self.ticks_since_change >= self.ticks_per_restock
+
+        if not due.any():
+            return
+
+        self.stock[due] += np.sign(self.base_stock[due] - self.stock[due])
+        self.ticks_since_change[due] = 0
+
+        for index in np.flatnonzero(due).tolist():
+
+            self.dirty_indexes.add(index)
+
+            if self.stock[index] == 0 and self.base_stock[index] == 0:
+                self.remove_entry(index)
+
+
+class ShopEconomy:
+    # Drives the restocking and depleting of every shop's stock in the game
+    # Rather than a timer per shop slot, the game timer calls `tick()` once per game tick,
+    # which processes all the shops in one pass, each shop's entries updated together as NumPy arrays
+
+    def __init__(self):
+
+        self.stocks = []
+
+    def add_stock(self, stock):
+
+        self.stocks.append(stock)
+
+    def tick(self):
+
+        for stock in self.stocks:
+            stock.tick()
 
 
 class Shop(QWidget):
     # A widget representing a shop interface, that will replace main game map display when opened
     # There is one shop instance for each shop interface tile, so they have unique stock items
     # They are opened when corresponding shop interface tile (e.g. shopkeeper) is clicked on and player within 1 tile
-    # The shop is represented as a 10x10 grid, with each slot a ShopSlot object, that is either an empty placeholder,
-    # or wraps a collection of non-zero items of the same type for sale
+    # The shop is represented as a 10x10 grid of ShopSlot objects, slot i displaying entry i of the shop's stock model
     # There is guaranteed to be only one shop slot for each item type
 
-    def __init__(self, shop_title, init_items, status_bar_signal):
-        # Different shop types (e.g. general shop or blacksmith) may stock different initial items: `init_items`
+    def __init__(self, shop_title, stock, status_bar_signal):
+        # Different shop types (e.g. general shop or blacksmith) stock different items: `stock`
 
         super().__init__()
 
         self.total_width = 1300
         self.total_height = 850
 
+        self.stock = stock
         self.status_bar_signal = status_bar_signal
 
         self.setFixedSize(QSize(self.total_width, self.total_height))
@@ -222,6 +455,8 @@ class Shop(QWidget):
         self.cols = 10
         self.shop_limit = self.rows * self.cols
 
+        assert self.stock.limit == self.shop_limit
+
         self.slot_width = int(self.total_width/self.cols)
         self.slot_height = int(self.grid_height/self.rows)
 
@@ -229,13 +464,16 @@ class Shop(QWidget):
         self.shop.setContentsMargins(10, 10, 10, 10)
         self.shop.setSpacing(2)
 
-        # Fill all the grid slots with empty shop slots
+        # Fill all the grid slots with shop slots, keeping a list of them indexed the same as the stock model
+        self.slots = []
+
         for i in range(self.shop_limit):
 
             col, row = i % 10, int(i/10)
-            empty_shop_slot = ShopSlot(self.slot_width, self.slot_height, self.status_bar_signal)
-            empty_shop_slot.slot_clicked.connect(self.buy_from)
-            self.shop.addWidget(empty_shop_slot, row, col)
+            shop_slot = ShopSlot(self.slot_width, self.slot_height, self.status_bar_signal)
+            shop_slot.slot_clicked.connect(self.buy_from)
+            self.shop.addWidget(shop_slot, row, col)
+            self.slots.append(shop_slot)
 
         # Put bold 'SHOP' and a close button above grid layout
 
@@ -256,22 +494,9 @@ class Shop(QWidget):
 
         self.setLayout(overall_layout)
 
-        # Add the initial stock items
-        # Can handle a list containing items of different type, as we add lists of 1 item, one at a time
-        for item in init_items:
-
-            item_type = type(item)
-            assert item_type in concrete_types
-
-            # See if there is a slot for this item already; if so add there, otherwise add to the first new empty slot
-            # We assume space in shop for all initial items (i.e. number of unique types <= the shop's limit)
-
-            slot = self.find_item_type_slot(item_type)
-
-            if slot is None:
-                self.find_first_empty_slot().add_items([item])
-            else:
-                slot.add_items([item])
+        # Draw the initial stock into the slots
+        self.stock.dirty_indexes.clear()
+        self.redraw_slots(range(self.shop_limit))
 
     def set_inventory_reference(self, inventory):
         # Will be called from main Game class after map initialization
@@ -280,84 +505,49 @@ class Shop(QWidget):
 
         self.inventory = inventory
 
-    def find_item_type_slot(self, item_type):
-        # Searches all the slots to see if we have items of the type we are looking for stored in a shop slot
-        # Will only ever pass in concrete types, not abstract types, so check types equal, not isinstance()
-        # There will only ever be one slot for a given item type, so return first we find
-        # Returns None if there is not a slot holding items of this type
+    def redraw_slots(self, indexes):
+        # Re-draw only the shop slots at the given indexes to match the stock model
 
-        for i in range(self.shop_limit):
+        for i in indexes:
 
-            col, row = i % 10, int(i/10)
-            slot = self.shop.itemAtPosition(row, col).widget()
-
-            if slot.item_type == item_type:
-                return slot
+            item_type = self.stock.item_types[i]
+            buy_price = None if item_type is None else self.stock.buy_price(i)
+            self.slots[i].set_contents(item_type, self.stock.quantity(i), buy_price)
 
-        return None
+    def redraw_dirty_slots(self):
+        # Re-draw the slots whose stock changed since we last drew them, e.g. restocked by the shop economy
 
-    def find_first_empty_slot(self):
-        # Searches the slots until we find an empty one (i.e. one with no items)
-        # If there is no empty slot in the grid, return None
+        dirty_indexes = self.stock.dirty_indexes
+        self.stock.dirty_indexes = set()
+        self.redraw_slots(sorted(dirty_indexes))
 
-        for i in range(self.shop_limit):
-
-            col, row = i % 10, int(i/10)
-            slot = self.shop.itemAtPosition(row, col).widget()
+    def showEvent(self, e):
+        # The shop's stock keeps changing when it isn't visible, so catch up on re-drawing when we show it again
 
-            if len(slot.items) == 0:
-                return slot
-
-        return None
+        self.redraw_dirty_slots()
 
     def space_for(self, item_type):
         # There is space for an item type if either:
-        # 1) there is already a slot in the grid holding this item type, in which case we can extend the items there
-        # 2) if not, then there is at least one empty slot, where we can convert to a non-empty slot holding the items
-        # Just because each slot in the shop has items in it, does not mean it's full
-        # It's only full if there are no items of this type already where we can add to, *and* there are no empty slots
+        # 1) the shop already stocks this item type
+        # 2) if not, there is at least one unused entry where the shop can start stocking it
         # That's why `space_for` is parameterized by an item type
 
-        if self.find_item_type_slot(item_type) is not None:
-            return True
+        return self.stock.space_for(item_type)
 
-        if self.find_first_empty_slot() is not None:
-            return True
+    def sell_price(self, item_type):
+        # Price the shop currently pays for one item of this type
 
-        return False
+        return self.stock.sell_price(item_type)
 
     def sell_to(self, items_to_sell):
-        # Takes a non-empty list of items, and adds to the shop's grid
-        # - If already items of the same type in shop, add to that slot
-        # - Otherwise, add to the first empty slot
-        # We assume in this function we can sell the items, i.e. there is space_for() the item types
+        # Takes a non-empty list of items of the same type, and adds to the shop's stock
+        # We assume in this function we can sell the items, i.e. there is space_for() the item type
+        # Returns gold made in selling to shop, which depends on how much the shop already has in stock
 
-        # Check there is at least one item to sell, all the items are concrete item types
-        assert len(items_to_sell) > 0
-        assert all(type(x) in concrete_types for x in items_to_sell)
-
-        # Get item type of items we're trying to sell, and check they're all the same type and there is space for them
-        item_type_to_sell = type(items_to_sell[0])
-
-        assert all(type(items_to_sell[i]) == item_type_to_sell for i in range(len(items_to_sell)))
-        assert self.space_for(item_type_to_sell)
-
-        # Search all the slots to see if we already have a slot for items of this type
-        slot = self.find_item_type_slot(item_type_to_sell)
-
-        if slot is None:
-            # Need to make a new item type slot in grid - find the first empty slot, and add there
-            # Guaranteed to be one as we checked for the space for above
-            empty_slot = self.find_first_empty_slot()
-            empty_slot.add_items(items_to_sell)
-
-        else:
-            # We are already selling it, just add items to the slot
-            slot.add_items(items_to_sell)
+        gold_made = self.stock.sell(items_to_sell)
+        self.redraw_dirty_slots()
 
-        # Return gold made in selling to shop
-        price_of_item = items_to_sell[0].sell_price
-        return len(items_to_sell) * price_of_item
+        return gold_made
 
     def buy_from(self, amount, item_type_to_buy):
         # Item type guaranteed to already be in shop because we will have right-clicked on it and emitted to this slot
@@ -368,31 +558,30 @@ class Shop(QWidget):
             self.status_bar_signal.emit("Inventory full - cannot buy any items")
             return
 
-        cost_of_item = item_type_to_buy.buy_price
-        afford_to_buy = self.inventory.gold_pouch.can_afford_to_buy(cost_of_item)
-
-        if afford_to_buy == 0:
-            self.status_bar_signal.emit("Cannot afford to buy any of this item")
-            return
-
-        slot = self.find_item_type_slot(item_type_to_buy)
-        assert slot is not None
+        index = self.stock.find_item_type_index(item_type_to_buy)
+        assert index is not None
 
         # We only want to buy exactly the amount we can manage, which depends on three factors
         # - the amount we actually requested - this amount is guaranteed to be in shop because only way buy_from()
         #   is called is by emitting from a shop slot right click, and the right click options dynamically show up
         #   depending on amount of items there is, e.g. won't offer "Buy 5" if only 4 items in stock
         # - the space in our inventory
-        # - how many we can afford based on the gold we have
+        # - how many we can afford based on the gold we have (each one bought is pricier as the stock runs down)
         amount_to_buy = min([
             amount,
-            self.inventory.space_for(),
-            afford_to_buy
+            self.inventory.space_for()
         ])
 
+        amount_to_buy = self.stock.affordable_amount(index, self.inventory.gold_pouch.gold, amount_to_buy)
+
+        if amount_to_buy == 0:
+            self.status_bar_signal.emit("Cannot afford to buy any of this item")
+            return
+
         # Do the transaction - remove from shop, add to inventory, reduce gold
-        bought_items = slot.remove_items(amount_to_buy)
+        bought_items, cost = self.stock.buy(amount_to_buy, item_type_to_buy)
+        self.redraw_dirty_slots()
         self.inventory.add_to(bought_items)
-        self.inventory.gold_pouch.remove_gold(amount_to_buy * cost_of_item)
+        self.inventory.gold_pouch.remove_gold(cost)
 
         self.status_bar_signal.emit("")
@@ -0,0 +1,243 @@
+import argparse
+import numpy as np
+from skills import Woodcutting, Mining
+from tiles import code_to_feature, Interactable
+from tables import success_rate_table, max_level, experience_table
+
+# Command line tool for balancing trees and rocks, by simulating many gathering sessions at once with NumPy
+# It reads the real game data: the success rate table, each tree/rock's health range and ticks to regenerate,
+# and the skills' xp per item, so tuning any of those in the game is reflected here
+# Assumes one interaction per game tick, and that the inventory never fills up (i.e. banking time isn't modelled)
+# E.g. `python simulator.py willow-tree --sessions 5000 --nodes 2`
+# For each level (and the tool used at that level), outputs expected resources and xp per hour
+# Then simulates levelling up from the starting level, outputting the time it takes to reach each level
+
+ticks_per_hour = 3600
+
+# Map from a name on the command line (e.g. 'oak-tree') to the concrete tree/rock class
+interactable_types = {
+    tile_type.title.lower().replace(' ', '-'): tile_type
+    for tile_type in code_to_feature.values() if issubclass(tile_type, Interactable)
+}
+
+gathering_skills = [Woodcutting, Mining]
+
+
+def relevant_skill_type(interactable_type):
+    # The skill that gains xp for generating the resource this tree/rock yields
+
+    for skill_type in gathering_skills:
+        if interactable_type.resource_type_yielded in skill_type.xp_gain_per_generation:
+            return skill_type
+
+
+def tool_for_levels(interactable_type, tool_type=None):
+    # For each level (indexed by level), the tool used on this tree/rock at that level, or None if there isn't one
+    # If `tool_type` is None, use the best tool that can be used on the tree/rock at each level,
+    # otherwise only use that tool, once we have the level for it
+
+    usable_tools = [
+        t for t in success_rate_table.tool_types
+        if issubclass(t, interactable_type.tool_type_required)
+        and t.strength >= interactable_type.minimum_tool_required.strength
+    ]
+
+    if tool_type is not None:
+        assert tool_type in usable_tools
+        usable_tools = [tool_type]
+
+    tools = [None]
+    for level in range(1, max_level + 1):
+        can_use = [t for t in usable_tools if level >= t.skill_level_required]
+        tools.append(max(can_use, key=lambda t: t.strength) if can_use else None)
+
+    return tools
+
+
+def rates_for_levels(interactable_type, tools):
+    # Success rate at each level (indexed by level) with the tool used at that level
+
+    rates = np.zeros(max_level + 1)
+
+    for level in range(1, max_level + 1):
+        if tools[level] is not None:
+            rates[level] = success_rate_table.lookup(interactable_type.resource_type_yielded, tools[level], level)
+
+    return rates
+
+
+def new_health(interactable_type, rng, size):
+
+    return rng.integers(interactable_type.minimum_health, interactable_type.maximum_health + 1, size=size)
+
+
+def gather_tick(interactable_type, health, ticks_left, rates, rng):
+    # Simulate one game tick for a batch of sessions, each gathering from its own set of identical trees/rocks
+    # `health` and `ticks_left` have shape (..., nodes), and `rates` the shape of the batch without the nodes axis
+    # Follows the game: depleted nodes count down their ticks to regenerate, then we interact with the first node that
+    # isn't depleted (if any), yielding one resource with the success rate probability
+    # Updates health and ticks left in place, and returns a boolean array of which sessions yielded a resource
+
+    depleted = health == 0
+    ticks_left -= depleted
+
+    regenerated = depleted & (ticks_left == 0)
+    if regenerated.any():
+        health[regenerated] = new_health(interactable_type, rng, regenerated.sum())
+
+    available = health > 0
+    node = available.argmax(axis=-1)
+
+    success = available.any(axis=-1) & (rng.random(rates.shape) < rates)
+
+    # Take one health off the node each successful session interacted with, and start regenerating if it depleted
+    session_index = np.nonzero(success)
+    node_index = session_index + (node[session_index],)
+
+    health[node_index] -= 1
+    now_depleted = health[node_index] == 0
+    ticks_left[tuple(i[now_depleted] for i in node_index)] = interactable_type.ticks_to_regenerate
+
+    return success
+
+
+def simulate_fixed_levels(interactable_type, rates, sessions, ticks, nodes, rng):
+    # Simulate `sessions` sessions of `ticks` game ticks for every success rate in `rates` at once
+    # Returns the number of resources yielded, with shape (len(rates), sessions)
+
+    shape = (len(rates), sessions, nodes)
+
+    health = new_health(interactable_type, rng, shape)
+    ticks_left = np.zeros(shape, dtype=int)
+    session_rates = np.repeat(rates[:, None], sessions, axis=1)
+
+    yielded = np.zeros((len(rates), sessions), dtype=int)
+
+    for tick in range(ticks):
+        yielded += gather_tick(interactable_type, health, ticks_left, session_rates, rng)
+
+    return yielded
+
+
+def simulate_levelling(interactable_type, rates, xp_per_item, start_level, sessions, ticks, nodes, rng):
+    # Simulate `sessions` sessions levelling up from `start_level` for `ticks` game ticks,
+    # with the success rate changing as the level goes up
+    # Returns the tick each level was reached for each session, shape (sessions, max_level + 1), -1 if not reached
+
+    # Xp needed to reach each level from 2 up, to look up levels for a whole batch of xp totals at once
+    thresholds = np.array(experience_table[2:])
+
+    health = new_health(interactable_type, rng, (sessions, nodes))
+    ticks_left = np.zeros((sessions, nodes), dtype=int)
+
+    level = np.full(sessions, start_level)
+    experience = np.full(sessions, 1 if start_level == 1 else thresholds[start_level-2])
+
+    levels = np.arange(max_level + 1)
+    reached = np.where(levels <= start_level, 0, -1)[None, :].repeat(sessions, axis=0)
+
+    for tick in range(ticks):
+
+        success = gather_tick(interactable_type, health, ticks_left, rates[level], rng)
+
+        if success.any():
+            experience += success * xp_per_item
+            level = np.searchsorted(thresholds, experience, side='right') + 1
+
+            newly_reached = (reached == -1) & (levels[None, :] <= level[:, None])
+            reached[newly_reached] = tick + 1
+
+    return reached
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Monte-Carlo simulation of gathering from a tree or rock")
+    parser.add_argument('interactable', choices=sorted(interactable_types))
+    parser.add_argument('--tool', help="title of the tool to use, e.g. 'Steel Axe' (default: best usable tool)")
+    parser.add_argument('--sessions', type=int, default=1000, help="sessions to simulate per level")
+    parser.add_argument('--batch', type=int, default=10000, help="most sessions to simulate at once")
+    parser.add_argument('--hours', type=float, default=1, help="length of each fixed level session")
+    parser.add_argument('--nodes', type=int, default=1, help="identical trees/rocks to gather from in turn")
+    parser.add_argument('--start-level', type=int, help="level to start levelling from (default: first usable)")
+    parser.add_argument('--levelling-hours', type=float, default=8, help="length of each levelling session")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    interactable_type = interactable_types[args.interactable]
+    resource_type = interactable_type.resource_type_yielded
+    skill_type = relevant_skill_type(interactable_type)
+    xp_per_item = skill_type.xp_gain_per_generation[resource_type]
+
+    tool_type = None
+    if args.tool is not None:
+        tool_type = [t for t in success_rate_table.tool_types if t.title.lower() == args.tool.lower()][0]
+
+    tools = tool_for_levels(interactable_type, tool_type)
+    rates = rates_for_levels(interactable_type, tools)
+    usable_levels = [level for level in range(1, max_level + 1) if tools[level] is not None]
+
+    # Nothing changes after the level where the best tool we'll ever use reaches a 100% success rate
+    for level in usable_levels:
+        if tools[level] == tools[max_level] and rates[level] == 1.0:
+            usable_levels = usable_levels[:usable_levels.index(level) + 1]
+            break
+
+    usable_levels = np.array(usable_levels)
+
+    print("%s: %s health, %s ticks to regenerate, %s xp per %s, %s node%s" % (
+        interactable_type.title, "%s-%s" % (interactable_type.minimum_health, interactable_type.maximum_health),
+        interactable_type.ticks_to_regenerate, xp_per_item, resource_type.title, args.nodes,
+        "" if args.nodes == 1 else "s"
+    ))
+
+    # Expected resources and xp per hour at each level
+    ticks = int(args.hours * ticks_per_hour)
+    total_yielded = np.zeros(len(usable_levels))
+
+    for batch_start in range(0, args.sessions, args.batch):
+        batch_sessions = min(args.batch, args.sessions - batch_start)
+        yielded = simulate_fixed_levels(interactable_type, rates[usable_levels], batch_sessions, ticks, args.nodes, rng)
+        total_yielded += yielded.sum(axis=1)
+
+    per_hour = total_yielded / args.sessions / args.hours
+
+    print()
+    print("%6s  %-16s  %12s  %10s  %12s" % ("Level", "Tool", "Success rate", "Items/hr", "%s xp/hr" % skill_type.title))
+    for level, items in zip(usable_levels, per_hour):
+        print("%6s  %-16s  %12.3f  %10.1f  %12.0f" % (
+            level, tools[level].title, rates[level], items, items * xp_per_item
+        ))
+
+    # Time to reach each level, levelling up from the starting level
+    start_level = args.start_level if args.start_level is not None else int(usable_levels[0])
+    assert tools[start_level] is not None, "No tool can be used at the starting level"
+
+    ticks = int(args.levelling_hours * ticks_per_hour)
+    reached = []
+
+    for batch_start in range(0, args.sessions, args.batch):
+        batch_sessions = min(args.batch, args.sessions - batch_start)
+        reached.append(simulate_levelling(
+            interactable_type, rates, xp_per_item, start_level, batch_sessions, ticks, args.nodes, rng
+        ))
+
+    reached = np.concatenate(reached)
+
+    print()
+    print("%6s  %16s  %10s" % ("Level", "Mean hours", "Reached"))
+    for level in range(start_level + 1, max_level + 1):
+
+        reached_level = reached[:, level] >= 0
+        if not reached_level.any():
+            break
+
+        print("%6s  %16.2f  %9.1f%%" % (
+            level, reached[reached_level, level].mean() / ticks_per_hour, 100 * reached_level.mean()
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,13 @@
 from PyQt5.QtGui import QPixmap
+from recipes import recipe_book
 from PyQt5.QtCore import Qt, QSize, pyqtSignal
-from skill_information import SkillInformation
+from tables import experience_table, level_for_experience, max_level, UnlockIndex
 from items import CopperAxe, SteelAxe, MithrilAxe, AdamantAxe
 from items import CopperOre, TinOre, CoalOre, IronOre, GoldOre
 from items import OakLog, WillowLog, MapleLog, YewLog, MagicLog
 from tiles import CopperRock, TinRock, CoalRock, IronRock, GoldRock
 from tiles import OakTree, WillowTree, MapleTree, YewTree, MagicTree
-from PyQt5.QtWidgets import QWidget, QLabel, QHBoxLayout, QVBoxLayout
-from items import OakShortbow, WillowShortbow, MapleShortbow, YewShortbow, MagicShortbow
+from PyQt5.QtWidgets import QWidget, QLabel, QHBoxLayout, QVBoxLayout, QPushButton
 from items import CopperPickaxe, SteelPickaxe, MithrilPickaxe, AdamantPickaxe, Tinderbox, Knife
 
 
@@ -16,6 +16,7 @@ class Skill(QWidget):
     # All skills share the same experience and levelling code, but they have their own (static) information
 
     # Emit to Game object when we click on this skill, to switch the main display widget to a skill information widget
+    # Emits the skill itself, which keys the (lazily created) information widget in the game's display index
     skill_clicked_on = pyqtSignal(object)
 
     def __init__(self):
@@ -25,7 +26,10 @@ class Skill(QWidget):
         # Start with level 1 and only 1 xp, and the next level requires 100 xp
         self.level = 1
         self.experience = 1
-        self.next_level_experience = 100
+        self.next_level_experience = experience_table[2]
+
+        # Index of which tools are unlocked at which level, to report them when we level up
+        self.tools_unlocked = UnlockIndex([(tool.skill_level_required, tool.title) for tool in self.relevant_tools])
 
         # Arrange layout of widget (icon image and string of level & experience)
         self.text_label = QLabel("%s (%s xp)" % (self.level, self.experience))
@@ -51,9 +55,8 @@ class Skill(QWidget):
 
     def add_experience(self, xp):
         # Add experience to this skill object
-        # If we reach the xp needed for the next level, increment the level and double experience for the level after
-        # to keep it growing exponentially
-        # It's possible we'll pass multiple levels at once, so keep incrementing level and next level xp as necessary
+        # The xp needed for each level grows exponentially, and is looked up in the precomputed experience table
+        # It's possible we'll pass multiple levels at once, so look up the level for our new xp total directly
         # For an xp gain, generate a string, which says how many levels we gained, if we unlocked any new things, etc.
         # to output on the status bar for the user to see
 
@@ -61,29 +64,26 @@ class Skill(QWidget):
 
         self.experience += xp
 
-        levels_gained = []  # Accumulates new levels we gained for updating status bar
+        old_level = self.level
 
-        while self.experience >= self.next_level_experience:
-            self.level += 1
-            self.next_level_experience *= 2
-            levels_gained.append(self.level)
+        if self.experience >= self.next_level_experience:
+            self.level = level_for_experience(self.experience)
+            self.next_level_experience = experience_table[self.level + 1] if self.level < max_level else float('inf')
 
         self.update_skill_label()
 
+        levels_gained = self.level - old_level
+
         output_status = ""
         if levels_gained:
             # Log how many levels we gained, and if we unlocked any new tools for use
 
             output_status = "%s %s level%s gained. " % (
-                len(levels_gained), self.title, "" if len(levels_gained) == 1 else "s"
+                levels_gained, self.title, "" if levels_gained == 1 else "s"
             )
 
-            # Figure out if any new tools were unlocked based the skill levels we passed
-            tools_unlocked = []
-            for new_level in levels_gained:
-                for tool in self.relevant_tools:
-                    if new_level == tool.skill_level_required:
-                        tools_unlocked.append(tool.title)
+            # Any new tools unlocked based the skill levels we passed
+            tools_unlocked = self.tools_unlocked.unlocked_between(old_level, self.level)
 
             if tools_unlocked:
                 output_status += 'Tool%s unlocked: %s' % (
@@ -92,6 +92,15 @@ class Skill(QWidget):
 
         return output_status
 
+    def set_experience(self, experience):
+        # Set the skill's xp outright (e.g. loading a saved game), without the level up messages of `add_experience`
+
+        self.experience = experience
+        self.level = level_for_experience(self.experience)
+        self.next_level_experience = experience_table[self.level + 1] if self.level < max_level else float('inf')
+
+        self.update_skill_label()
+
     def __str__(self):
 
         return "%s: %s (%s xp)" % (self.title, self.level, self.experience)
@@ -108,7 +117,7 @@ class Skill(QWidget):
         # If we left-click on the skill's widget, replace the main game display widget with information about the skill
 
         if e.button() == Qt.LeftButton:
-            self.skill_clicked_on.emit(self.information_widget)
+            self.skill_clicked_on.emit(self)
 
         e.ignore()
 
@@ -144,7 +153,6 @@ class Woodcutting(Skill):
 
     def __init__(self):
         super().__init__()
-        self.information_widget = SkillInformation(Woodcutting)
 
 
 class Mining(Skill):
@@ -173,7 +181,6 @@ class Mining(Skill):
 
     def __init__(self):
         super().__init__()
-        self.information_widget = SkillInformation(Mining)
 
 
 class Firemaking(Skill):
@@ -191,18 +198,12 @@ class Firemaking(Skill):
         YewLog: "Level %s" % YewLog.firemaking_required,
         MagicLog: "Level %s" % MagicLog.firemaking_required
     }
+    # Xp for burning each type of log comes from the firemaking recipes
     xp_gain_per_generation = {}
-    xp_gain_per_process = {
-        OakLog: 60,
-        WillowLog: 100,
-        MapleLog: 250,
-        YewLog: 500,
-        MagicLog: 750
-    }
+    xp_gain_per_process = recipe_book.process_xp('Firemaking')
 
     def __init__(self):
         super().__init__()
-        self.information_widget = SkillInformation(Firemaking)
 
 
 class Fletching(Skill):
@@ -220,24 +221,25 @@ class Fletching(Skill):
         YewLog: "Level %s" % YewLog.fletching_required,
         MagicLog: "Level %s" % MagicLog.fletching_required
     }
-    xp_gain_per_generation = {
-        OakShortbow: 30,
-        WillowShortbow: 100,
-        MapleShortbow: 250,
-        YewShortbow: 400,
-        MagicShortbow: 600
-    }
+    # Xp for making each type of bow comes from the fletching recipes
+    xp_gain_per_generation = recipe_book.generation_xp('Fletching')
     xp_gain_per_process = {}
 
     def __init__(self):
         super().__init__()
-        self.information_widget = SkillInformation(Fletching)
 
 
 class SkillSet(QWidget):
     # Represents a collection of all the skills for the player, with one instance of each skill for each skill type
     # The overall skill collection is a widget, which contains each skill widget in vertical layout
 
+    # Emits a skill whenever it gains one or more levels, e.g. so the inventory knows which tools we can now use
+    skill_levelled_up = pyqtSignal(object)
+
+    # Emits a skill, the xp it gained, and whether it was gained idle (while the game was closed), whenever it gains
+    # xp, e.g. for the session metrics
+    experience_gained = pyqtSignal(object, int, bool)
+
     def __init__(self, status_bar_signal):
 
         super().__init__()
@@ -253,6 +255,28 @@ class SkillSet(QWidget):
             Fletching: Fletching()
         }
 
+        # Reverse indexes built once, so we don't scan every skill each time we gain xp or use a tool:
+        # - item type -> list of (skill, xp for generating the item, xp for processing the item),
+        #   for every skill that gains xp from the item in either way
+        # - tool type -> the (one) skill that lists the tool as a relevant tool
+        self.item_type_to_xp = {}
+        self.tool_type_to_skill = {}
+
+        for skill_type in self.skills:
+
+            skill = self.skills[skill_type]
+
+            for item_type in set(skill.xp_gain_per_generation) | set(skill.xp_gain_per_process):
+                if item_type not in self.item_type_to_xp:
+                    self.item_type_to_xp[item_type] = []
+                self.item_type_to_xp[item_type].append((
+                    skill, skill.xp_gain_per_generation.get(item_type, 0), skill.xp_gain_per_process.get(item_type, 0)
+                ))
+
+            for tool_type in skill.relevant_tools:
+                assert tool_type not in self.tool_type_to_skill
+                self.tool_type_to_skill[tool_type] = skill
+
         # Add each skill widget vertically
         layout = QVBoxLayout()
 
@@ -266,42 +290,57 @@ class SkillSet(QWidget):
         font.setPointSize(20)
         skill_text_label.setFont(font)
         skill_text_label.setAlignment(Qt.AlignCenter)
-        skill_text_label.setFixedSize(QSize(300, 50))
+        skill_text_label.setFixedSize(QSize(200, 50))
+
+        # Button next to the title to open the session rates display (xp/hr etc.)
+        self.rates_button = QPushButton("rates")
+        self.rates_button.setFixedSize(QSize(80, 40))
 
-        overall_layout.addWidget(skill_text_label)
+        top_layout = QHBoxLayout()
+        top_layout.addWidget(skill_text_label)
+        top_layout.addWidget(self.rates_button)
+
+        overall_layout.addLayout(top_layout)
         overall_layout.addLayout(layout)
 
         self.setLayout(overall_layout)
 
-    def add_experience(self, items, generated):
+    def add_experience(self, items, generated, idle=False):
         # Takes a list of items from an interaction, and parses the item types into xp gained in relevant skills
         # If `generated` True, the items we are parsing for xp have been generated in some way, e.g. obtained from tree
         # If `generated` is False, the items we are parsing have been processed, e.g. log burned
         # This affects which skills get what xp
+        # If `idle` True, the xp was gained while the game was closed (see `idle.py`), which is passed on in the signal
         # Approach allows multiple skills to gain xp in an interaction, as well as same item give xp to multiple skills
-        # Call `add_experience` for each skill only once, and string status signals from each call together
+        # Total up the xp for each skill using the item type index, so it's one lookup per item however many skills
+        # Then call `add_experience` for each skill only once, and string status signals from each call together
         # This avoids missing outputting a skill level gain in one if another was called after and overwrites the string
 
         assert len(items) > 0
 
-        output_status = ""
-        for skill_type in self.skills:
+        xp_gained = {}  # skill -> total xp gained, in the order skills first gained xp
 
-            xp_gained = 0
-            skill = self.skills[skill_type]
+        for item in items:
+            for skill, generated_xp, processed_xp in self.item_type_to_xp.get(type(item), []):
 
-            # Work out if we are adding xp for generated items or processed items
-            # e.g. if generated is True and considering a log it was generated from a tree -> woodcutting xp
-            # but if generated is False and considering a log it was processed with a tinderbox -> firemaking xp
-            xp_map = skill.xp_gain_per_generation if generated else skill.xp_gain_per_process
+                # Work out if we are adding xp for generated items or processed items
+                # e.g. if generated is True and considering a log it was generated from a tree -> woodcutting xp
+                # but if generated is False and considering a log it was processed with a tinderbox -> firemaking xp
+                xp = generated_xp if generated else processed_xp
 
-            for item in items:
+                if xp > 0:
+                    xp_gained[skill] = xp_gained.get(skill, 0) + xp
 
-                if type(item) in xp_map:
-                    xp_gained += xp_map[type(item)]
+        output_status = ""
+        for skill in xp_gained:
 
-            if xp_gained > 0:
-                output_status += skill.add_experience(xp_gained)
+            old_level = skill.level
+            output_status += skill.add_experience(xp_gained[skill])
+
+            self.experience_gained.emit(skill, xp_gained[skill], idle)
+
+            if skill.level > old_level:
+                self.skill_levelled_up.emit(skill)
 
         self.status_bar_signal.emit(output_status)
 
@@ -309,33 +348,15 @@ class SkillSet(QWidget):
         # We are assuming one and only one skill has this type of tool in its `relevant_tools` list
         # If we change to a tool requiring multiple skill levels in the future, will need to change together with all()
 
-        for skill_type in self.skills:
-
-            skill = self.skills[skill_type]
-
-            if type(tool) in skill.relevant_tools:
-                return skill >= tool.skill_level_required
-
-    def can_burn(self, log):
-        # Check our firemaking level meets minimum level needed to burn the log
-
-        return self.skills[Firemaking] >= log.firemaking_required
-
-    def can_fletch(self, log):
-        # Check our fletching level meets minimum level needed to fletch the log
+        skill = self.relevant_skill(tool)
 
-        return self.skills[Fletching] >= log.fletching_required
+        return skill is not None and skill >= tool.skill_level_required
 
     def relevant_skill(self, tool):
-        # Return the skill that lists this tool as it's relevant tool
+        # Return the skill that lists this tool as it's relevant tool (or None if no skill does)
         # Will only be one relevant skill for each tool
 
-        for skill_type in self.skills:
-
-            skill = self.skills[skill_type]
-
-            if type(tool) in skill.relevant_tools:
-                return skill
+        return self.tool_type_to_skill.get(type(tool))
 
     def meets_requirements(self, skill_requirements):
         # Takes a dictionary, mapping from a string (that will be one of the skill classes .title's), to an integer
@@ -0,0 +1,124 @@
+import time
+import random
+import argparse
+import threading
+import numpy as np
+from items import concrete_types
+from bank_service import BankService, BankStore, shared_account
+
+# Stress test of the bank service (see `bank_service.py`)
+# Many threads at once each run a stream of transactions: depositing a whole inventory's worth (28) or a few of an item,
+# or withdrawing some, mostly on the one shared account everyone banks in and otherwise on accounts of their own
+# Every thread keeps count of what it deposited and withdrew, and at the end the store must hold exactly what was put
+# in less what was taken out, for every account and item - nothing lost to a race or duplicated - and each account's
+# version must be the number of transactions that changed it
+# Reports transactions a second, how many commits were batched together, how many raced another transaction (made to
+# the newer record, or retried if they couldn't be), and how long transactions took
+# E.g. `python stress_bank.py --threads 32 --transactions 500`
+
+
+def run_transactions(service, thread_index, args, titles, barrier, results):
+
+    rng = random.Random(args.seed + thread_index)
+    own_accounts = ['account%s' % i for i in range(args.accounts)]
+
+    # (account, title) -> net amount deposited, and account -> transactions that changed it
+    net = {}
+    changes = {}
+    latency = []
+
+    barrier.wait()
+
+    for i in range(args.transactions):
+
+        account = shared_account if rng.random() < args.shared else rng.choice(own_accounts)
+        title = rng.choice(titles)
+
+        start = time.perf_counter()
+
+        if rng.random() < 0.5:
+            amount, message = service.deposit(account, title, 28 if rng.random() < 0.5 else rng.randint(1, 5))
+        else:
+            amount, message = service.withdraw(account, title, rng.randint(1, 28))
+            amount = -amount
+
+        latency.append(time.perf_counter() - start)
+
+        if amount != 0:
+            net[(account, title)] = net.get((account, title), 0) + amount
+            changes[account] = changes.get(account, 0) + 1
+
+    results[thread_index] = (net, changes, latency)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Stress test the bank service with concurrent transactions")
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--transactions', type=int, default=500, help="transactions per thread")
+    parser.add_argument('--accounts', type=int, default=16, help="accounts besides the shared one")
+    parser.add_argument('--shared', type=float, default=0.5, help="share of transactions on the shared account")
+    parser.add_argument('--item-types', type=int, default=12, help="different items banked")
+    parser.add_argument('--limit', type=int, default=10, help="bank slots per account (small, so banks fill up)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    titles = [item_type.title for item_type in concrete_types[:args.item_types]]
+
+    service = BankService(store=BankStore(limit=args.limit))
+
+    barrier = threading.Barrier(args.threads + 1)
+    results = [None] * args.threads
+    threads = [
+        threading.Thread(target=run_transactions, args=(service, i, args, titles, barrier, results))
+        for i in range(args.threads)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+
+    for thread in threads:
+        thread.join()
+
+    seconds = time.perf_counter() - start
+    service.stop()
+
+    # Everything deposited less everything withdrawn must be what's stored
+    net = {}
+    changes = {}
+    latency = []
+    for thread_net, thread_changes, thread_latency in results:
+        for key, amount in thread_net.items():
+            net[key] = net.get(key, 0) + amount
+        for account, count in thread_changes.items():
+            changes[account] = changes.get(account, 0) + count
+        latency.extend(thread_latency)
+
+    stored = {
+        (account, slot[0]): slot[1] for account, record in service.store.records.items()
+        for slot in record.slots if slot is not None
+    }
+
+    assert all(quantity > 0 for quantity in stored.values())
+    assert {key: amount for key, amount in net.items() if amount != 0} == stored, "items lost or duplicated"
+    assert all(service.store.read(account).version == count for account, count in changes.items())
+    assert service.commits == sum(changes.values())
+
+    transactions = args.threads * args.transactions
+
+    print("%s threads, %s transactions (%s changed the bank), %.0f%% on the shared account" % (
+        args.threads, transactions, service.commits, 100 * args.shared
+    ))
+    print("Transactions a second:      %.0f" % (transactions / seconds))
+    print("Commits per batch:          %.1f (%s batches)" % (service.commits / max(1, service.batches), service.batches))
+    print("Made to a newer record:     %s" % service.rebased)
+    print("Retried after a conflict:   %s" % service.conflicts)
+    print("Latency ms p50/p95/p99:     %s" % "/".join("%.2f" % (1000 * value) for value in np.percentile(latency, [50, 95, 99])))
+    print("Store matches every transaction: no items lost or duplicated")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import numpy as np
+from bisect import bisect_right
+from items import CopperAxe, SteelAxe, MithrilAxe, AdamantAxe
+from items import CopperOre, TinOre, CoalOre, IronOre, GoldOre
+from items import OakLog, WillowLog, MapleLog, YewLog, MagicLog
+from items import CopperPickaxe, SteelPickaxe, MithrilPickaxe, AdamantPickaxe
+
+# Game data tables, compiled once on import
+# This module doesn't depend on Qt, so the tables can be shared between the game and any offline tools,
+# e.g. simulating skilling sessions or calculating xp rates
+
+# Highest skill level the tables go up to, and the highest level a skill can reach
+# Every success rate has reached 1.0 by this level, and the xp needed for it is far beyond what's gained in a game
+max_level = 40
+
+# Xp needed to reach each level, indexed by level (index 0 is unused, there is no level 0)
+# Skills start at level 1 with 1 xp, need 100 xp for level 2, and the xp needed doubles for each level after that
+experience_table = [0, 0] + [100 * 2**(level-2) for level in range(2, max_level + 1)]
+
+
+def level_for_experience(experience):
+    # The level reached with this much xp - a binary search of the experience table,
+    # so any size of xp gain resolves straight to the new level
+
+    return bisect_right(experience_table, experience) - 1
+
+
+class UnlockIndex:
+    # Index from level to the things unlocked on reaching it (e.g. tools that need that skill level to use)
+    # Built from (level required, name) pairs. Names are kept ordered by level, along with a count of how many are
+    # unlocked at or below each level, so the names unlocked going between any two levels is just a slice
+
+    def __init__(self, unlockables):
+
+        unlockables = sorted(unlockables, key=lambda unlockable: unlockable[0])
+
+        self.names = [name for level, name in unlockables]
+
+        self.unlocked_count = [0] * (max_level + 1)
+        for level, name in unlockables:
+            for higher_level in range(level, max_level + 1):
+                self.unlocked_count[higher_level] += 1
+
+    def unlocked_between(self, old_level, new_level):
+        # Names unlocked by going from `old_level` up to `new_level`
+
+        return self.names[self.unlocked_count[old_level]:self.unlocked_count[new_level]]
+
+
+# Every time we interact with a tree/rock we have a chance of taking one log/ore
+# The success rate depends on three things:
+# - the type of tree/rock. Higher level trees/rocks have lower success rates for the same skill level & tool type
+# - woodcutting/mining level: higher level means higher success rate
+# - tool type: higher level tools have higher success rates
+# For each tree/rock, picture a graph of success rate vs. woodcutting/mining level, and a y=mx+c line for each tool,
+# with all tools sharing the same gradient, but higher strength tools having higher intercepts
+# Analogous trees and rocks share the same success rate,
+# e.g. oak tree + steel axe + wc level <=> copper/tin rock + steel pick + mining level
+# e.g. magic tree + addy axe + wc level <=> gold rock + addy pick + mining level
+# Lines are keyed by the resource type the tree/rock yields, and map to the gradient, and the intercept for each tool
+# that can be used on it (i.e. the minimum tool required for the tree/rock, and any stronger tools)
+# Lines are in percent, and capped at 100%
+success_rate_lines = {
+    OakLog: (25/9, {CopperAxe: 200/9, SteelAxe: 325/9, MithrilAxe: 470/9, AdamantAxe: 555/9}),
+    WillowLog: (4, {SteelAxe: 10, MithrilAxe: 20, AdamantAxe: 27}),
+    MapleLog: (3, {MithrilAxe: 20, AdamantAxe: 29}),
+    YewLog: (3, {MithrilAxe: 10, AdamantAxe: 19}),
+    MagicLog: (2.5, {AdamantAxe: 15}),
+    CopperOre: (25/9, {CopperPickaxe: 200/9, SteelPickaxe: 325/9, MithrilPickaxe: 470/9, AdamantPickaxe: 555/9}),
+    TinOre: (25/9, {CopperPickaxe: 200/9, SteelPickaxe: 325/9, MithrilPickaxe: 470/9, AdamantPickaxe: 555/9}),
+    CoalOre: (4, {SteelPickaxe: 10, MithrilPickaxe: 20, AdamantPickaxe: 27}),
+    IronOre: (3, {MithrilPickaxe: 20, AdamantPickaxe: 29}),
+    GoldOre: (2.5, {AdamantPickaxe: 15})
+}
+
+
+class SuccessRateTable:
+    # The success rate lines above, evaluated for every (resource type, tool type, level) into one array,
+    # so looking up a success rate is just an index, rather than picking a line and evaluating it
+    # The rate is 0 for a tool that can't be used on a resource, or at a level below what's required to use the tool
+
+    def __init__(self, lines, max_level):
+
+        self.max_level = max_level
+
+        self.resource_types = list(lines)
+        self.tool_types = []
+        for resource_type in lines:
+            for tool_type in lines[resource_type][1]:
+                if tool_type not in self.tool_types:
+                    self.tool_types.append(tool_type)
+
+        self.resource_type_to_index = {resource_type: i for i, resource_type in enumerate(self.resource_types)}
+        self.tool_type_to_index = {tool_type: i for i, tool_type in enumerate(self.tool_types)}
+
+        # Index the last axis directly by level, so index 0 is unused (there is no level 0)
+        levels = np.arange(max_level + 1)
+
+        self.rates = np.zeros((len(self.resource_types), len(self.tool_types), max_level + 1))
+
+        for resource_type in lines:
+
+            gradient, intercepts = lines[resource_type]
+            resource_index = self.resource_type_to_index[resource_type]
+
+            for tool_type in intercepts:
+
+                tool_index = self.tool_type_to_index[tool_type]
+
+                rates = np.minimum(((gradient * levels) + intercepts[tool_type]) / 100, 1.0)
+                rates[:tool_type.skill_level_required] = 0.0
+
+                self.rates[resource_index, tool_index] = rates
+
+    def lookup(self, resource_type, tool_type, level):
+        # Probability between 0 and 1 of yielding `resource_type` on one interaction with `tool_type` at skill `level`
+
+        assert level >= 1
+
+        return float(self.rates[
+            self.resource_type_to_index[resource_type], self.tool_type_to_index[tool_type], min(level, self.max_level)
+        ])
+
+    def rates_for(self, resource_type, tool_type):
+        # The array of success rates over all levels (indexed by level) for this resource and tool
+
+        return self.rates[self.resource_type_to_index[resource_type], self.tool_type_to_index[tool_type]]
+
+
+success_rate_table = SuccessRateTable(success_rate_lines, max_level)
@@ -1,6 +1,7 @@
 import regex
 import random
-from shop import Shop
+from shop import ShopStock
+from tables import success_rate_table
 from items import Axe, Pickaxe
 from PyQt5.QtGui import QPixmap
 from PyQt5.QtWidgets import QLabel
@@ -14,12 +15,17 @@ from items import OakShortbow, WillowShortbow, MagicShortbow, YewShortbow, Maple
 
 
 class ShopTile(QLabel):
-    # Abstract class, representing a tile on the game map that is an interface to a shop instance
+    # Abstract class, representing a tile on the game map that is an interface to a shop's stock
     # There are different subtypes of shops, e.g. general shop or blacksmith shop, that have different initial stocks
 
     clicked = pyqtSignal(int, int)  # emit coordinates to interactable_clicked_on() on the Map object this tile is on
 
-    def __init__(self, x, y, tile_width, tile_height, init_items, status_bar_signal):
+    # Shop economy settings, which subclasses can override:
+    # how strongly prices react to stock levels, and how many game ticks it takes to restock/deplete one item
+    price_elasticity = 0.5
+    ticks_per_restock = 10
+
+    def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
 
         super().__init__()
 
@@ -29,7 +35,21 @@ class ShopTile(QLabel):
         self.setPixmap(QPixmap(self.path_to_icon).scaled(self.size(), Qt.KeepAspectRatio))
         self.setAlignment(Qt.AlignCenter)
 
-        self.shop = Shop(self.title, init_items, status_bar_signal)
+        # The Shop widget displaying this stock is only created by the game when the shop is first opened
+        self.stock = self.new_stock()
+
+    @classmethod
+    def new_stock(cls):
+        # The initial items (`init_items()` in each concrete shop) define what the shop stocks, and the base quantity
+        # it restocks/depletes back towards
+        # A class method, so a headless world (see `world.py`) can create a shop's stock without the tile widget
+
+        return ShopStock(
+            init_items=cls.init_items(),
+            limit=100,
+            elasticity=cls.price_elasticity,
+            ticks_per_restock=cls.ticks_per_restock
+        )
 
     def mouseReleaseEvent(self, e):
 
@@ -46,19 +66,21 @@ class GeneralShop(ShopTile):
     description = 'A general shop for buying and selling basic goods'
     path_to_icon = 'images/shop keeper.jpg'
 
-    def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
-
-        super().__init__(
-            x=x, y=y, tile_width=tile_width, tile_height=tile_height,
-            init_items=[CopperAxe() for i in range(2)] +
-                       [CopperPickaxe() for i in range(2)] +
-                       [Tinderbox() for i in range(3)] +
-                       [Knife() for i in range(3)] +
-                       [OakLog() for i in range(10)] +
-                       [WillowLog() for i in range(5)],
-            status_bar_signal=status_bar_signal
+    @staticmethod
+    def init_items():
+        # The items the shop starts with, which is also what it normally stocks
+        return (
+            [CopperAxe() for i in range(2)] +
+            [CopperPickaxe() for i in range(2)] +
+            [Tinderbox() for i in range(3)] +
+            [Knife() for i in range(3)] +
+            [OakLog() for i in range(10)] +
+            [WillowLog() for i in range(5)]
         )
 
+    def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
+        super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
+
 
 class ArcheryShop(ShopTile):
     # Concrete shop tile class representing an archery shop
@@ -67,18 +89,20 @@ class ArcheryShop(ShopTile):
     description = 'An archery shop for buying and selling goods related to archery'
     path_to_icon = 'images/archer.jpg'
 
-    def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
-
-        super().__init__(
-            x=x, y=y, tile_width=tile_width, tile_height=tile_height,
-            init_items=[OakShortbow() for i in range(5)] +
-                       [WillowShortbow() for i in range(5)] +
-                       [MapleShortbow() for i in range(3)] +
-                       [YewShortbow() for i in range(2)] +
-                       [MagicShortbow() for i in range(1)],
-            status_bar_signal=status_bar_signal
+    @staticmethod
+    def init_items():
+        # The items the shop starts with, which is also what it normally stocks
+        return (
+            [OakShortbow() for i in range(5)] +
+            [WillowShortbow() for i in range(5)] +
+            [MapleShortbow() for i in range(3)] +
+            [YewShortbow() for i in range(2)] +
+            [MagicShortbow() for i in range(1)]
         )
 
+    def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
+        super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
+
 
 class BlacksmithShop(ShopTile):
     # Concrete shop tile class representing a blacksmith shop
@@ -86,21 +110,25 @@ class BlacksmithShop(ShopTile):
     title = 'Blacksmith Shop'
     description = 'A blacksmith shop for buying and selling goods related to mining'
     path_to_icon = 'images/blacksmith.jpg'
+    price_elasticity = 0.3
+    ticks_per_restock = 20
+
+    @staticmethod
+    def init_items():
+        # The items the shop starts with, which is also what it normally stocks
+        return (
+            [CopperAxe() for i in range(5)] +
+            [SteelAxe() for i in range(5)] +
+            [MithrilAxe() for i in range(5)] +
+            [AdamantAxe() for i in range(3)] +
+            [CopperPickaxe() for i in range(5)] +
+            [SteelPickaxe() for i in range(5)] +
+            [MithrilPickaxe() for i in range(5)] +
+            [AdamantPickaxe() for i in range(3)]
+        )
 
     def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
-
-        super().__init__(
-            x=x, y=y, tile_width=tile_width, tile_height=tile_height,
-            init_items=[CopperAxe() for i in range(5)] +
-                       [SteelAxe() for i in range(5)] +
-                       [MithrilAxe() for i in range(5)] +
-                       [AdamantAxe() for i in range(3)] +
-                       [CopperPickaxe() for i in range(5)] +
-                       [SteelPickaxe() for i in range(5)] +
-                       [MithrilPickaxe() for i in range(5)] +
-                       [AdamantPickaxe() for i in range(3)],
-            status_bar_signal=status_bar_signal
-        )
+        super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
 
 
 class Tile(QLabel):
@@ -134,6 +162,30 @@ class EmptyTile(QLabel):
         self.x, self.y = x, y
         self.setFixedSize(QSize(tile_width, tile_height))
 
+    def rebind(self, x, y):
+        # Empty tiles are pooled by the map, so when re-using one we only need to move it to its new coordinates
+
+        self.x, self.y = x, y
+
+
+def parse_requirements(requirements):
+    # Parse a transport tile's requirements string into a dictionary, mapping from skill title to the required level
+    # Required format is space separated list of 'skill(number)', or None for no requirements
+    # E.g. 'mining(5)' or 'mining(5) woodcutting(10)'
+    # will map to {'Mining': 5} or {'Mining': 5, 'Woodcutting': 10}
+
+    skill_requirements = {}
+    skill_req_regex = regex.compile(r'^(\w+)\((\d{1,2})\)$')
+
+    if requirements is not None:
+
+        for skill_req in requirements.split(' '):
+
+            skill_match = skill_req_regex.match(skill_req)
+            skill_requirements[skill_match.group(1).title()] = int(skill_match.group(2))
+
+    return skill_requirements
+
 
 class TransportTile(Tile):
     # An abstract tile class representing tiles which when clicked on transport the player
@@ -161,19 +213,8 @@ class TransportTile(Tile):
         self.destination_y = int(destination_y)
 
         # Parse the requirements string into a dictionary, mapping from specified skill string to the required level
-        # Required format is space separated list of 'skill(number)'
-        # E.g. 'mining(5)' or 'mining(5) woodcutting(10)'
-        # will map to {'Mining': 5} or {'Mining': 5, 'Woodcutting': 10}
         self.requirements_string = requirements
-        self.skill_requirements = {}
-        skill_req_regex = regex.compile(r'^(\w+)\((\d{1,2})\)$')
-
-        if requirements is not None:
-
-            for skill_req in requirements.split(' '):
-
-                skill_match = skill_req_regex.match(skill_req)
-                self.skill_requirements[skill_match.group(1).title()] = int(skill_match.group(2))
+        self.skill_requirements = parse_requirements(requirements)
 
     def mouseReleaseEvent(self, e):
 
@@ -353,6 +394,12 @@ class TimedNonInteractable(NonInteractable):
         # `ticks_to_disappear` is how many game ticks should pass before we delete this tile from map
         self.ticks_left = ticks_to_disappear
 
+    def rebind(self, x, y, ticks_to_disappear):
+        # Timed tiles are pooled by the map, so when re-using one move it and restart its count down
+
+        self.x, self.y = x, y
+        self.ticks_left = ticks_to_disappear
+
     def count_down(self):
         # This function is emitted to every time game timer ticks
 
@@ -506,6 +553,13 @@ class Interactable(Tile):
         self.setPixmap(self.depleted_pixmap)
         self.ticks_left = self.ticks_to_regenerate
 
+    def restore(self, health, ticks_left):
+        # Set how many resources are left and the regeneration count down (e.g. loading a saved game)
+
+        self.health = health
+        self.ticks_left = ticks_left
+        self.setPixmap(self.depleted_pixmap if self.health == 0 else self.original_pixmap)
+
     def regenerate(self):
         # This slot is connected to the timer, and is called every game tick
         # If it's depleted and we are waiting to regenerate, count down how many ticks until regeneration
@@ -527,15 +581,20 @@ class Interactable(Tile):
         # Also takes player's skill levels to:
         # - check we get the best tool in the inventory we actually have the skill level to use
         # - add xp to the relevant skill after interaction.
+        # This is one attempt - gathering repeats it every game tick as an action (see `actions.py`), so we return
+        # an outcome dictionary saying if we yielded a resource, and if gathering is finished (i.e. we can't continue)
 
         # Check we can interact: i.e. it's not depleted, and we have space in inventory
 
-        assert self.health > 0
+        if self.health == 0:
+            # Depleted since the gathering action started
+            self.status_bar_signal.emit("Wait for it to regenerate!")
+            return {'success': False, 'finished': True, 'message': "Wait for it to regenerate!"}
 
         if inventory.is_full():
             # No space in inventory to receive yielded items
             self.status_bar_signal.emit("Inventory full - cannot receive more items")
-            return
+            return {'success': False, 'finished': True, 'message': "Inventory full - cannot receive more items"}
 
         # Get the tool from our inventory we will use in this interaction
 
@@ -548,23 +607,17 @@ class Interactable(Tile):
         if tool is None or tool.strength < self.minimum_tool_required.strength:
             # No tool in inventory of type needed for interaction (or at least one we can use based on skills)
             # that is at least strong enough
-            self.status_bar_signal.emit(
-                "No tool available for interaction! "
-                "Check your inventory and that you have the required skill level for the right strength tool"
-            )
-            return
+            message = "No tool available for interaction! " \
+                      "Check your inventory and that you have the required skill level for the right strength tool"
+            self.status_bar_signal.emit(message)
+            return {'success': False, 'finished': True, 'message': message}
 
         # Every time we interact with the tree/rock we have a chance of taking one log/ore
         # The success rate depends on the type of tool used, our skill level, and the tree/rock interacting with
-        # For each tree/rock, picture a graph of success rate vs. woodcutting/mining level, and a line for each tool,
-        # with higher strength tools having higher intercepts (and same gradient)
-        # Analogous tree and rocks share the same success rate,
-        # e.g. oak tree + steel axe + wc level <=> copper/tin rock + steel pick + mining level
-        # e.g. magic tree + addy axe + wc level <=> gold rock + addy pick + mining level
-
         # Returns a probability between 0 and 1, and randomly decide if we should deplete, proportional to probability
-        # `self.success_rate` needs to be implemented in each subclass (i.e. for each specific tree/rock)
-        probability = self.success_rate(skill=skills.relevant_skill(tool), tool=tool)
+        # The outcome includes the skill used, so gathering actions can record it in the session metrics
+        skill = skills.relevant_skill(tool)
+        probability = self.success_rate(skill=skill, tool=tool)
         to_deplete = random.random() < probability
 
         # Do the damage depletion if we succeeded this interaction
@@ -585,8 +638,21 @@ class Interactable(Tile):
             if self.health == 0:
                 self.deplete()
 
+            return {'success': True, 'finished': self.health == 0, 'message': "", 'skill': skill}
+
         else:
             self.status_bar_signal.emit("You missed!")
+            return {'success': False, 'finished': False, 'message': "You missed!", 'skill': skill}
+
+    def success_rate(self, skill, tool):
+        # Look up the success rate for the resource this tree/rock yields, the tool type, and our skill level,
+        # in the table compiled from each tree/rock's success rate line (see `tables.py`)
+        # Our skill level is guaranteed to be high enough to use the tool,
+        # and the tool is guaranteed to be able to be used on this tree/rock
+
+        assert skill.level >= tool.skill_level_required
+
+        return success_rate_table.lookup(self.resource_type_yielded, type(tool), skill.level)
 
     def mouseReleaseEvent(self, e):
         # Only interact with the tile on a left-click if it is not depleted
@@ -629,40 +695,6 @@ class OakTree(Tree):
     def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
         super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
 
-    def success_rate(self, skill, tool):
-        # Success rate depends on three things:
-        # - the type of tree. Higher level trees have lower success rates for the same skill level & axe type
-        # - woodcutting level: higher woodcutting level means higher success rate
-        # - tool type: higher level tools have higher success rates
-        # Our skill level is guaranteed to be high enough to use the tool,
-        # and the tool is guaranteed to be able to be used on this tree
-        # We only need to consider the tool types above the minimum tool type
-        # Each tool type has a y=mx+c line. All tool types have same gradient, but higher tools have higher intercepts
-
-        gradient = 25/9
-
-        if isinstance(tool, CopperAxe):
-            intercept = 200/9
-        elif isinstance(tool, SteelAxe):
-            intercept = 325/9
-        elif isinstance(tool, MithrilAxe):
-            intercept = 470/9
-        else:
-            assert isinstance(tool, AdamantAxe)
-            intercept = 555/9
-
-        x = skill.level
-
-        assert x >= tool.skill_level_required
-
-        y = (gradient * x) + intercept
-        y /= 100
-
-        if y > 1.0:
-            y = 1.0
-
-        return y
-
 
 class WillowTree(Tree):
     # Concrete tree tile representing willow trees, that yield willow logs
@@ -680,30 +712,6 @@ class WillowTree(Tree):
     def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
         super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
 
-    def success_rate(self, skill, tool):
-
-        gradient = 4
-
-        if isinstance(tool, SteelAxe):
-            intercept = 10
-        elif isinstance(tool, MithrilAxe):
-            intercept = 20
-        else:
-            assert isinstance(tool, AdamantAxe)
-            intercept = 27
-
-        x = skill.level
-
-        assert x >= tool.skill_level_required
-
-        y = (gradient * x) + intercept
-        y /= 100
-
-        if y > 1.0:
-            y = 1.0
-
-        return y
-
 
 class MapleTree(Tree):
     # Concrete tree tile representing maple trees, that yield maple logs
@@ -721,28 +729,6 @@ class MapleTree(Tree):
     def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
         super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
 
-    def success_rate(self, skill, tool):
-
-        gradient = 3
-
-        if isinstance(tool, MithrilAxe):
-            intercept = 20
-        else:
-            assert isinstance(tool, AdamantAxe)
-            intercept = 29
-
-        x = skill.level
-
-        assert x >= tool.skill_level_required
-
-        y = (gradient * x) + intercept
-        y /= 100
-
-        if y > 1.0:
-            y = 1.0
-
-        return y
-
 
 class YewTree(Tree):
     # Concrete tree tile representing yew trees, that yield yew logs
@@ -760,28 +746,6 @@ class YewTree(Tree):
     def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
         super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
 
-    def success_rate(self, skill, tool):
-
-        gradient = 3
-
-        if isinstance(tool, MithrilAxe):
-            intercept = 10
-        else:
-            assert isinstance(tool, AdamantAxe)
-            intercept = 19
-
-        x = skill.level
-
-        assert x >= tool.skill_level_required
-
-        y = (gradient * x) + intercept
-        y /= 100
-
-        if y > 1.0:
-            y = 1.0
-
-        return y
-
 
 class MagicTree(Tree):
     # Concrete tree tile representing magic trees, that yield magic logs
@@ -799,25 +763,6 @@ class MagicTree(Tree):
     def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
         super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
 
-    def success_rate(self, skill, tool):
-
-        gradient = 2.5
-
-        assert isinstance(tool, AdamantAxe)
-        intercept = 15
-
-        x = skill.level
-
-        assert x >= tool.skill_level_required
-
-        y = (gradient * x) + intercept
-        y /= 100
-
-        if y > 1.0:
-            y = 1.0
-
-        return y
-
 
 class Rock(Interactable):
     # Abstract class to represent all rocks
@@ -847,40 +792,6 @@ class CopperRock(Rock):
     def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
         super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
 
-    def success_rate(self, skill, tool):
-        # Success rate depends on three things:
-        # - the type of rock. Higher level rocks have lower success rates for the same skill level & pickaxe type
-        # - mining level: higher mining level means higher success rate
-        # - tool type: higher level tools have higher success rates
-        # Our skill level is guaranteed to be high enough to use the tool,
-        # and the tool is guaranteed to be able to be used on this rock
-        # We only need to consider the tool types above the minimum tool type
-        # Each tool type has a y=mx+c line. All tool types have same gradient, but higher tools have higher intercepts
-
-        gradient = 25/9
-
-        if isinstance(tool, CopperPickaxe):
-            intercept = 200/9
-        elif isinstance(tool, SteelPickaxe):
-            intercept = 325/9
-        elif isinstance(tool, MithrilPickaxe):
-            intercept = 470/9
-        else:
-            assert isinstance(tool, AdamantPickaxe)
-            intercept = 555/9
-
-        x = skill.level
-
-        assert x >= tool.skill_level_required
-
-        y = (gradient * x) + intercept
-        y /= 100
-
-        if y > 1.0:
-            y = 1.0
-
-        return y
-
 
 class TinRock(Rock):
     # Concrete rock tile representing tin rocks, that yield tin ores
@@ -898,32 +809,6 @@ class TinRock(Rock):
     def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
         super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
 
-    def success_rate(self, skill, tool):
-
-        gradient = 25/9
-
-        if isinstance(tool, CopperPickaxe):
-            intercept = 200/9
-        elif isinstance(tool, SteelPickaxe):
-            intercept = 325/9
-        elif isinstance(tool, MithrilPickaxe):
-            intercept = 470/9
-        else:
-            assert isinstance(tool, AdamantPickaxe)
-            intercept = 555/9
-
-        x = skill.level
-
-        assert x >= tool.skill_level_required
-
-        y = (gradient * x) + intercept
-        y /= 100
-
-        if y > 1.0:
-            y = 1.0
-
-        return y
-
 
 class CoalRock(Rock):
     # Concrete rock tile representing coal rocks, that yield coal ores
@@ -941,30 +826,6 @@ class CoalRock(Rock):
     def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
         super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
 
-    def success_rate(self, skill, tool):
-
-        gradient = 4
-
-        if isinstance(tool, SteelPickaxe):
-            intercept = 10
-        elif isinstance(tool, MithrilPickaxe):
-            intercept = 20
-        else:
-            assert isinstance(tool, AdamantPickaxe)
-            intercept = 27
-
-        x = skill.level
-
-        assert x >= tool.skill_level_required
-
-        y = (gradient * x) + intercept
-        y /= 100
-
-        if y > 1.0:
-            y = 1.0
-
-        return y
-
 
 class IronRock(Rock):
     # Concrete rock tile representing iron rocks, that yield iron ores
@@ -982,28 +843,6 @@ class IronRock(Rock):
     def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
         super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
 
-    def success_rate(self, skill, tool):
-
-        gradient = 3
-
-        if isinstance(tool, MithrilPickaxe):
-            intercept = 20
-        else:
-            assert isinstance(tool, AdamantPickaxe)
-            intercept = 29
-
-        x = skill.level
-
-        assert x >= tool.skill_level_required
-
-        y = (gradient * x) + intercept
-        y /= 100
-
-        if y > 1.0:
-            y = 1.0
-
-        return y
-
 
 class GoldRock(Rock):
     # Concrete rock tile representing gold rocks, that yield gold ores
@@ -1021,25 +860,6 @@ class GoldRock(Rock):
     def __init__(self, x, y, tile_width, tile_height, status_bar_signal):
         super().__init__(x, y, tile_width, tile_height, status_bar_signal=status_bar_signal)
 
-    def success_rate(self, skill, tool):
-
-        gradient = 2.5
-
-        assert isinstance(tool, AdamantPickaxe)
-        intercept = 15
-
-        x = skill.level
-
-        assert x >= tool.skill_level_required
-
-        y = (gradient * x) + intercept
-        y /= 100
-
-        if y > 1.0:
-            y = 1.0
-
-        return y
-
 
 # We define a letter code to represent each concrete tile type that can be instantiated
 # We use these codes to manually draw the game maps in the JSON files
@@ -17,3 +17,28 @@ def generate_label(text, font_size, alignment=Qt.AlignCenter, w=None, h=None):
         label.setFixedSize(QSize(w, h))
 
     return label
+
+
+def axis_range(position, window_size, map_size):
+    # The `window_size` coordinates along one axis of a map that a window centred on `position` covers
+    # If the window would extend past either edge of the map, take a window's worth from that edge instead
+
+    either_side = int((window_size - 1) / 2)
+
+    if (position - either_side) < 0:
+        # Cap at the start of the map
+        return list(range(0, window_size))
+
+    elif (position + either_side) >= map_size:
+        # Cap at the end of the map
+        return list(range(map_size - window_size, map_size))
+
+    # No cap necessary
+    return list(range(position - either_side, position + either_side + 1))
+
+
+def window_range(x, y, window_cols, window_rows, map_cols, map_rows):
+    # The columns and rows of the window around a player at (x, y), in absolute map coordinates
+    # Shared by the game's maps, and the multiplayer server and client, so they all agree on what a player can see
+
+    return axis_range(x, window_cols, map_cols), axis_range(y, window_rows, map_rows)
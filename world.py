@@ -0,0 +1,827 @@
+import os
+import json
+import random
+from bank import BankStorage
+from actions import Action
+from recipes import recipe_book
+from items import concrete_types
+from items import CopperAxe, CopperPickaxe, Tinderbox, Knife
+from skills import Woodcutting, Mining, Firemaking, Fletching
+from utilities import window_range
+from tables import success_rate_table, level_for_experience
+from tiles import code_to_feature, parse_requirements, Interactable, ShopTile, BankChestTile, NPC, TransportTile, Fire
+
+# Headless model of the game world, for the multiplayer server (see `server.py`)
+# The single player game keeps its state in widgets (tiles in a Map, slots in an Inventory), driven by the Qt timer
+# Here the same world is plain data: each map is a grid of the tile types from its json file, with the state that
+# changes as the game runs (trees/rocks' health, NPCs, fires, players) held alongside, and shop stocks and the shared
+# bank use the same models as the game (`ShopStock` and `BankStorage`)
+# It uses the game's tables and tile/item/skill classes (their class attributes), but never creates a widget,
+# so many players' worth of world can be run in one process without a display
+# Anything that changes on a map marks the chunk of the map it's in, so the server only has to look again at what
+# players who can see that chunk see (see `WorldMap.take_changes`)
+# A world can hold only some of the maps, for a server process hosting just those (see `sharded_server.py`): players
+# who transport to a map that isn't here leave the world, for the server to hand them off to where it is
+
+# Things that move around or come and go on a map are entities, each with an id unique across the world
+# Kinds of entity
+PLAYER = 'player'
+NPC_KIND = 'npc'
+FIRE = 'fire'
+
+# Moves a player can make, as (dx, dy)
+directions = {
+    'up': (0, -1),
+    'down': (0, 1),
+    'left': (-1, 0),
+    'right': (1, 0)
+}
+
+# Every skill, and each tool type's skill
+skill_types = [Mining, Woodcutting, Firemaking, Fletching]
+tool_type_to_skill_type = {tool_type: skill_type for skill_type in skill_types for tool_type in skill_type.relevant_tools}
+
+title_to_item_type = {item_type.title: item_type for item_type in concrete_types}
+
+inventory_size = 28
+
+# Maps are split into square chunks of this many tiles a side, to index entities and changes by where they are
+chunk_size = 4
+
+# How many tiles past the edge of a player's window they're sent changes from, so entities are already known by the
+# time they walk into view
+interest_margin = 2
+
+
+class Entity:
+    # A player, NPC or fire on a map
+    # `tile_type` is the tile class it's displayed as (e.g. Chicken), or None for players
+
+    def __init__(self, entity_id, kind, tile_type, x, y):
+
+        self.id = entity_id
+        self.kind = kind
+        self.tile_type = tile_type
+        self.x, self.y = x, y
+
+        # NPCs wander within their maximum radius of where they started
+        self.initial_x, self.initial_y = x, y
+
+        # Fires count down to going out
+        self.ticks_left = None
+
+    def title(self):
+
+        return PLAYER if self.tile_type is None else self.tile_type.title
+
+
+class Chance:
+    # Every random draw the world makes (gathering successes, regenerated health, NPC moves) goes through here,
+    # so an event journal (see `journal.py`) can record what was drawn, and replaying the journal draws it again
+    # While `self.draws` is a list, each draw is appended to it as an int. While `self.replay` is an iterator,
+    # draws are taken from it instead of made
+
+    def __init__(self):
+
+        self.draws = None
+        self.replay = None
+
+    def drawn(self, value):
+
+        if self.draws is not None:
+            self.draws.append(value)
+
+        return value
+
+    def randint(self, a, b):
+
+        if self.replay is not None:
+            return next(self.replay)
+
+        return self.drawn(random.randint(a, b))
+
+    def succeeds(self, probability):
+
+        if self.replay is not None:
+            return bool(next(self.replay))
+
+        return bool(self.drawn(int(random.random() < probability)))
+
+    def choice(self, options):
+
+        if self.replay is not None:
+            return options[next(self.replay)]
+
+        return options[self.drawn(random.randrange(len(options)))]
+
+
+class ResourceNode:
+    # State of a tree/rock on a map - like `Interactable`, it yields its health in resources, then regenerates
+
+    def __init__(self, tile_type, chance):
+
+        self.tile_type = tile_type
+        self.chance = chance
+        self.health = chance.randint(tile_type.minimum_health, tile_type.maximum_health)
+        self.ticks_left = None
+
+    def regenerate(self):
+        # Count down while depleted, returns True if it regenerated this tick
+
+        if self.health > 0:
+            return False
+
+        self.ticks_left -= 1
+
+        if self.ticks_left == 0:
+            self.health = self.chance.randint(self.tile_type.minimum_health, self.tile_type.maximum_health)
+            return True
+
+        return False
+
+
+class Transport:
+    # Where a transport tile takes a player, and the skill levels needed to use it
+
+    def __init__(self, destination, destination_x, destination_y, requirements):
+
+        self.destination = destination
+        self.destination_x = int(destination_x)
+        self.destination_y = int(destination_y)
+        self.skill_requirements = parse_requirements(requirements)
+
+
+class WorldMap:
+    # One map of the world, loaded from the same json as the game's `Map`
+    # Static tiles (trees, rocks, shops, scenery, etc.) never move, and are kept as a grid of tile types,
+    # `self.tiles[y][x]` (None for an empty tile). The entities on the map are kept by id, with a mapping from
+    # position to the entity there, so checking if a tile is empty is two lookups
+
+    def __init__(self, map_name, loaded_map, new_id, chance):
+
+        self.map_name = map_name
+        self.chance = chance
+
+        self.map_rows = loaded_map['total']['height']
+        self.map_cols = loaded_map['total']['width']
+        self.window_rows = loaded_map['window']['height']
+        self.window_cols = loaded_map['window']['width']
+        self.can_light_fires_on_map = loaded_map['can_light_fires']
+
+        self.tiles = []
+        self.nodes = {}        # (x, y) -> ResourceNode, for every tree/rock
+        self.shops = {}        # (x, y) -> ShopStock, for every shop tile
+        self.transports = {}   # (x, y) -> Transport, for every transport tile
+
+        self.entities = {}     # id -> Entity
+        self.occupant = {}     # (x, y) -> id of the entity there
+
+        # Spatial index of the entities and trees/rocks in each chunk, (cx, cy) -> ids/positions
+        self.chunk_entities = {}
+        self.chunk_nodes = {}
+
+        # Chunks where something changed since the server last took them (see `take_changes`)
+        self.dirty_chunks = set()
+
+        # NPCs are entities rather than static tiles, as they move. They're added once the grid of tiles is built
+        npcs = []
+
+        assert len(loaded_map['map']) == self.map_rows
+
+        for y, row in enumerate(loaded_map['map']):
+
+            assert len(row) == self.map_cols
+
+            row_of_tiles = []
+
+            for x, code in enumerate(row):
+
+                tile_type = None
+
+                if code:
+
+                    parsed_code = code.split(':')
+                    tile_type = code_to_feature[parsed_code[0]]
+
+                    if issubclass(tile_type, TransportTile):
+                        self.transports[(x, y)] = Transport(
+                            destination=parsed_code[1],
+                            destination_x=parsed_code[2], destination_y=parsed_code[3],
+                            requirements=parsed_code[4] if len(parsed_code) == 5 else None
+                        )
+
+                    elif issubclass(tile_type, Interactable):
+                        self.nodes[(x, y)] = ResourceNode(tile_type, chance)
+                        self.chunk_nodes.setdefault(self.chunk_of(x, y), []).append((x, y))
+
+                    elif issubclass(tile_type, ShopTile):
+                        self.shops[(x, y)] = tile_type.new_stock()
+
+                    elif issubclass(tile_type, NPC):
+                        npcs.append(Entity(new_id(), NPC_KIND, tile_type, x, y))
+                        tile_type = None
+
+                row_of_tiles.append(tile_type)
+
+            self.tiles.append(row_of_tiles)
+
+        for npc in npcs:
+            self.add_entity(npc)
+
+        # Loading the map isn't a change - players joining are sent everything they can see
+        self.dirty_chunks = set()
+        for stock in self.shops.values():
+            stock.dirty_indexes.clear()
+
+    def in_bounds(self, x, y):
+
+        return 0 <= x < self.map_cols and 0 <= y < self.map_rows
+
+    def is_empty(self, x, y):
+        # Can a player or NPC move onto the tile (like the game's `EmptyTile`)
+
+        return self.in_bounds(x, y) and self.tiles[y][x] is None and (x, y) not in self.occupant
+
+    def is_adjacent(self, entity, x, y):
+        # Is the entity within one tile (up, down, left or right) of (x, y) - needed to interact with it
+
+        return abs(entity.x - x) + abs(entity.y - y) == 1
+
+    def chunk_of(self, x, y):
+
+        return x // chunk_size, y // chunk_size
+
+    def chunks_around(self, x, y, margin=interest_margin):
+        # Chunks a player at (x, y) is interested in: those overlapping their window, plus `margin` tiles either side
+
+        col_range, row_range = window_range(
+            x, y,
+            min(self.window_cols + 2 * margin, self.map_cols), min(self.window_rows + 2 * margin, self.map_rows),
+            self.map_cols, self.map_rows
+        )
+
+        return set(
+            (cx, cy)
+            for cy in range(row_range[0] // chunk_size, row_range[-1] // chunk_size + 1)
+            for cx in range(col_range[0] // chunk_size, col_range[-1] // chunk_size + 1)
+        )
+
+    def mark_dirty(self, x, y):
+
+        self.dirty_chunks.add(self.chunk_of(x, y))
+
+    def add_entity(self, entity):
+
+        assert self.is_empty(entity.x, entity.y)
+
+        self.mark_dirty(entity.x, entity.y)
+
+        self.entities[entity.id] = entity
+        self.occupant[(entity.x, entity.y)] = entity.id
+        self.chunk_entities.setdefault(self.chunk_of(entity.x, entity.y), set()).add(entity.id)
+
+    def remove_entity(self, entity_id):
+
+        entity = self.entities.pop(entity_id)
+
+        self.mark_dirty(entity.x, entity.y)
+
+        del self.occupant[(entity.x, entity.y)]
+        self.chunk_entities[self.chunk_of(entity.x, entity.y)].discard(entity_id)
+
+        return entity
+
+    def move_entity(self, entity, x, y):
+
+        assert self.is_empty(x, y)
+
+        self.mark_dirty(entity.x, entity.y)
+        self.mark_dirty(x, y)
+
+        del self.occupant[(entity.x, entity.y)]
+        self.chunk_entities[self.chunk_of(entity.x, entity.y)].discard(entity.id)
+
+        entity.x, entity.y = x, y
+
+        self.occupant[(x, y)] = entity.id
+        self.chunk_entities.setdefault(self.chunk_of(x, y), set()).add(entity.id)
+
+    def npc_move(self, npc):
+        # Move the NPC like the game's `Map.npc_move`: pick randomly between not moving, and moving onto an empty tile
+        # next to it that's within its maximum radius of where it started
+
+        move_options = [(npc.x, npc.y)]
+
+        for dx, dy in directions.values():
+            x, y = npc.x + dx, npc.y + dy
+            if self.is_empty(x, y) and abs(x - npc.initial_x) <= npc.tile_type.maximum_radius \
+                    and abs(y - npc.initial_y) <= npc.tile_type.maximum_radius:
+                move_options.append((x, y))
+
+        x, y = self.chance.choice(move_options)
+
+        if (x, y) != (npc.x, npc.y):
+            self.move_entity(npc, x, y)
+
+    def can_light_fire(self, player):
+        # Like the game, a fire is lit where the player stands, and the player steps to the right
+
+        return self.can_light_fires_on_map and self.is_empty(player.x + 1, player.y)
+
+    def light_fire(self, player, ticks_for_fire_to_disappear, new_id):
+
+        assert self.can_light_fire(player)
+
+        x, y = player.x, player.y
+        self.move_entity(player, x + 1, y)
+
+        fire = Entity(new_id(), FIRE, Fire, x, y)
+        fire.ticks_left = ticks_for_fire_to_disappear
+        self.add_entity(fire)
+
+    def tick(self):
+        # One game tick: trees/rocks regenerate, NPCs move and fires burn down
+
+        for (x, y), node in self.nodes.items():
+            if node.regenerate():
+                self.mark_dirty(x, y)
+
+        for entity in list(self.entities.values()):
+
+            if entity.kind == NPC_KIND:
+                self.npc_move(entity)
+
+            elif entity.kind == FIRE:
+                entity.ticks_left -= 1
+                if entity.ticks_left == 0:
+                    self.remove_entity(entity.id)
+
+        for (x, y), stock in self.shops.items():
+            stock.tick()
+
+    def take_changes(self):
+        # Return and clear the chunks where something changed since last called: an entity appeared, moved or left
+        # (a fire went out, a player moved to another map or disconnected), a tree/rock depleted or regenerated, or
+        # a shop's stock changed
+        # Players who can't see any of them have nothing new to be sent
+
+        for (x, y), stock in self.shops.items():
+            if stock.dirty_indexes:
+                self.mark_dirty(x, y)
+                stock.dirty_indexes.clear()
+
+        dirty_chunks = self.dirty_chunks
+        self.dirty_chunks = set()
+
+        return dirty_chunks
+
+    def entities_in(self, chunks):
+
+        for chunk in chunks:
+            for entity_id in self.chunk_entities.get(chunk, ()):
+                yield self.entities[entity_id]
+
+    def depleted_in(self, chunks):
+        # Positions of the depleted trees/rocks in the chunks
+
+        return frozenset(
+            (x, y) for chunk in chunks for x, y in self.chunk_nodes.get(chunk, ()) if self.nodes[(x, y)].health == 0
+        )
+
+    def shop_state(self, x, y):
+        # The stock of the shop at (x, y) that's for sale, index -> (item type, quantity, buy price)
+
+        stock = self.shops[(x, y)]
+
+        return {
+            index: (stock.item_types[index], stock.quantity(index), stock.buy_price(index))
+            for index in sorted(stock.type_to_index.values()) if stock.quantity(index) > 0
+        }
+
+
+class PlayerState:
+    # A player's own state: where they are, their inventory, gold and skills
+    # The inventory is a list of 28 slots (like the game's 7 x 4 grid), each an item or None
+
+    def __init__(self, player_id, name, map_name):
+
+        self.id = player_id
+        self.name = name
+        self.map_name = map_name
+
+        # A fresh player starts like the game: a copper axe, a copper pickaxe, a tinderbox, a knife and 100 gold
+        self.inventory = [CopperAxe(), CopperPickaxe(), Tinderbox(), Knife()] + [None] * (inventory_size - 4)
+        self.gold = 100
+        self.experience = {skill_type.title: 1 for skill_type in skill_types}
+
+        # Set when the inventory, gold or xp change, so the server knows the player has new state to be sent
+        self.dirty = True
+
+        # Status messages for the player from their actions (e.g. "You missed!"), until the server sends them
+        self.messages = []
+
+    def record(self):
+        # Everything about the player that outlives where they are on a map, as plain data (item titles for the
+        # inventory), to hand them to another process
+
+        return {
+            'id': self.id,
+            'name': self.name,
+            'inventory': [None if item is None else item.title for item in self.inventory],
+            'gold': self.gold,
+            'experience': dict(self.experience)
+        }
+
+    def level(self, skill_type):
+
+        return level_for_experience(self.experience[skill_type.title])
+
+    def meets_requirements(self, skill_requirements):
+
+        return all(
+            level_for_experience(self.experience[title]) >= level for title, level in skill_requirements.items()
+        )
+
+    def space_for(self):
+
+        return self.inventory.count(None)
+
+    def add_items(self, items):
+
+        assert len(items) <= self.space_for()
+
+        for item in items:
+            self.inventory[self.inventory.index(None)] = item
+
+        self.dirty = True
+
+    def remove_items(self, amount, item_type):
+        # Remove (up to) `amount` items of the type, returning the items removed
+
+        removed = []
+
+        for i in range(inventory_size):
+            if len(removed) < amount and type(self.inventory[i]) == item_type:
+                removed.append(self.inventory[i])
+                self.inventory[i] = None
+
+        if removed:
+            self.dirty = True
+
+        return removed
+
+    def count(self, item_type):
+
+        return sum(1 for item in self.inventory if type(item) == item_type)
+
+    def add_experience(self, skill_type, xp):
+
+        self.experience[skill_type.title] += xp
+        self.dirty = True
+
+    def get_tool(self, tool_base_type):
+        # Best tool of the type (e.g. Axe) in the inventory that we have the skill level to use, or None
+
+        tools = [
+            item for item in self.inventory
+            if isinstance(item, tool_base_type)
+            and self.level(tool_type_to_skill_type[type(item)]) >= item.skill_level_required
+        ]
+
+        return max(tools, key=lambda tool: tool.strength) if tools else None
+
+
+def player_from_record(record, map_name):
+    # The player a record (see `PlayerState.record`) was made from, arriving on a map
+
+    player = PlayerState(record['id'], record['name'], map_name)
+    player.inventory = [None if title is None else title_to_item_type[title]() for title in record['inventory']]
+    player.gold = record['gold']
+    player.experience = dict(record['experience'])
+
+    return player
+
+
+class GatherAction(Action):
+    # The world's version of the game's gathering action: one attempt per tick at the tree/rock at (x, y),
+    # until it depletes, the inventory fills up, or the player can't gather from it
+
+    def __init__(self, world, player, x, y):
+
+        self.world = world
+        self.player = player
+        self.x, self.y = x, y
+
+    def step(self):
+
+        outcome = self.world.gather(self.player, self.x, self.y)
+
+        if outcome['message']:
+            self.player.messages.append(outcome['message'])
+
+        return outcome
+
+
+class World:
+    # Every map (or the ones in `map_names`), every player on them, and the bank shared between all of them
+
+    def __init__(self, path_to_maps='maps', map_names=None, first_id=1, id_step=1):
+
+        # Ids for entities, unique across every map so players keep their id when they move between maps
+        # Worlds in different processes count in steps from different first ids, so their ids never collide
+        self.next_id = first_id
+        self.id_step = id_step
+
+        self.chance = Chance()
+
+        self.maps = {}
+        for file_name in sorted(os.listdir(path_to_maps)):
+            map_name = file_name.replace('.json', '')
+            if file_name.endswith('.json') and (map_names is None or map_name in map_names):
+                with open(os.path.join(path_to_maps, file_name)) as f:
+                    self.maps[map_name] = WorldMap(map_name, json.load(f), self.new_id, self.chance)
+
+        self.players = {}
+
+        # Players who transported to a map that isn't in this world, as (player, x, y) (their `map_name` is the map
+        # they're going to), until the server hands them off (see `take_departures`)
+        self.departures = []
+
+        self.bank_storage = BankStorage(limit=100)
+        self.bank_dirty = False
+
+        self.ticks = 0
+
+    def new_id(self):
+
+        entity_id = self.next_id
+        self.next_id += self.id_step
+        return entity_id
+
+    def entity(self, player):
+
+        return self.maps[player.map_name].entities[player.id]
+
+    def place_player(self, player, map_name, x, y):
+        # Put the player on a map at (x, y), or the nearest empty tile to it if that's taken
+
+        world_map = self.maps[map_name]
+
+        candidates = sorted(
+            ((cx, cy) for cy in range(world_map.map_rows) for cx in range(world_map.map_cols)),
+            key=lambda position: abs(position[0] - x) + abs(position[1] - y)
+        )
+        x, y = next(position for position in candidates if world_map.is_empty(*position))
+
+        player.map_name = map_name
+        world_map.add_entity(Entity(player.id, PLAYER, None, x, y))
+
+    def add_player(self, name, map_name='surface', x=2, y=2):
+        # A new player joins the world, starting where the game does
+
+        player = PlayerState(self.new_id(), name, map_name)
+        self.join(player, map_name, x, y)
+
+        return player
+
+    def join(self, player, map_name, x, y):
+        # A player, new or from elsewhere, arrives on one of this world's maps
+
+        self.players[player.id] = player
+        self.place_player(player, map_name, x, y)
+
+    def remove_player(self, player):
+
+        self.maps[player.map_name].remove_entity(player.id)
+        del self.players[player.id]
+
+    def move(self, player, direction):
+        # Move the player one tile, if it's empty. Returns if they moved
+
+        entity = self.entity(player)
+        dx, dy = directions[direction]
+
+        world_map = self.maps[player.map_name]
+
+        if not world_map.is_empty(entity.x + dx, entity.y + dy):
+            return False
+
+        world_map.move_entity(entity, entity.x + dx, entity.y + dy)
+        return True
+
+    def transport(self, player, x, y):
+        # Use the transport tile at (x, y). Returns a message if we couldn't
+
+        transport = self.maps[player.map_name].transports[(x, y)]
+
+        if not player.meets_requirements(transport.skill_requirements):
+            return "You don't have the skill requirements to enter here"
+
+        self.maps[player.map_name].remove_entity(player.id)
+
+        if transport.destination in self.maps:
+            self.place_player(player, transport.destination, transport.destination_x, transport.destination_y)
+
+        else:
+            del self.players[player.id]
+            player.map_name = transport.destination
+            self.departures.append((player, transport.destination_x, transport.destination_y))
+
+    def take_departures(self):
+
+        departures = self.departures
+        self.departures = []
+
+        return departures
+
+    def gather(self, player, x, y):
+        # One attempt at gathering from the tree/rock at (x, y), following `Interactable.interact`
+        # Returns an outcome dictionary for the action scheduler
+
+        world_map = self.maps[player.map_name]
+        node = world_map.nodes[(x, y)]
+        tile_type = node.tile_type
+
+        if not world_map.is_adjacent(self.entity(player), x, y):
+            return {'success': False, 'finished': True, 'message': "Player not within one tile to interact"}
+
+        if node.health == 0:
+            return {'success': False, 'finished': True, 'message': "Wait for it to regenerate!"}
+
+        if player.space_for() == 0:
+            return {'success': False, 'finished': True, 'message': "Inventory full - cannot receive more items"}
+
+        tool = player.get_tool(tile_type.tool_type_required)
+
+        if tool is None or tool.strength < tile_type.minimum_tool_required.strength:
+            return {'success': False, 'finished': True, 'message': "No tool available for interaction!"}
+
+        skill_type = tool_type_to_skill_type[type(tool)]
+        probability = success_rate_table.lookup(tile_type.resource_type_yielded, type(tool), player.level(skill_type))
+
+        if not self.chance.succeeds(probability):
+            return {'success': False, 'finished': False, 'message': "You missed!"}
+
+        node.health -= 1
+
+        item = tile_type.resource_type_yielded()
+        player.add_items([item])
+        player.add_experience(skill_type, skill_type.xp_gain_per_generation[type(item)])
+
+        if node.health == 0:
+            node.ticks_left = tile_type.ticks_to_regenerate
+            world_map.mark_dirty(x, y)
+
+        return {'success': True, 'finished': node.health == 0, 'message': ""}
+
+    def use(self, player, tool_type, resource_type):
+        # Use a tool on one resource in the inventory, following the recipe for them (see `recipes.py`)
+        # Returns a message if we couldn't
+
+        recipe = recipe_book.lookup(tool_type, resource_type)
+
+        if recipe is None:
+            return "You can't use a %s on a %s" % (tool_type.title.lower(), resource_type.title.lower())
+
+        if player.count(tool_type) == 0 or player.count(resource_type) == 0:
+            return "You don't have a %s and a %s" % (tool_type.title.lower(), resource_type.title.lower())
+
+        if not player.meets_requirements(recipe.requirements):
+            return "You need level %s %s to %s this %s" % (
+                recipe.level_required, recipe.skill_title, recipe.verb, resource_type.title.lower()
+            )
+
+        skill_type = next(skill_type for skill_type in skill_types if skill_type.title == recipe.skill_title)
+
+        if recipe.lights_fire:
+
+            world_map = self.maps[player.map_name]
+            entity = self.entity(player)
+
+            if not world_map.can_light_fire(entity):
+                return "You cannot light a fire here"
+
+            world_map.light_fire(entity, resource_type.ticks_for_fire_to_disappear, self.new_id)
+
+        player.remove_items(1, resource_type)
+        player.add_experience(skill_type, recipe.xp)
+
+        if recipe.output_type is not None:
+            player.add_items([recipe.output_type()])
+
+    def near(self, player, tile_positions):
+        # The first of the positions the player is next to, or None
+
+        entity = self.entity(player)
+        world_map = self.maps[player.map_name]
+
+        for x, y in tile_positions:
+            if world_map.is_adjacent(entity, x, y):
+                return x, y
+
+    def next_to_bank(self, player):
+
+        world_map = self.maps[player.map_name]
+        entity = self.entity(player)
+
+        for dx, dy in directions.values():
+            x, y = entity.x + dx, entity.y + dy
+            if world_map.in_bounds(x, y) and world_map.tiles[y][x] is BankChestTile:
+                return True
+
+        return False
+
+    def buy(self, player, x, y, item_type, amount):
+        # Buy (up to) `amount` items from the shop at (x, y), as many as we can afford and have space for
+        # Returns a message for the player
+
+        if (x, y) not in self.maps[player.map_name].shops or self.near(player, [(x, y)]) is None:
+            return "You need to be next to the shop"
+
+        stock = self.maps[player.map_name].shops[(x, y)]
+        index = stock.find_item_type_index(item_type)
+
+        if index is None or stock.quantity(index) == 0:
+            return "The shop has no %ss" % item_type.title
+
+        amount = min(amount, stock.quantity(index), player.space_for())
+        amount = stock.affordable_amount(index, player.gold, amount)
+
+        if amount == 0:
+            return "You can't afford or don't have space for any %ss" % item_type.title
+
+        items, cost = stock.buy(amount, item_type)
+        player.gold -= cost
+        player.add_items(items)
+
+        return "Bought %s %s%s for %sg" % (amount, item_type.title, "" if amount == 1 else "s", cost)
+
+    def sell(self, player, x, y, item_type, amount):
+
+        if (x, y) not in self.maps[player.map_name].shops or self.near(player, [(x, y)]) is None:
+            return "You need to be next to the shop"
+
+        stock = self.maps[player.map_name].shops[(x, y)]
+
+        if not stock.space_for(item_type):
+            return "The shop has no space for %ss" % item_type.title
+
+        items = player.remove_items(amount, item_type)
+
+        if not items:
+            return "You have no %ss to sell" % item_type.title
+
+        gold_made = stock.sell(items)
+        player.gold += gold_made
+
+        return "Sold %s %s%s for %sg" % (len(items), item_type.title, "" if len(items) == 1 else "s", gold_made)
+
+    def deposit(self, player, item_type, amount):
+
+        if not self.next_to_bank(player):
+            return "You need to be next to a bank chest"
+
+        if not self.bank_storage.space_for(item_type):
+            return "No space in the bank for %ss" % item_type.title
+
+        items = player.remove_items(amount, item_type)
+
+        if not items:
+            return "You have no %ss to deposit" % item_type.title
+
+        self.bank_storage.deposit(items)
+        self.bank_dirty = True
+
+    def withdraw(self, player, item_type, amount):
+
+        if not self.next_to_bank(player):
+            return "You need to be next to a bank chest"
+
+        index = self.bank_storage.find_item_type_index(item_type)
+
+        if index is None:
+            return "No %ss in the bank" % item_type.title
+
+        amount = min(amount, self.bank_storage.quantity(index), player.space_for())
+
+        if amount == 0:
+            return "Inventory full"
+
+        items, changed = self.bank_storage.withdraw(amount, item_type)
+        player.add_items(items)
+        self.bank_dirty = True
+
+    def bank_state(self):
+
+        return [
+            [index, self.bank_storage.item_types[index].title, self.bank_storage.quantity(index)]
+            for index in range(self.bank_storage.limit) if self.bank_storage.item_types[index] is not None
+        ]
+
+    def tick(self):
+        # One game tick of every map
+
+        self.ticks += 1
+
+        for world_map in self.maps.values():
+            world_map.tick()